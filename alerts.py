@@ -0,0 +1,523 @@
+import asyncio, json, logging, os, time, websockets
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from typing import Dict, List
+from config import ALERTS_FILE, ALERTS_MAX_PER_CHAT, ALERT_SEND_RATE
+from indicator_state import IndicatorState
+from liquidation import WS_URL
+from market_data import INTERVAL_MAP, cached_fetch, fetch_bybit
+from metrics import CACHE_EVENTS, error
+from scheduler import priority
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no cross-process locking on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TF_BY_TOPIC = {v: k for k, v in INTERVAL_MAP.items()}
+PRICE_TF = "1m"   # every symbol with price alerts follows its 1m kline
+INF = float("inf")
+LEADER_RETRY = 10   # seconds between attempts to take over the stream from another worker
+
+class ThresholdIndex:
+    # Thresholds of one feed (a symbol's price, or its RSI on one timeframe) in
+    # two sorted lists of (level, alert id): `up` fires when the value rises to
+    # the level, `down` when it falls to it. A move from v0 to v1 fires one
+    # contiguous slice, found with two bisections.
+
+    def __init__(self):
+        self.up, self.down = [], []
+
+    def __len__(self):
+        return len(self.up) + len(self.down)
+
+    def add(self, level: float, aid: int, rising: bool):
+        insort(self.up if rising else self.down, (level, aid))
+
+    def remove(self, level: float, aid: int, rising: bool):
+        side = self.up if rising else self.down
+        i = bisect_left(side, (level, aid))
+        if i < len(side) and side[i] == (level, aid):
+            del side[i]
+
+    def crossed(self, v0: float, v1: float) -> List[int]:
+        if v1 > v0:
+            i, j = bisect_right(self.up, (v0, INF)), bisect_right(self.up, (v1, INF))
+            fired, self.up[i:j] = self.up[i:j], []
+        elif v1 < v0:
+            i, j = bisect_left(self.down, (v1, -1)), bisect_left(self.down, (v0, -1))
+            fired, self.down[i:j] = self.down[i:j], []
+        else:
+            return []
+        return [aid for _, aid in fired]
+
+class AlertBook:
+    # kinds: "price" (level, rising), "rsi" (tf, low, high), "st" (tf)
+    def __init__(self):
+        self.alerts: Dict[int, dict] = {}
+        self.by_chat = defaultdict(set)
+        self.index = defaultdict(ThresholdIndex)    # (symbol, "price") or (symbol, "rsi", tf)
+        self.flips = defaultdict(set)               # (symbol, "st", tf) -> SuperTrend alert ids
+        self.last = {}                              # feed key -> last value (price, rsi or st dir)
+        self.next_id = 1
+        self.ops = []                               # changes made here, not yet in the journal
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def add(self, chat_id: int, symbol: str, kind: str, ref: float = None, **fields) -> dict:
+        if len(self.by_chat[chat_id]) >= ALERTS_MAX_PER_CHAT:
+            raise ValueError(f"Limite de {ALERTS_MAX_PER_CHAT} alertas por chat atingido.")
+        if kind not in ("price", "rsi", "st"):
+            raise ValueError(f"tipo de alerta desconhecido: {kind}")
+        alert = {"id": self.next_id, "chat_id": chat_id, "symbol": symbol, "kind": kind, "created": time.time(), **fields}
+        self.next_id += 1
+        if kind == "price" and ref is not None:
+            alert["ref"] = ref
+            alert.setdefault("rising", alert["level"] > ref)
+        self._insert(alert)
+        self.ops.append({"add": alert})
+        return alert
+
+    def _insert(self, alert: dict):
+        symbol, kind = alert["symbol"], alert["kind"]
+        if kind == "price":
+            if alert.get("ref") is not None:
+                self.last.setdefault((symbol, "price"), alert["ref"])
+            self.index[(symbol, "price")].add(alert["level"], alert["id"], alert["rising"])
+        elif kind == "rsi":
+            idx = self.index[(symbol, "rsi", alert["tf"])]
+            idx.add(alert["high"], alert["id"], True)
+            idx.add(alert["low"], alert["id"], False)
+        else:
+            self.flips[(symbol, "st", alert["tf"])].add(alert["id"])
+        self.alerts[alert["id"]] = alert
+        self.by_chat[alert["chat_id"]].add(alert["id"])
+
+    def remove(self, aid: int, log: bool = True):
+        alert = self.alerts.pop(aid, None)
+        if alert is None:
+            return None
+        sym = alert["symbol"]
+        if alert["kind"] == "price":
+            self._discard(self.index, (sym, "price"), lambda idx: idx.remove(alert["level"], aid, alert["rising"]))
+        elif alert["kind"] == "rsi":
+            key = (sym, "rsi", alert["tf"])
+            self._discard(self.index, key, lambda idx: (idx.remove(alert["high"], aid, True), idx.remove(alert["low"], aid, False)))
+        else:
+            self._discard(self.flips, (sym, "st", alert["tf"]), lambda ids: ids.discard(aid))
+        chat = self.by_chat.get(alert["chat_id"])
+        if chat is not None:
+            chat.discard(aid)
+            if not chat:
+                del self.by_chat[alert["chat_id"]]
+        if log:
+            self.ops.append({"del": aid})
+        return alert
+
+    def _discard(self, table, key, drop):
+        entry = table.get(key)
+        if entry is not None:
+            drop(entry)
+            if not len(entry):
+                del table[key]
+                self.last.pop(key, None)
+
+    def for_chat(self, chat_id: int) -> List[dict]:
+        return sorted((self.alerts[i] for i in self.by_chat.get(chat_id, ())), key=lambda a: a["id"])
+
+    def feeds(self):
+        # (symbol, tf) pairs that need a kline subscription
+        return {(key[0], PRICE_TF) for key in self.index if key[1] == "price"} | self.indicator_feeds()
+
+    def indicator_feeds(self):
+        return {(key[0], key[2]) for key in self.index if key[1] == "rsi"} | {(key[0], key[2]) for key in self.flips}
+
+    def _cross(self, key, value: float) -> List[dict]:
+        prev = self.last.get(key)
+        self.last[key] = value
+        idx = self.index.get(key)
+        if prev is None or idx is None:
+            return []
+        fired = [self.alerts[aid] for aid in idx.crossed(prev, value) if aid in self.alerts]
+        return [dict(self.remove(a["id"]), value=value) for a in fired]
+
+    def on_price(self, symbol: str, price: float) -> List[dict]:
+        return self._cross((symbol, "price"), price)
+
+    def on_indicators(self, symbol: str, tf: str, summary: dict) -> List[dict]:
+        extras = summary["extras"]
+        fired = self._cross((symbol, "rsi", tf), extras["rsi9"])
+        direction = extras["supertrend_10_3"]["dir"]
+        key = (symbol, "st", tf)
+        prev = self.last.get(key)
+        self.last[key] = direction
+        if prev is not None and prev != direction and key in self.flips:
+            for aid in list(self.flips[key]):
+                fired.append(dict(self.remove(aid), value=direction))
+        return fired
+
+    # --------- persistence (see AlertJournal) ---------
+    def apply(self, records, reset: bool = False):
+        # records read from the journal. Stored alerts skip add(): a lowered
+        # ALERTS_MAX_PER_CHAT must not drop them.
+        if reset:
+            self._clear()
+        for rec in records:
+            if "alerts" in rec:
+                reset = True
+                self._clear()
+                for a in rec["alerts"]:
+                    self._insert(dict(a))
+                self.next_id = max([self.next_id, rec.get("next_id", 1)] + [aid + 1 for aid in self.alerts])
+            elif "add" in rec:
+                a = rec["add"]
+                if a["id"] not in self.alerts:
+                    self._insert(dict(a))
+                self.next_id = max(self.next_id, a["id"] + 1)
+            elif "del" in rec:
+                self.remove(rec["del"], log=False)
+        if reset:
+            self.last = {k: v for k, v in self.last.items() if k in self.index or k in self.flips}
+            for op in self.ops:   # fired here but not journaled yet
+                if "del" in op:
+                    self.remove(op["del"], log=False)
+
+    def _clear(self):
+        for table in (self.alerts, self.by_chat, self.index, self.flips):
+            table.clear()
+
+    def rollback(self, mark: int):
+        # undo the additions recorded after ops[mark] (a change that raised halfway)
+        for op in reversed(self.ops[mark:]):
+            if "add" in op:
+                self.remove(op["add"]["id"], log=False)
+        del self.ops[mark:]
+
+    def snapshot(self) -> dict:
+        return {"next_id": self.next_id, "alerts": list(self.alerts.values())}
+
+class AlertJournal:
+    # The alerts file as JSON lines: {"add": alert}, {"del": id} or a snapshot
+    # {"next_id": n, "alerts": [...]} (the old single-object file is one). Each
+    # worker appends its changes under an flock and reads only the lines added
+    # since its last offset; once most lines are dead the file is rewritten as
+    # one snapshot (a new inode, which makes readers start over). Blocking
+    # calls: run them in a thread.
+    COMPACT_MIN = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = 0
+        self.inode = None
+        self.lines = 0
+        self._lock = None
+
+    def changed(self) -> bool:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return self.inode is not None
+        return st.st_ino != self.inode or st.st_size != self.offset
+
+    def lock(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fh = open(f"{self.path}.lock", "a")
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        self._lock = fh
+
+    def unlock(self):
+        fh, self._lock = self._lock, None
+        if fh is not None:
+            fh.close()   # closing drops the flock
+
+    def read(self):
+        # -> (reset, records); reset: the file was replaced, records start from scratch
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            reset = self.inode is not None
+            self.inode, self.offset, self.lines = None, 0, 0
+            return reset, []
+        reset = self.inode is not None and (st.st_ino != self.inode or st.st_size < self.offset)
+        if reset or self.inode is None:
+            self.inode, self.offset, self.lines = st.st_ino, 0, 0
+        if st.st_size == self.offset:
+            return reset, []
+        with open(self.path, "rb") as fh:
+            fh.seek(self.offset)
+            data = fh.read()
+        records = [json.loads(line) for line in data.splitlines() if line.strip()]
+        self.offset += len(data)
+        self.lines += len(records)
+        return reset, records
+
+    def append(self, records):
+        # caller holds the lock and has read() up to the end
+        if not records:
+            return
+        data = b"".join(json.dumps(r).encode() + b"\n" for r in records)
+        with open(self.path, "a+b") as fh:
+            end = fh.seek(0, os.SEEK_END)
+            if end:
+                fh.seek(end - 1)
+                if fh.read(1) != b"\n":   # the old single-object file
+                    data = b"\n" + data
+            fh.write(data)
+            self.offset = fh.tell()
+        self.inode = os.stat(self.path).st_ino
+        self.lines += len(records)
+
+    def compact(self, snapshot: dict):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(json.dumps(snapshot).encode() + b"\n")
+        os.replace(tmp, self.path)
+        st = os.stat(self.path)
+        self.inode, self.offset, self.lines = st.st_ino, st.st_size, 1
+
+def describe(alert: dict) -> str:
+    sym, kind = alert["symbol"], alert["kind"]
+    if kind == "price":
+        return f"#{alert['id']} {sym} {'↑' if alert['rising'] else '↓'} {alert['level']:g}"
+    if kind == "rsi":
+        return f"#{alert['id']} {sym} [{alert['tf']}] RSI(9) fora de {alert['low']:g}–{alert['high']:g}"
+    return f"#{alert['id']} {sym} [{alert['tf']}] virada do SuperTrend"
+
+def alert_text(alert: dict) -> str:
+    sym, kind, value = alert["symbol"], alert["kind"], alert["value"]
+    if kind == "price":
+        way = "para cima" if alert["rising"] else "para baixo"
+        return f"🔔 *{sym}* cruzou {alert['level']:g} {way} · preço {value:g}"
+    if kind == "rsi":
+        return f"🔔 *{sym}* [{alert['tf']}] RSI(9) {value:.1f} saiu da faixa {alert['low']:g}–{alert['high']:g}"
+    return f"🔔 *{sym}* [{alert['tf']}] SuperTrend virou {value}"
+
+class KlineStream:
+    # Bybit kline.<iv>.<SYM> topics for every feed the alert book needs; each
+    # update moves the price index and, for indicator feeds, an IndicatorState.
+    # With several workers only the one holding {path}.leader streams (and
+    # notifies); the others edit the shared journal and wait to take over.
+
+    def __init__(self, book: AlertBook, url: str = WS_URL, path: str = ALERTS_FILE):
+        self.book = book
+        self.url = url
+        self.path = path
+        self.journal = AlertJournal(path) if path else None
+        self.notify = None                      # async (chat_id, text) -> None
+        self.states: Dict[tuple, IndicatorState] = {}
+        self.subscribed = set()
+        self._seeding = {}
+        self._ws = None
+        self._tasks = []
+        self._outbox = None
+        self._leader = None
+        self._election = None
+        self._editing = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not self._tasks[0].done()
+
+    async def start(self):
+        if self.running or self._election is not None:
+            return
+        if self._lead():
+            await self._start_stream()
+        else:
+            self._election = asyncio.create_task(self._elect())
+
+    def _lead(self) -> bool:
+        if fcntl is None or not self.path:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fh = open(f"{self.path}.leader", "a")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        self._leader = fh   # held until stop() or process exit
+        return True
+
+    async def _elect(self):
+        while not self._lead():
+            await asyncio.sleep(LEADER_RETRY)
+        self._election = None
+        await self._start_stream()
+
+    async def _start_stream(self):
+        logger.info("alert stream running in worker %s", os.getpid())
+        self._outbox = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._sender()),
+                       asyncio.create_task(self._persist())]
+        await self.edit()
+
+    async def stop(self):
+        tasks = self._tasks + ([self._election] if self._election is not None else [])
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks, self._election = [], None
+        if self.book.ops:
+            await self.edit()
+        if self._leader is not None:
+            self._leader.close()   # releases the lock for another worker
+            self._leader = None
+
+    async def edit(self, change=None):
+        # Catches up with the journal, applies change(book) and journals what it
+        # (and anything fired here) changed, under the file lock. Only file I/O
+        # runs in a thread; the book is only touched on the event loop.
+        if self.journal is None:
+            result = change(self.book) if change else None
+            self.book.ops.clear()
+            self.refresh()
+            return result
+        async with self._editing:
+            await asyncio.to_thread(self.journal.lock)
+            try:
+                reset, records = await asyncio.to_thread(self.journal.read)
+                self.book.apply(records, reset)
+                mark = len(self.book.ops)
+                try:
+                    result = change(self.book) if change else None
+                except Exception:
+                    self.book.rollback(mark)
+                    raise
+                ops, self.book.ops = self.book.ops, []
+                try:
+                    await asyncio.to_thread(self.journal.append, ops)
+                except BaseException:
+                    self.book.ops = ops + self.book.ops   # retried by the next edit
+                    raise
+                if self.journal.lines > max(AlertJournal.COMPACT_MIN, 2 * len(self.book)):
+                    await asyncio.to_thread(self.journal.compact, self.book.snapshot())
+            finally:
+                await asyncio.to_thread(self.journal.unlock)
+        self.refresh()
+        return result
+
+    def refresh(self):
+        # call after adding or removing alerts
+        if not self.running:
+            return
+        wanted = self.book.feeds()
+        for key in self.book.indicator_feeds():
+            if key not in self.states and key not in self._seeding:
+                self._seeding[key] = asyncio.ensure_future(self._seed(*key))
+        for key in set(self.states) - self.book.indicator_feeds():
+            del self.states[key]
+        if self._ws is None:
+            return
+        new, old = wanted - self.subscribed, self.subscribed - wanted
+        self.subscribed = set(wanted)
+        if new:
+            asyncio.ensure_future(self._send("subscribe", sorted(new)))
+        if old:
+            asyncio.ensure_future(self._send("unsubscribe", sorted(old)))
+
+    async def _seed(self, symbol: str, tf: str):
+        try:
+            with priority("alerts"):
+                candles = await cached_fetch(fetch_bybit, "bybit", symbol, tf, 300)
+            if (symbol, tf) in self.book.indicator_feeds():
+                state = IndicatorState.from_frame(candles, include=("rsi", "supertrend"))
+                self.states[(symbol, tf)] = state
+                self._emit(self.book.on_indicators(symbol, tf, state.summary()))
+        except Exception as e:
+            error("alerts_seed", e, symbol=symbol, tf=tf)
+            logger.warning("alert seed %s %s failed: %r", symbol, tf, e)
+        finally:
+            self._seeding.pop((symbol, tf), None)
+
+    async def _send(self, op: str, feeds):
+        ws = self._ws
+        args = [f"kline.{INTERVAL_MAP[tf]}.{sym}" for sym, tf in feeds]
+        try:
+            for i in range(0, len(args), 10):
+                await ws.send(json.dumps({"op": op, "args": args[i:i+10]}))
+        except Exception as e:
+            logger.warning("kline %s failed: %r", op, e)
+
+    def handle(self, data: dict):
+        topic = data.get("topic", "")
+        if not topic.startswith("kline."):
+            return
+        _, iv, sym = topic.split(".", 2)
+        tf = TF_BY_TOPIC.get(iv)
+        for row in data.get("data", []):
+            close = float(row["close"])
+            fired = self.book.on_price(sym, close)
+            state = self.states.get((sym, tf))
+            if state is not None:
+                try:
+                    summary = state.update(int(row["start"]) * 10**6, row["high"], row["low"], close, row["volume"])
+                except ValueError:
+                    continue   # kline older than the seeded history
+                fired += self.book.on_indicators(sym, tf, summary)
+            self._emit(fired)
+
+    def _emit(self, fired: List[dict]):
+        if fired:
+            CACHE_EVENTS.inc(len(fired), cache="alerts", result="fired")
+            for alert in fired:
+                self._outbox.put_nowait(alert)
+            self.refresh()
+
+    async def _sender(self):
+        while True:
+            alert = await self._outbox.get()
+            if self.notify is None:
+                continue
+            try:
+                await self.notify(alert["chat_id"], alert_text(alert))
+            except Exception as e:
+                error("alerts_send", e)
+                logger.warning("alert #%s delivery failed: %r", alert["id"], e)
+            await asyncio.sleep(1 / ALERT_SEND_RATE)
+
+    async def _persist(self):
+        # journals fired alerts and picks up the ones other workers added or removed
+        while True:
+            await asyncio.sleep(5)
+            if self.journal is not None and (self.book.ops or self.journal.changed()):
+                try:
+                    await self.edit()
+                except (OSError, ValueError) as e:
+                    logger.warning("syncing alerts failed: %r", e)
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=20) as ws:
+                    self._ws = ws
+                    self.subscribed = self.book.feeds()
+                    if self.subscribed:
+                        await self._send("subscribe", sorted(self.subscribed))
+                    # bars may have been missed while disconnected: reseed the indicators
+                    self.states.clear()
+                    self.refresh()
+                    backoff = 1.0
+                    async for msg in ws:
+                        self.handle(json.loads(msg))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("kline stream disconnected: %r (retry in %.0fs)", e, backoff)
+            finally:
+                self._ws = None
+                self.subscribed = set()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+alert_book = AlertBook()
+alert_stream = KlineStream(alert_book)
@@ -0,0 +1,120 @@
+import asyncio, hashlib
+from config import API_MAX_SYMBOLS, SCAN_CONCURRENCY
+from indicators import EXTRAS
+from market_data import INTERVAL_MS, cached_version
+from signals import suggest_signal
+from sweeps import parse_on as parse_indicators, params_key, extras_key
+
+try:
+    import orjson
+    _json = lambda obj: orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+except ImportError:  # pragma: no cover - orjson is optional
+    import json
+    _json = lambda obj: json.dumps(obj, default=_plain).encode()
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; such clients get JSON
+    msgpack = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+def _plain(obj):
+    # numpy scalars/arrays for the non-orjson encoders
+    return obj.tolist() if hasattr(obj, "tolist") else str(obj)
+
+def negotiate(accept: str) -> str:
+    accept = (accept or "").lower()
+    if msgpack is not None and any(t in accept for t in MSGPACK_TYPES):
+        return "application/msgpack"
+    return "application/json"
+
+def encode(obj, media_type: str) -> bytes:
+    if media_type == "application/msgpack":
+        return msgpack.packb(obj, default=_plain, use_bin_type=True)
+    return _json(obj)
+
+def etag(symbols, tf: str, fields, on, media_type: str):
+    # Built from the version of the cached candles behind each symbol (see
+    # market_data.cached_version), so it changes exactly when they do and is
+    # computed without fetching anything. None while some symbol has no fresh
+    # candles: that request fetches anyway.
+    versions = [cached_version(s, tf) for s in symbols]
+    if None in versions:
+        return None
+    key = "|".join([",".join(symbols), tf, ",".join(fields or ()), ",".join(sorted(on)), media_type, repr(versions)])
+    return 'W/"' + hashlib.blake2b(key.encode(), digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match: str, tag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {t.strip() for t in if_none_match.split(",")}
+    return "*" in tags or tag in tags or tag[2:] in tags
+
+def select_fields(obj: dict, fields) -> dict:
+    # fields: dotted paths ("summary.ema", "signal.tps"); unknown paths are skipped
+    if not fields:
+        return obj
+    out = {}
+    for path in fields:
+        src, dst = obj, out
+        parts = path.split(".")
+        for i, part in enumerate(parts):
+            if not isinstance(src, dict) or part not in src:
+                break
+            if i == len(parts) - 1:
+                dst[part] = src[part]
+            else:
+                src = src[part]
+                dst = dst.setdefault(part, {})
+    return out
+
+def analysis_payload(symbol: str, tf: str, source: str, res: dict, liq: list) -> dict:
+    return {
+        "symbol": symbol, "tf": tf, "source": source, "time": res.get("time"), "close": res.get("close"),
+        "summary": res["summary"], "fibonacci": res["fibonacci"], "zones": res.get("zones"),
+        "ob_zones": res["ob_zones"], "signal": suggest_signal(res["summary"]), "liquidations": liq,
+    }
+
+def parse_list(value: str):
+    return [x.strip() for x in (value or "").split(",") if x.strip()]
+
+def parse_on(value: str):
+    # None -> every default indicator; "rsi:14,macd:12,26,9,atr" -> names plus
+    # custom parameter sets (sweeps.parse_on); ValueError on bad parameters
+    if value is None:
+        return frozenset(EXTRAS), {}
+    shown, params = parse_indicators(value)
+    return frozenset(shown), params
+
+def on_tokens(on, params) -> list:
+    # canonical form of on= for the ETag
+    return sorted(set(on) | {extras_key(name, p) for name, sets in params.items() for p in sets})
+
+def check_request(symbols, tf: str):
+    if tf not in INTERVAL_MS:
+        raise ValueError(f"Timeframe inválido: {tf}")
+    if not symbols or len(symbols) > API_MAX_SYMBOLS:
+        raise ValueError(f"Informe de 1 a {API_MAX_SYMBOLS} símbolos.")
+
+async def batch_analysis(analyze, symbols, tf: str, fields=None, on=None, params=None) -> dict:
+    # analyze: bot.shared_analysis; one failing symbol lands in "errors"
+    check_request(symbols, tf)
+    params = params or {}
+    need = frozenset(k for k in (on if on is not None else EXTRAS) if k in EXTRAS and k not in params)
+    pkey = params_key(params)
+    sem = asyncio.Semaphore(SCAN_CONCURRENCY)
+
+    async def one(sym):
+        async with sem:
+            source, res, liq = await analyze(sym, tf, need, pkey)
+            return select_fields(analysis_payload(sym, tf, source, res, liq), fields)
+
+    done = await asyncio.gather(*[one(s) for s in symbols], return_exceptions=True)
+    results, errors = {}, {}
+    for sym, r in zip(symbols, done):
+        if isinstance(r, Exception):
+            errors[sym] = str(r)
+        else:
+            results[sym] = r
+    return {"tf": tf, "results": results, "errors": errors}
@@ -1,41 +1,116 @@
 import asyncio
+import logging
+import multiprocessing
 from fastapi import FastAPI, Request, Response, HTTPException
 from telegram import Update
 from telegram.ext import Application
-from config import TELEGRAM_BOT_TOKEN, WEBHOOK_URL, WEBHOOK_SECRET
-from bot import register_handlers, analyze_command
+from config import TELEGRAM_BOT_TOKEN, WEBHOOK_URL, WEBHOOK_SECRET, WEB_CONCURRENCY, SHARED_CACHE_URL
+from bot import register_handlers, analyze_command, scan_command, backtest_command, shared_analysis
+from market_data import open_http_client, close_http_client, open_candle_store, close_candle_store
+from liquidation import liquidation_stream
+from alerts import alert_stream
+from workers import shutdown_pool
+from metrics import render as render_metrics, gauge, CACHE_EVENTS
+from intake import UpdateIntake
+from scheduler import scheduler_stats
+import api
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Telegram SMC Bot")
 
 application = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True).build()
 register_handlers(application)
 
+async def process_update(data: dict):
+    await application.process_update(Update.de_json(data, application.bot))
+
+intake = UpdateIntake(process_update)
+gauge("smc_intake_queue_depth", "Webhook updates waiting for a worker.", lambda: intake.pending)
+gauge("smc_intake_active", "Webhook updates being processed.", lambda: intake.active)
+
 @app.on_event("startup")
 async def on_startup():
+    if WEB_CONCURRENCY == 1 and not SHARED_CACHE_URL and multiprocessing.parent_process() is not None:
+        # uvicorn --workers N without WEB_CONCURRENCY: each worker would think it is alone
+        logger.warning("started as a child worker but WEB_CONCURRENCY=1: run WEB_CONCURRENCY=N uvicorn ... "
+                       "so the workers share the cache and split the memory budget")
+    open_http_client()
+    open_candle_store()
+    await liquidation_stream.start()
+    await alert_stream.start()
     asyncio.create_task(application.initialize())
     await application.start()
+    await intake.start()
     if WEBHOOK_URL:
         await application.bot.set_webhook(url=f"{WEBHOOK_URL}/{WEBHOOK_SECRET}")
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await intake.stop()
     await application.stop()
     await application.shutdown()
+    await liquidation_stream.stop()
+    await alert_stream.stop()
+    await close_http_client()
+    close_candle_store()
+    shutdown_pool()
 
 @app.get("/health")
 async def health():
-    return {"ok": True}
+    return {"ok": True, "intake": intake.stats(), "exchanges": scheduler_stats()}
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.post("/telegram/{secret}")
 async def telegram_webhook(secret: str, request: Request):
     if secret != WEBHOOK_SECRET:
         raise HTTPException(status_code=403, detail="invalid secret")
     data = await request.json()
-    update = Update.de_json(data, application.bot)
-    await application.process_update(update)
+    # acknowledge at once; a 200 also for duplicates/shed updates stops Telegram retrying them
+    intake.submit(data)
     return Response(status_code=200)
 
 @app.get("/analisar")
 async def analisar(symbol: str="BTCUSDT", tf: str="1h"):
     text = await analyze_command(symbol, tf)
     return {"result": text}
+
+@app.get("/api/analysis")
+async def api_analysis(request: Request, symbols: str="BTCUSDT", tf: str="1h", fields: str="", on: str=None):
+    # structured smc_analysis/pack_summary data; see README "API JSON"
+    syms = list(dict.fromkeys(s.upper() for s in api.parse_list(symbols)))
+    field_list = api.parse_list(fields)
+    try:
+        api.check_request(syms, tf)
+        on_names, params = api.parse_on(on)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media = api.negotiate(request.headers.get("accept"))
+    on_list = api.on_tokens(on_names, params)
+    tag = api.etag(syms, tf, field_list, on_list, media)
+    headers = {"Vary": "Accept"}
+    if tag is not None and api.etag_matches(request.headers.get("if-none-match"), tag):
+        CACHE_EVENTS.inc(cache="api", result="not_modified")
+        return Response(status_code=304, headers={"ETag": tag, **headers})
+    data = await api.batch_analysis(shared_analysis, syms, tf, field_list, on_names, params)
+    # tagged with the candles just used; never let a client pin a partial answer
+    tag = None if data["errors"] else api.etag(syms, tf, field_list, on_list, media)
+    if tag is not None:
+        headers["ETag"] = tag
+    return Response(api.encode(data, media), media_type=media, headers=headers)
+
+@app.get("/scan")
+async def scan_route(tf: str="1h", symbols: str=""):
+    try:
+        text, rows = await scan_command(tf, symbols.split(",") if symbols else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"result": text, "rows": rows}
+
+@app.get("/backtest")
+async def backtest_route(symbol: str="BTCUSDT", tf: str="1h", bars: int=5000, tp: int=1, trades: bool=False):
+    text, result = await backtest_command(symbol.upper(), tf, bars, tp)
+    return {"result": text, "stats": result["stats"], "trades": result["trades"] if trades else None}
@@ -0,0 +1,192 @@
+from bisect import bisect_right, insort
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from indicators import _swing_mask
+from signals import suggest_signal
+
+# The live bot analyses the last 500 candles, so every rolling input below is
+# computed over the same trailing window and matches pack_summary on df[t-499:t+1].
+
+# --------- Rolling inputs of the signal (one value per bar) ---------
+def windowed_ema(close: np.ndarray, period: int, window: int) -> np.ndarray:
+    # ewm(adjust=False) restarted at the window start differs from the
+    # full-history EMA by (1-alpha)^(window-1) * (ema[start] - close[start])
+    alpha = 2 / (period + 1)
+    full = pd.Series(close).ewm(span=period, adjust=False).mean().to_numpy()
+    out = np.full(len(close), np.nan)
+    if len(close) >= window:
+        start = np.arange(len(close) - window + 1)
+        out[window-1:] = full[window-1:] - (1 - alpha) ** (window - 1) * (full[start] - close[start])
+    return out
+
+def rolling_levels(high, low, close, window: int, left: int = 3, right: int = 3, min_dist: float = 0.002, keep: int = 3):
+    # support_resistance over each trailing window: pivots enter when confirmed
+    # (right bars later) and leave once they fall within `left` bars of the window start
+    n = len(close)
+    sup = np.full((n, keep), np.nan)
+    res = np.full((n, keep), np.nan)
+    enter, leave = [[] for _ in range(n)], [[] for _ in range(n)]
+    for mask, values in ((_swing_mask(high, left, right, np.fmax), high), (_swing_mask(low, left, right, np.fmin), low)):
+        for i in np.flatnonzero(mask).tolist():
+            lvl = round(values[i], 6)
+            enter[i + right].append(lvl)
+            if i + window - left < n:
+                leave[i + window - left].append(lvl)
+    counts, levels, merged, dirty = {}, [], [], False
+    for t in range(n):
+        for lvl in leave[t]:
+            counts[lvl] -= 1
+            if not counts[lvl]:
+                del counts[lvl]
+                levels.pop(bisect_right(levels, lvl) - 1)
+                dirty = True
+        for lvl in enter[t]:
+            if lvl not in counts:
+                counts[lvl] = 0
+                insort(levels, lvl)
+                dirty = True
+            counts[lvl] += 1
+        if t < window - 1:
+            continue
+        if dirty:
+            # same greedy merge as support_resistance; levels ascend so the abs() is implicit
+            merged = levels[:1]
+            last = merged[0] if merged else None
+            for lvl in levels[1:]:
+                if (lvl - last)/lvl > min_dist:
+                    merged.append(lvl)
+                    last = lvl
+            dirty = False
+        idx = bisect_right(merged, close[t])
+        below = merged[max(0, idx - keep):idx][::-1]
+        above = merged[idx:idx + keep]
+        sup[t, :len(below)] = below
+        res[t, :len(above)] = above
+    return sup, res
+
+def rolling_poc(close: np.ndarray, volume: np.ndarray, window: int, bins: int = 50, chunk: int = 2048) -> np.ndarray:
+    # volume_profile_poc over each trailing window, binned exactly like np.histogram
+    n = len(close)
+    out = np.full(n, np.nan)
+    if n < window:
+        return out
+    wc = sliding_window_view(close, window)
+    wv = sliding_window_view(volume, window)
+    for a in range(0, len(wc), chunk):
+        c, v = wc[a:a+chunk], wv[a:a+chunk]
+        lo, hi = c.min(axis=1), c.max(axis=1)
+        flat = lo == hi
+        lo, hi = np.where(flat, lo - 0.5, lo), np.where(flat, hi + 0.5, hi)
+        edges = np.linspace(lo, hi, bins + 1, axis=1)
+        idx = (((c - lo[:, None]) / (hi - lo)[:, None]) * bins).astype(np.intp)
+        idx[idx == bins] -= 1
+        rows = np.arange(len(c))[:, None]
+        idx[c < edges[rows, idx]] -= 1
+        idx[(c >= edges[rows, idx + 1]) & (idx != bins - 1)] += 1
+        hist = np.bincount((idx + rows * bins).ravel(), weights=v.ravel(), minlength=len(c) * bins).reshape(len(c), bins)
+        best = hist.argmax(axis=1)
+        r = rows[:, 0]
+        out[window - 1 + a:window - 1 + a + len(c)] = (edges[r, best] + edges[r, best + 1]) / 2
+    return out
+
+def signal_inputs(df: pd.DataFrame, window: int = 500) -> dict:
+    high, low = df["high"].to_numpy(dtype=float), df["low"].to_numpy(dtype=float)
+    close, volume = df["close"].to_numpy(dtype=float), df["volume"].to_numpy(dtype=float)
+    sup, res = rolling_levels(high, low, close, window)
+    return {
+        "ema": {str(p): windowed_ema(close, p, window) for p in (9, 21, 80)},
+        "supports": sup, "resistances": res, "poc": rolling_poc(close, volume, window),
+    }
+
+def summary_at(inputs: dict, t: int) -> dict:
+    sup, res = inputs["supports"][t], inputs["resistances"][t]
+    return {
+        "ema": {k: float(v[t]) for k, v in inputs["ema"].items()},
+        "supports": [float(x) for x in sup[~np.isnan(sup)]],
+        "resistances": [float(x) for x in res[~np.isnan(res)]],
+        "poc": float(inputs["poc"][t]),
+    }
+
+# --------- Replay ---------
+def _exit(direction: str, entry: float, sl: float, target: float, o, h, l, c, fill: int, max_hold: int):
+    # returns (bar, price, reason); stop wins when stop and target share a bar
+    end = min(len(c), fill + max_hold + 1)
+    long = direction == "LONG"
+    if (l[fill] <= sl) if long else (h[fill] >= sl):
+        return fill, sl, "sl"
+    if (h[fill] >= target) if long else (l[fill] <= target):
+        return fill, target, "tp"
+    sl_hit = (l[fill+1:end] <= sl) if long else (h[fill+1:end] >= sl)
+    tp_hit = (h[fill+1:end] >= target) if long else (l[fill+1:end] <= target)
+    hit = sl_hit | tp_hit
+    if not hit.any():
+        return end - 1, c[end - 1], "tempo"
+    k = fill + 1 + int(hit.argmax())
+    gap_sl = (o[k] <= sl) if long else (o[k] >= sl)
+    gap_tp = (o[k] >= target) if long else (o[k] <= target)
+    if sl_hit[k - fill - 1]:
+        return k, (o[k] if gap_sl else sl), "sl"
+    return k, (o[k] if gap_tp else target), "tp"
+
+def backtest(df: pd.DataFrame, window: int = 500, tp: int = 1, max_hold: int = 100) -> dict:
+    # Each bar while flat, the current suggested signal is a limit order for the
+    # next bar; once filled the trade runs to SL, the chosen TP or max_hold bars.
+    o, h = df["open"].to_numpy(dtype=float), df["high"].to_numpy(dtype=float)
+    l, c = df["low"].to_numpy(dtype=float), df["close"].to_numpy(dtype=float)
+    inputs = signal_inputs(df, window)
+    trades = []
+    t = window - 1
+    while t < len(c) - 1:
+        sig = suggest_signal(summary_at(inputs, t))
+        entry, sl, direction = sig["entry"], sig["sl"], sig["direction"]
+        long = direction == "LONG"
+        targets = [x for x in sig["tps"] if (x > entry if long else x < entry)]
+        if not targets or not ((sl < entry) if long else (sl > entry)):
+            t += 1
+            continue
+        fill = t + 1
+        if not ((l[fill] <= entry) if long else (h[fill] >= entry)):
+            t += 1
+            continue
+        target = targets[min(tp, len(targets)) - 1]
+        bar, price, reason = _exit(direction, entry, sl, target, o, h, l, c, fill, max_hold)
+        risk = abs(entry - sl)
+        r = ((price - entry) if long else (entry - price)) / risk
+        trades.append({"signal_bar": t, "entry_bar": fill, "exit_bar": bar, "direction": direction,
+                       "bias": sig["bias"], "entry": entry, "sl": sl, "tp": target, "exit": float(price),
+                       "reason": reason, "r": float(r)})
+        t = bar
+    return {"trades": trades, "stats": backtest_stats(trades, len(c) - window + 1)}
+
+def backtest_stats(trades: list, bars: int) -> dict:
+    r = np.array([x["r"] for x in trades])
+    equity = np.cumsum(r)
+    drawdown = float((np.maximum.accumulate(np.concatenate([[0.0], equity])) - np.concatenate([[0.0], equity])).max()) if len(r) else 0.0
+    gains, losses = r[r > 0].sum(), -r[r < 0].sum()
+    return {
+        "bars": bars, "trades": len(r),
+        "hit_rate": float((r > 0).mean()) if len(r) else 0.0,
+        "avg_r": float(r.mean()) if len(r) else 0.0,
+        "total_r": float(r.sum()),
+        "max_drawdown_r": drawdown,
+        "profit_factor": float(gains / losses) if losses else None,
+        "long": sum(x["direction"] == "LONG" for x in trades),
+        "short": sum(x["direction"] == "SHORT" for x in trades),
+        "by_reason": {k: sum(x["reason"] == k for x in trades) for k in ("tp", "sl", "tempo")},
+        "avg_bars": float(np.mean([x["exit_bar"] - x["entry_bar"] + 1 for x in trades])) if trades else 0.0,
+    }
+
+def format_backtest(symbol: str, tf: str, source: str, stats: dict, tp: int) -> str:
+    pf = "-" if stats["profit_factor"] is None else f"{stats['profit_factor']:.2f}"
+    rs = stats["by_reason"]
+    return "\n".join([
+        f"📊 *Backtest do sinal sugerido* — *{symbol}* [{tf}] · fonte: _{source}_",
+        "",
+        f"*Barras avaliadas:* {stats['bars']} · *Trades:* {stats['trades']} (LONG {stats['long']} · SHORT {stats['short']})",
+        f"*Acerto:* {stats['hit_rate'] * 100:.1f}% · *R médio:* {stats['avg_r']:.2f} · *R total:* {stats['total_r']:.1f}",
+        f"*Drawdown máx.:* {stats['max_drawdown_r']:.1f}R · *Profit factor:* {pf}",
+        f"*Saídas:* TP{tp} {rs['tp']} · SL {rs['sl']} · tempo {rs['tempo']} · duração média {stats['avg_bars']:.1f} barras",
+        "",
+        "_Resultado histórico, sem custos nem slippage; não garante desempenho futuro._",
+    ])
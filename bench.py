@@ -0,0 +1,157 @@
+"""Indicator micro-benchmarks on synthetic OHLCV.
+
+    python bench.py                              # run and print
+    python bench.py --save bench_baseline.json   # store a baseline
+    python bench.py --check bench_baseline.json  # exit 1 on regression
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import indicators as ind
+import volume_profile as vp
+import sweeps
+from smc import smc_analysis
+
+SIZES = (500, 5_000, 50_000, 500_000)
+BAR_MS = 3_600_000
+
+def synthetic_ohlcv(n: int, seed: int = 7, start_price: float = 30_000.0) -> pd.DataFrame:
+    # Regime-switching random walk: trending/ranging stretches with their own
+    # drift and volatility, occasional opening gaps and volume spikes.
+    rng = np.random.default_rng(seed)
+    regime_len = rng.integers(50, 400, size=n // 50 + 2)
+    regime = np.repeat(np.arange(len(regime_len)), regime_len)[:n]
+    drift = rng.normal(0, 0.0008, size=len(regime_len))[regime]
+    vol = rng.uniform(0.002, 0.012, size=len(regime_len))[regime]
+    ret = drift + vol * rng.standard_t(4, size=n) / np.sqrt(2)
+    gaps = rng.random(n) < 0.01
+    ret[gaps] += rng.normal(0, 0.02, size=gaps.sum())
+    close = start_price * np.exp(np.cumsum(ret))
+    open_ = np.empty(n)
+    open_[0] = start_price
+    open_[1:] = close[:-1] * np.where(gaps[1:], np.exp(ret[1:] * 0.5), 1.0)
+    wick = np.abs(rng.normal(0, vol, size=(2, n))) * close
+    high = np.maximum(open_, close) + wick[0]
+    low = np.maximum(np.minimum(open_, close) - wick[1], close * 0.5)
+    volume = rng.lognormal(3.0, 0.6, size=n) * (1 + 50 * np.abs(ret))
+    spikes = rng.random(n) < 0.02
+    volume[spikes] *= rng.uniform(3, 15, size=spikes.sum())
+    t0 = 1_600_000_000_000
+    return pd.DataFrame({
+        "time": pd.to_datetime(t0 + np.arange(n, dtype=np.int64) * BAR_MS, unit="ms", utc=True),
+        "open": open_, "high": high, "low": low, "close": close, "volume": volume,
+    })
+
+def _uncached(fn):
+    # pivots and FVG/OB structure are memoized per frame; clear so every run does the work
+    def run(df):
+        ind._pivot_cache.clear()
+        return fn(df)
+    return run
+
+def _build_message(df):
+    from bot import build_message
+    return build_message("BTCUSDT", "1h", "bench", smc_analysis(df), [])
+
+# 112 settings (RSI, SuperTrend, MACD) on the 500-bar window the analyses use
+SWEEP_GRID = sweeps.parse_on("rsi:5-68,supertrend:7-22,2|3,macd:8-15,20|26,9")[1]
+
+CASES = {
+    "ema": lambda df: ind.ema(df, 200),
+    "volume_ma": lambda df: ind.volume_ma(df, 21),
+    "pivots": _uncached(lambda df: ind.pivots(df, 3, 3)),
+    "support_resistance": _uncached(ind.support_resistance),
+    "trendlines": _uncached(ind.trendlines),
+    "volume_profile_poc": ind.volume_profile_poc,
+    "volume_profile": vp.volume_profile,
+    "cvd": ind.cvd,
+    "fvg": _uncached(ind.fvg),
+    "ob_zones": _uncached(ind.ob_zones),
+    "smc_structure": _uncached(ind.smc_structure),
+    "bos_choch": _uncached(ind.bos_choch),
+    "rsi": lambda df: ind.rsi(df["close"], 9),
+    "macd": lambda df: ind.macd(df["close"]),
+    "stoch_rsi": lambda df: ind.stoch_rsi(df["close"]),
+    "kdj": ind.kdj,
+    "parabolic_sar": ind.parabolic_sar,
+    "atr": ind.atr,
+    "supertrend": ind.supertrend,
+    "vwap": ind.vwap,
+    "sweep_grid": lambda df: sweeps.compute_sweeps(df.tail(500), SWEEP_GRID),
+    "pack_summary": _uncached(ind.pack_summary),
+    "smc_analysis": _uncached(smc_analysis),
+    "build_message": _uncached(_build_message),
+}
+
+def measure(fn, df, min_time: float = 0.2, max_runs: int = 20) -> dict:
+    fn(df)  # warm-up
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_runs and (len(times) < 3 or time.perf_counter() - start < min_time):
+        t = time.perf_counter()
+        fn(df)
+        times.append(time.perf_counter() - t)
+        if times[-1] > 2.0:
+            break
+    tracemalloc.start()
+    fn(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(times), "median": float(np.median(times)), "runs": len(times), "peak_bytes": peak}
+
+def run(sizes=SIZES, names=None, seed: int = 7) -> dict:
+    results = {}
+    for n in sizes:
+        df = synthetic_ohlcv(n, seed)
+        for name, fn in CASES.items():
+            if names and name not in names:
+                continue
+            r = measure(fn, df)
+            results[f"{name}@{n}"] = r
+            print(f"{name:<20}{n:>8}  {r['seconds'] * 1e3:>10.3f} ms  {r['peak_bytes'] / 2**20:>8.2f} MiB", flush=True)
+    return results
+
+def check(results: dict, baseline: dict, threshold: float, min_delta: float) -> list:
+    failures = []
+    for key, r in results.items():
+        b = baseline.get(key)
+        if b is None:
+            continue
+        if r["seconds"] > b["seconds"] * threshold and r["seconds"] - b["seconds"] > min_delta:
+            failures.append(f"{key}: {b['seconds'] * 1e3:.3f} ms -> {r['seconds'] * 1e3:.3f} ms")
+        if r["peak_bytes"] > b["peak_bytes"] * threshold and r["peak_bytes"] - b["peak_bytes"] > 1 << 20:
+            failures.append(f"{key}: {b['peak_bytes']} B -> {r['peak_bytes']} B peak")
+    return failures
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--sizes", default=",".join(map(str, SIZES)))
+    p.add_argument("--only", default="", help="comma-separated case names")
+    p.add_argument("--seed", type=int, default=7)
+    p.add_argument("--save", metavar="FILE")
+    p.add_argument("--check", metavar="FILE")
+    p.add_argument("--threshold", type=float, default=1.5, help="allowed slowdown ratio")
+    p.add_argument("--min-delta", type=float, default=0.002, help="ignore slowdowns below this many seconds")
+    args = p.parse_args(argv)
+    names = {s for s in args.only.split(",") if s}
+    results = run([int(s) for s in args.sizes.split(",")], names, args.seed)
+    if args.save:
+        with open(args.save, "w") as fh:
+            json.dump({"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+                       "seed": args.seed, "results": results}, fh, indent=1, sort_keys=True)
+    if args.check:
+        with open(args.check) as fh:
+            baseline = json.load(fh)["results"]
+        failures = check(results, baseline, args.threshold, args.min_delta)
+        for f in failures:
+            print("REGRESSION", f)
+        return 1 if failures else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
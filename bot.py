@@ -1,9 +1,23 @@
+import asyncio
+from collections import OrderedDict
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
-from market_data import get_ohlcv
-from smc import smc_analysis
+from market_data import get_ohlcv, get_multi_ohlcv, get_history, cached_fetch, fetch_bybit, INTERVAL_MAP, INTERVAL_MS
+from workers import run_analysis, run_cpu
+from backtest import backtest, format_backtest
+from alerts import alert_stream, describe
+from indicators import support_resistance
+from indicators import EXTRAS
+from sweeps import DEFAULTS, parse_on, params_key, extras_key, label, sweep_cache
+from indicator_state import indicator_state
+from volume_profile import profile_state
 from liquidation import recent_liquidations
+from scanner import scan, format_scan, default_watchlist
 from markets_clock import market_states
+from signals import suggest_signal
+from config import ANALYSIS_CACHE_SIZE, ADMIN_USER_IDS, BACKTEST_DEFAULT_BARS, BACKTEST_MAX_BARS, WEB_CONCURRENCY
+from shared_cache import shared_cache, pack_json, unpack_json
+from metrics import CACHE_EVENTS, timed, error, gauge, start_trace, format_footer
 
 def fmt_num(x, digits=6):
     try:
@@ -17,68 +31,82 @@ DEFAULT_SHOW = {
 }
 
 def parse_toggles(extra_args):
+    # on= also takes parameters: on=rsi:14,macd:12,26,9 or grids (rsi:7-21, supertrend:10,2|3)
     show = DEFAULT_SHOW.copy()
+    params = {}
     for tok in extra_args:
         t = tok.strip()
         if t.startswith("on="):
-            keys = [k.strip().lower() for k in t[3:].split(",")]
-            for k in keys:
-                if k in ("rsi","macd","stochrsi","kdj","psar","atr","supertrend","vwap"):
-                    show[k] = True
+            shown, custom = parse_on(t[3:])
+            for k in shown:
+                show[k] = True
+            params.update(custom)
         elif t.startswith("off="):
             keys = [k.strip().lower() for k in t[4:].split(",")]
             for k in keys:
                 if k in show:
                     show[k] = False
-    return show
+    return show, params
+
+# indicator name -> (title, line body from its extras value)
+INDICATOR_LINES = {
+    "rsi": ("RSI", lambda v: fmt_num(v, 2) if v is not None else "-"),
+    "macd": ("MACD", lambda v: f"macd={fmt_num(v.get('macd',0),4)} · signal={fmt_num(v.get('signal',0),4)} · hist={fmt_num(v.get('hist',0),4)}"),
+    "stochrsi": ("StochRSI", lambda v: f"raw={fmt_num(v.get('raw',0),2)} · %K={fmt_num(v.get('k',0),2)} · %D={fmt_num(v.get('d',0),2)}"),
+    "kdj": ("KDJ", lambda v: f"K={fmt_num(v.get('k',0),2)} · D={fmt_num(v.get('d',0),2)} · J={fmt_num(v.get('j',0),2)}"),
+    "psar": ("Parabolic SAR", lambda v: fmt_num(v)),
+    "atr": ("ATR", lambda v: fmt_num(v,4) if v is not None else "-"),
+    "supertrend": ("SuperTrend", lambda v: f"linha={fmt_num(v.get('line',0))} · dir={v.get('dir','-')}"),
+    "vwap": ("VWAP", lambda v: fmt_num(v)),
+}
+MAX_SETTING_LINES = 12   # longer grids are summarized; the API returns all of them
+TELEGRAM_MAX_CHARS = 4096
+
+def indicator_lines(name: str, extras: dict, sets=None):
+    title, body = INDICATOR_LINES[name]
+    empty = {} if name in ("macd", "stochrsi", "kdj", "supertrend") else None
+    if name not in DEFAULTS:
+        return [f"*{title}:* {body(extras.get(EXTRAS[name], empty))}"]
+    lines = []
+    for p in (sets or [DEFAULTS[name]])[:MAX_SETTING_LINES]:
+        head = title if name == "psar" and p == DEFAULTS[name] else f"{title}({label(p)})"
+        lines.append(f"*{head}:* {body(extras.get(extras_key(name, p), empty))}")
+    if sets and len(sets) > MAX_SETTING_LINES:
+        lines.append(f"_… mais {len(sets) - MAX_SETTING_LINES} combinações de {title} (veja /api/analysis)_")
+    return lines
 
-def build_message(symbol: str, tf: str, source: str, res: dict, liq: list, tz_user: str="America/Campo_Grande", show=None):
+def build_message(symbol: str, tf: str, source: str, res: dict, liq: list, tz_user: str="America/Campo_Grande", show=None, params=None):
     show = show or DEFAULT_SHOW
     s = res["summary"]
     ema = s["ema"]; vol = s["volume_vs_ma21"]
     tlines = s["trendlines"]
-    fvg = s["fvg"]
     bos, choch = s["bos"], s["choch"]
     extras = s.get("extras", {})
 
-    supports = ", ".join([f"**{fmt_num(x,6)}**" for x in s["supports"]]) if s["supports"] else "-"
-    resistances = ", ".join([f"**{fmt_num(x,6)}**" for x in s["resistances"]]) if s["resistances"] else "-"
+    prof = s.get("profile_levels") or {}
+    supports = ", ".join([f"**{fmt_num(x,6)}**" for x in s["supports"]] + [f"{tag} {fmt_num(x)}" for x, tag in prof.get("supports", [])]) or "-"
+    resistances = ", ".join([f"**{fmt_num(x,6)}**" for x in s["resistances"]] + [f"{tag} {fmt_num(x)}" for x, tag in prof.get("resistances", [])]) or "-"
+    vp, sess = s.get("volume_profile"), s.get("session_profile")
+    # nearest zones not yet filled/revisited, with the distance from price
+    zones = res.get("zones") or {}
     ob_txt = []
-    for z in res["ob_zones"]:
-        ob_txt.append(f"{'DEMANDA' if z['type']=='demand' else 'OFERTA'} [{fmt_num(z['level_low'])} - {fmt_num(z['level_high'])}]")
+    for z in zones.get("ob", []):
+        ob_txt.append(f"{'DEMANDA' if z['type']=='demand' else 'OFERTA'} [{fmt_num(z['bottom'])} - {fmt_num(z['top'])}] ({z['distance_pct']:+.2f}%)")
     ob_str = ", ".join(ob_txt) if ob_txt else "-"
 
     fib_r = res["fibonacci"]["retracement"]; fib_e = res["fibonacci"]["extension"]
 
-    markets = market_states(tz_user)
+    with timed("markets"):
+        markets = market_states(tz_user)
     markets_str = "; ".join([f"{m['name']}: {m['status']} ({m['open']}–{m['close']})" for m in markets])
 
     liq_str = ", ".join([f"{x['side']} @ {fmt_num(x['price'])} ({fmt_num(x['qty'],2)})" for x in liq]) if liq else "Sem eventos recentes"
 
-    bias = "Alta" if ema["9"] > ema["21"] > ema["80"] else "Baixa" if ema["9"] < ema["21"] < ema["80"] else "Neutro"
-    if bias == "Alta" and s["resistances"]:
-        entry = s["supports"][0] if s["supports"] else s["poc"]
-        tps = s["resistances"][:3]
-        sl = s["supports"][1] if len(s["supports"])>1 else s["supports"][0]*0.99 if s["supports"] else s["poc"]*0.98
-    elif bias == "Baixa" and s["supports"]:
-        entry = s["resistances"][0] if s["resistances"] else s["poc"]
-        tps = s["supports"][:3]
-        sl = s["resistances"][1] if len(s["resistances"])>1 else s["resistances"][0]*1.01 if s["resistances"] else s["poc"]*1.02
-    else:
-        entry = s["poc"]
-        tps = (s["resistances"][:2] + s["supports"][:1]) if s["resistances"] or s["supports"] else []
-        sl = s["poc"]*0.98
-
-    fvg_str = "-" if not fvg else f"{fvg['type']} [{fmt_num(fvg['gap_bottom'])}–{fmt_num(fvg['gap_top'])}]"
+    sig = suggest_signal(s)
+    entry, tps, sl = sig["entry"], sig["tps"], sig["sl"]
 
-    rsi9 = extras.get("rsi9")
-    macd = extras.get("macd_6_13_4", {})
-    stoch = extras.get("stoch_rsi_8_5_5_3", {})
-    kdj = extras.get("kdj_5_3_3", {})
-    psar = extras.get("psar")
-    atr14 = extras.get("atr14")
-    st = extras.get("supertrend_10_3", {})
-    vwap_val = extras.get("vwap")
+    fvg_str = ", ".join(f"{z['type']} [{fmt_num(z['bottom'])}–{fmt_num(z['top'])}] ({z['distance_pct']:+.2f}%{', parcial' if z['status'] == 'partial' else ''})"
+                        for z in zones.get("fvg", [])) or "-"
 
     msg = []
     msg.append(f"🚀 *Análise SMC* — *{symbol}* [{tf}] · fonte: _{source}_")
@@ -89,20 +117,18 @@ def build_message(symbol: str, tf: str, source: str, res: dict, liq: list, tz_us
     msg.append(f"*Resistências:* {resistances}")
     msg.append(f"*LTA:* {fmt_num(tlines['LTA']['value_now']) if tlines['LTA']['value_now'] else '-'} · *LTB:* {fmt_num(tlines['LTB']['value_now']) if tlines['LTB']['value_now'] else '-'}")
     msg.append(f"*POC:* {fmt_num(s['poc'])} · *CVD:* {fmt_num(s['cvd'],2)}")
+    if vp:
+        msg.append(f"*Perfil de volume:* POC {fmt_num(vp['poc'])} · VA [{fmt_num(vp['val'])}–{fmt_num(vp['vah'])}] · HVN {', '.join(fmt_num(x) for x in vp['hvn']) or '-'} · LVN {', '.join(fmt_num(x) for x in vp['lvn']) or '-'}")
+    if sess:
+        msg.append(f"*Perfil da sessão (UTC):* POC {fmt_num(sess['poc'])} · VA [{fmt_num(sess['val'])}–{fmt_num(sess['vah'])}]")
     msg.append(f"*FVG:* {fvg_str}")
     msg.append(f"*BoS:* {bos or '-'} · *ChoCH:* {choch or '-'}")
     msg.append(f"*OB:* {ob_str}")
     msg.append("")
 
-    if show.get("rsi"):       msg.append(f"*RSI(9):* {fmt_num(rsi9,2) if rsi9 is not None else '-'}")
-    if show.get("macd"):      msg.append(f"*MACD(6,13,4):* macd={fmt_num(macd.get('macd',0),4)} · signal={fmt_num(macd.get('signal',0),4)} · hist={fmt_num(macd.get('hist',0),4)}")
-    if show.get("stochrsi"):  msg.append(f"*StochRSI(8,5,5,3):* raw={fmt_num(stoch.get('raw',0),2)} · %K={fmt_num(stoch.get('k',0),2)} · %D={fmt_num(stoch.get('d',0),2)}")
-    if show.get("kdj"):       msg.append(f"*KDJ(5,3,3):* K={fmt_num(kdj.get('k',0),2)} · D={fmt_num(kdj.get('d',0),2)} · J={fmt_num(kdj.get('j',0),2)}")
-    if show.get("psar"):      msg.append(f"*Parabolic SAR:* {fmt_num(psar)}")
-    if show.get("atr"):       msg.append(f"*ATR(14):* {fmt_num(atr14,4) if atr14 is not None else '-'}")
-    if show.get("supertrend"):msg.append(f"*SuperTrend(10,3):* linha={fmt_num(st.get('line',0))} · dir={st.get('dir','-')}")
-    if show.get("vwap"):      msg.append(f"*VWAP:* {fmt_num(vwap_val)}")
-
+    for name in EXTRAS:
+        if show.get(name):
+            msg += indicator_lines(name, extras, (params or {}).get(name))
     msg.append("")
     msg.append(f"*Fibonacci (Retrac.):* 0.236={fmt_num(fib_r['0.236'])} · 0.382={fmt_num(fib_r['0.382'])} · 0.5={fmt_num(fib_r['0.5'])} · 0.618={fmt_num(fib_r['0.618'])} · 0.786={fmt_num(fib_r['0.786'])}")
     msg.append(f"*Fibonacci (Expansão):* 1.272={fmt_num(fib_e['1.272'])} · 1.414={fmt_num(fib_e['1.414'])} · 1.618={fmt_num(fib_e['1.618'])} · 2.0={fmt_num(fib_e['2.0'])}")
@@ -110,9 +136,8 @@ def build_message(symbol: str, tf: str, source: str, res: dict, liq: list, tz_us
     msg.append(f"🕒 *Mercados Globais:* {markets_str}")
     msg.append(f"💥 *Liquidações Bybit (recentes):* {liq_str}")
     msg.append("")
-    direction = "LONG" if bias in ("Alta","Neutro") else "SHORT"
     msg.append("🎯 *Sinal sugerido* (didático, não é recomendação):")
-    msg.append(f"*Direção:* {direction}")
+    msg.append(f"*Direção:* {sig['direction']}")
     msg.append(f"*Entrada:* {fmt_num(entry)}")
     if tps:
         msg.append("*TPs:* " + " · ".join([fmt_num(x) for x in tps]))
@@ -121,22 +146,184 @@ def build_message(symbol: str, tf: str, source: str, res: dict, liq: list, tz_us
     msg.append("_Este material é para fins educacionais; não constitui recomendação de investimento._")
     return "\n".join(msg)
 
-async def analyze_command(symbol: str, tf: str, tz_user: str = "America/Campo_Grande", show=None):
-    df, source = await get_ohlcv(symbol, tf, limit=500)
-    res = smc_analysis(df)
+# --------- Shared analysis: single-flight per (symbol, tf) + result cache ---------
+class AnalysisCache:
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_SIZE // max(1, WEB_CONCURRENCY) if shared_cache else ANALYSIS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, version, need=frozenset()):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version and need <= entry[2]:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            CACHE_EVENTS.inc(cache="analysis", result="hit")
+            return entry[1]
+        self.misses += 1
+        CACHE_EVENTS.inc(cache="analysis", result="miss")
+        return None
+
+    def put(self, key, version, res, need=frozenset()):
+        self.entries[key] = (version, res, need)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "coalesced": self.coalesced, "hit_rate": self.hits / total if total else 0.0}
+
+analysis_cache = AnalysisCache()
+gauge("smc_analysis_cache_entries", "Results held by the analysis cache.", lambda: len(analysis_cache.entries))
+
+def candle_version(source: str, df):
+    last = df.iloc[-1]
+    return (source, len(df), last["time"].value, float(last["close"]), float(last["volume"]))
+
+def needed_indicators(show=None, params=None) -> frozenset:
+    # indicators with custom parameters come from the sweep instead
+    show = show or DEFAULT_SHOW
+    return frozenset(k for k in EXTRAS if show.get(k) and k not in (params or {}))
+
+async def _analyze(df, source: str, symbol: str, tf: str, need: frozenset):
+    state = indicator_state((source, symbol, tf), df, need)
+    profile = profile_state((source, symbol, tf), df).levels()
+    with timed("analysis", source=source, symbol=symbol, tf=tf):
+        res = await run_analysis(df, state=state, include=need, profile=profile)
     res["close"] = float(df["close"].iloc[-1])
+    res["time"] = int(df["time"].iloc[-1].value // 10**6)
+    return res
+
+async def _shared_result(skey: str, version, need: frozenset):
+    got = await shared_cache.get(skey)
+    if got is not None:
+        entry = unpack_json(got[1])
+        if entry["version"] == list(version) and need <= set(entry["need"]):
+            CACHE_EVENTS.inc(cache="shared_analysis", result="hit")
+            return entry["res"]
+    CACHE_EVENTS.inc(cache="shared_analysis", result="miss")
+    return None
+
+async def _analyze_shared(df, source: str, symbol: str, tf: str, version, need: frozenset):
+    # reuse another worker's result for the same candles, or compute it once
+    # while the other workers wait for it
+    skey = f"analysis:{symbol}:{tf}"
+    res = await _shared_result(skey, version, need)
+    if res is None:
+        async with shared_cache.refreshing(skey, "shared_analysis") as owned:
+            if not owned:
+                res = await _shared_result(skey, version, need)
+            if res is None:
+                res = await _analyze(df, source, symbol, tf, need)
+                entry = {"version": list(version), "need": sorted(need), "res": res}
+                await shared_cache.put(skey, version[2] // 10**6, pack_json(entry))
+    return res
+
+async def _with_sweeps(res: dict, df, version, params: dict) -> dict:
+    # custom-parameter indicators, cached per (candles, indicator, params)
+    extras = await sweep_cache.extras(version, df, params)
+    return {**res, "summary": {**res["summary"], "extras": {**res["summary"].get("extras", {}), **extras}}}
+
+async def _compute_analysis(symbol: str, tf: str, need: frozenset, params: tuple = ()):
+    df, source = await get_ohlcv(symbol, tf, limit=500)
+    version = candle_version(source, df)
+    res = analysis_cache.get((symbol, tf), version, need)
+    if res is None:
+        if shared_cache is not None:
+            res = await _analyze_shared(df, source, symbol, tf, version, need)
+        else:
+            res = await _analyze(df, source, symbol, tf, need)
+        analysis_cache.put((symbol, tf), version, res, need)
+    if params:
+        with timed("sweeps", symbol=symbol, tf=tf):
+            res = await _with_sweeps(res, df, version, dict(params))
     try:
-        liq = await recent_liquidations(symbol, max_events=6, timeout=2.0)
+        with timed("liquidations", symbol=symbol):
+            liq = await recent_liquidations(symbol, max_events=6, timeout=2.0)
     except Exception:
         liq = []
-    text = build_message(symbol, tf, source, res, liq, tz_user, show=show)
+    return source, res, liq
+
+async def shared_analysis(symbol: str, tf: str, need: frozenset = frozenset(EXTRAS), params: tuple = ()):
+    # params: sweeps.params_key() of the custom indicator settings
+    key = (symbol, tf, need, params)
+    task = analysis_cache.inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_compute_analysis(symbol, tf, need, params))
+        analysis_cache.inflight[key] = task
+        task.add_done_callback(lambda t: analysis_cache.inflight.pop(key) if analysis_cache.inflight.get(key) is t else None)
+    else:
+        analysis_cache.coalesced += 1
+    return await asyncio.shield(task)
+
+def build_mtf_message(symbol: str, source: str, base: str, results: dict):
+    bias_word = {1: "Alta", -1: "Baixa", 0: "Neutro"}
+    votes = []
+    msg = [f"🧭 *Multi-timeframe* — *{symbol}* [{','.join(results)}] · fonte: _{source}_ (base {base})", ""]
+    for tf, res in results.items():
+        s = res["summary"]; ema = s["ema"]; extras = s.get("extras", {})
+        bias = 1 if ema["9"] > ema["21"] > ema["80"] else -1 if ema["9"] < ema["21"] < ema["80"] else 0
+        st = extras.get("supertrend_10_3", {})
+        st_vote = 1 if st.get("dir") == "UP" else -1
+        vote = (bias + st_vote > 0) - (bias + st_vote < 0)
+        votes.append(vote)
+        est = "BoS" if s["bos"] else "ChoCH" if s["choch"] else "-"
+        msg.append(f"*{tf}:* viés {bias_word[bias]} · ST {st.get('dir', '-')} · RSI(9) {fmt_num(extras.get('rsi9'), 1)} · {est} · sinal {bias_word[vote]}")
+    up, down = votes.count(1), votes.count(-1)
+    overall = "Alta" if up > down else "Baixa" if down > up else "Neutro"
+    finest = next(iter(results.values()))["summary"]
+    msg.append("")
+    msg.append(f"*Confluência:* {overall} ({max(up, down)}/{len(votes)} timeframes)")
+    msg.append(f"*Suportes:* {', '.join(fmt_num(x) for x in finest['supports']) or '-'}")
+    msg.append(f"*Resistências:* {', '.join(fmt_num(x) for x in finest['resistances']) or '-'}")
+    msg.append("")
+    msg.append("_Este material é para fins educacionais; não constitui recomendação de investimento._")
+    return "\n".join(msg)
+
+async def analyze_mtf_command(symbol: str, tfs):
+    frames, source, base = await get_multi_ohlcv(symbol, tfs)
+    need = frozenset({"rsi", "supertrend"})
+    results = {}
+    for tf in sorted(frames, key=lambda x: INTERVAL_MS[x]):
+        results[tf] = await run_analysis(frames[tf], include=need)
+    return build_mtf_message(symbol, source, base, results)
+
+async def analyze_command(symbol: str, tf: str, tz_user: str = "America/Campo_Grande", show=None, params=None):
+    if "," in tf:
+        return await analyze_mtf_command(symbol, [t.strip() for t in tf.split(",") if t.strip()])
+    source, res, liq = await shared_analysis(symbol, tf, needed_indicators(show, params), params_key(params))
+    with timed("message", symbol=symbol, tf=tf):
+        text = build_message(symbol, tf, source, res, liq, tz_user, show=show, params=params)
     return text
 
+def split_message(text: str, limit: int = TELEGRAM_MAX_CHARS):
+    # Telegram rejects longer messages (grids of several indicators get there):
+    # cut at line breaks so no Markdown entity is split
+    chunks, cur = [], ""
+    for line in text.split("\n"):
+        line = line if len(line) <= limit else line[:limit - 1] + "…"
+        if cur and len(cur) + 1 + len(line) > limit:
+            chunks.append(cur)
+            cur = line
+        else:
+            cur = f"{cur}\n{line}" if cur else line
+    return chunks + [cur] if cur else chunks
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Olá! Envie /analisa BTCUSDT 1h [on=...] [off=...]\n"
         "Ex.: /analisa BTCUSDT 1h on=atr,supertrend off=kdj,psar\n"
-        "Indicadores: rsi, macd, stochrsi, kdj, psar, atr, supertrend, vwap"
+        "Parâmetros: on=rsi:14,macd:12,26,9 · grade: on=rsi:7-21,supertrend:10,2|3\n"
+        "Indicadores: rsi, macd, stochrsi, kdj, psar, atr, supertrend, vwap\n"
+        "Multi-timeframe: /analisa BTCUSDT 15m,1h,4h\n"
+        "Scan: /scan 1h [BTCUSDT,ETHUSDT,...]\n"
+        "Backtest do sinal: /backtest BTCUSDT 1h [barras] [tp=1]\n"
+        "Alertas: /alerta BTCUSDT 70000 · /alerta BTCUSDT 1h sr|st|rsi [30 70] · /alerta lista · /alerta del <id|todos>"
     )
 
 async def analisa(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -146,12 +333,128 @@ async def analisa(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return await update.message.reply_text("Uso: /analisa <PAR> <TIMEFRAME> [on=...] [off=...]")
         symbol = args[0].upper()
         tf = args[1].lower()
-        show = parse_toggles(args[2:]) if len(args) > 2 else None
-        text = await analyze_command(symbol, tf, show=show)
-        await update.message.reply_markdown(text, disable_web_page_preview=True)
+        # admins may add "timing" to get a per-stage latency footer
+        trace = start_trace() if "timing" in args[2:] and update.effective_user.id in ADMIN_USER_IDS else None
+        show, params = parse_toggles(args[2:]) if len(args) > 2 else (None, None)
+        text = await analyze_command(symbol, tf, show=show, params=params)
+        if trace is not None:
+            text += "\n" + format_footer(trace)
+        with timed("send", symbol=symbol, tf=tf):
+            for chunk in split_message(text):
+                await update.message.reply_markdown(chunk, disable_web_page_preview=True)
     except Exception as e:
+        error("analisa", e)
         await update.message.reply_text(f"Erro na análise: {e}")
 
+async def scan_command(tf: str, symbols=None):
+    symbols = symbols or default_watchlist()
+    rows, failed = await scan(symbols, tf)
+    return format_scan(rows, failed, tf), rows
+
+async def scan_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        args = context.args
+        if not args:
+            return await update.message.reply_text("Uso: /scan <TIMEFRAME> [PAR1,PAR2,...]")
+        tf = args[0].lower()
+        symbols = ",".join(args[1:]).split(",") if len(args) > 1 else None
+        text, _ = await scan_command(tf, symbols)
+        await update.message.reply_markdown(text, disable_web_page_preview=True)
+    except Exception as e:
+        error("scan", e)
+        await update.message.reply_text(f"Erro no scan: {e}")
+
+async def backtest_command(symbol: str, tf: str, bars: int = BACKTEST_DEFAULT_BARS, tp: int = 1):
+    bars = max(600, min(bars, BACKTEST_MAX_BARS))
+    tp = max(1, min(tp, 3))
+    with timed("history", symbol=symbol, tf=tf):
+        df, source = await get_history(symbol, tf, bars)
+    if len(df) < 600:
+        raise RuntimeError(f"Histórico insuficiente ({len(df)} barras).")
+    with timed("backtest", source=source, symbol=symbol, tf=tf):
+        result = await run_cpu(backtest, df, 500, tp)
+    return format_backtest(symbol, tf, source, result["stats"], tp), result
+
+async def backtest_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        args = context.args
+        if len(args) < 2:
+            return await update.message.reply_text("Uso: /backtest <PAR> <TIMEFRAME> [barras] [tp=1|2|3]")
+        symbol, tf = args[0].upper(), args[1].lower()
+        bars = next((int(a) for a in args[2:] if a.isdigit()), BACKTEST_DEFAULT_BARS)
+        tp = next((int(a[3:]) for a in args[2:] if a.startswith("tp=") and a[3:].isdigit()), 1)
+        text, _ = await backtest_command(symbol, tf, bars, tp)
+        await update.message.reply_markdown(text, disable_web_page_preview=True)
+    except Exception as e:
+        error("backtest", e)
+        await update.message.reply_text(f"Erro no backtest: {e}")
+
+async def _alert_candles(symbol: str, tf: str, bars: int):
+    # the alert stream subscribes whatever is stored: reject unknown pairs up front
+    try:
+        return await cached_fetch(fetch_bybit, "bybit", symbol, tf, bars)
+    except RuntimeError:
+        raise ValueError(f"Par {symbol} não encontrado na Bybit.") from None
+
+ALERTA_USO = ("Uso: /alerta <PAR> <PREÇO> · /alerta <PAR> <TF> sr|st|rsi [baixo alto]\n"
+              "/alerta lista · /alerta del <id|todos>")
+
+async def alert_command(chat_id: int, args) -> str:
+    if not args:
+        return ALERTA_USO
+    if args[0].lower() == "lista":
+        mine = await alert_stream.edit(lambda book: book.for_chat(chat_id))
+        return "\n".join(["🔔 Seus alertas:"] + [describe(a) for a in mine]) if mine else "Nenhum alerta ativo."
+    if args[0].lower() == "del" and len(args) > 1:
+        def drop(book):
+            mine = {a["id"] for a in book.for_chat(chat_id)}
+            ids = mine if args[1].lower() == "todos" else {int(x) for x in args[1:] if x.isdigit()} & mine
+            for aid in ids:
+                book.remove(aid)
+            return len(ids)
+        return f"{await alert_stream.edit(drop)} alerta(s) removido(s)."
+    if len(args) < 2:
+        return ALERTA_USO
+    symbol = args[0].upper()
+    try:
+        level = float(args[1].replace(",", "."))
+    except ValueError:
+        level = None
+    if level is not None:
+        ref = float((await _alert_candles(symbol, "1m", 3))["close"][-1])
+        created = await alert_stream.edit(lambda book: [book.add(chat_id, symbol, "price", ref=ref, level=level)])
+    else:
+        tf, kind = args[1].lower(), (args[2].lower() if len(args) > 2 else "")
+        if tf not in INTERVAL_MAP or kind not in ("sr", "st", "rsi"):
+            return ALERTA_USO
+        if kind == "sr":
+            await _alert_candles(symbol, "1m", 3)   # levels become 1m price alerts
+            df, _ = await get_ohlcv(symbol, tf, limit=500)
+            close = float(df["close"].iloc[-1])
+            supports, resistances = support_resistance(df)
+            created = await alert_stream.edit(lambda book: [book.add(chat_id, symbol, "price", ref=close, level=float(x))
+                                                            for x in supports + resistances])
+        elif kind == "st":
+            await _alert_candles(symbol, tf, 300)   # same fetch as the stream's seed
+            created = await alert_stream.edit(lambda book: [book.add(chat_id, symbol, "st", tf=tf)])
+        else:
+            low, high = (float(args[3]), float(args[4])) if len(args) > 4 else (30.0, 70.0)
+            await _alert_candles(symbol, tf, 300)
+            created = await alert_stream.edit(lambda book: [book.add(chat_id, symbol, "rsi", tf=tf, low=min(low, high), high=max(low, high))])
+    return "\n".join(["✅ Alerta(s) criado(s):"] + [describe(a) for a in created]) if created else "Nenhum nível encontrado."
+
+async def alerta(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        text = await alert_command(update.effective_chat.id, context.args)
+        await update.message.reply_text(text)
+    except Exception as e:
+        error("alerta", e)
+        await update.message.reply_text(f"Erro no alerta: {e}")
+
 def register_handlers(app: Application):
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("analisa", analisa))
+    app.add_handler(CommandHandler("scan", scan_handler))
+    app.add_handler(CommandHandler("backtest", backtest_handler))
+    app.add_handler(CommandHandler("alerta", alerta))
+    alert_stream.notify = lambda chat_id, text: app.bot.send_message(chat_id, text, parse_mode="Markdown")
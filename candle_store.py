@@ -0,0 +1,141 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+from candles import Candles, FIELDS, TIME_DTYPE
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - no cross-process locking on Windows
+    fcntl = None
+
+RECORD = np.dtype([("time", "<i8")] + [(f, "<f8") for f in FIELDS])
+
+class CandleStore:
+    # One file of fixed-size records per (source, symbol, interval), read through
+    # np.memmap. Files are never modified in place: every write merges into a
+    # fresh copy and swaps it in with os.replace under a per-file lock, so maps
+    # held by other workers keep reading the old file and concurrent writers
+    # never drop each other's rows.
+    MAX_MAPS = 64   # open memmaps kept (LRU); an evicted one is unmapped once unreferenced
+
+    def __init__(self, root: str):
+        self.root = root
+        self._maps = OrderedDict()
+        os.makedirs(root, exist_ok=True)
+
+    def close(self):
+        self._maps.clear()
+
+    def path(self, key) -> str:
+        name = "_".join(str(k) for k in key)
+        return os.path.join(self.root, re.sub(r"[^A-Za-z0-9_.-]", "", name) + ".bin")
+
+    def _map(self, key):
+        path = self.path(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+        cached = self._maps.pop(path, None)
+        if cached is not None and cached[0] == stamp:
+            self._maps[path] = cached
+            return cached[1]
+        n = st.st_size // RECORD.itemsize
+        mm = np.memmap(path, dtype=RECORD, mode="r", shape=(n,)) if n else np.empty(0, dtype=RECORD)
+        self._maps[path] = (stamp, mm)
+        while len(self._maps) > self.MAX_MAPS:
+            self._maps.popitem(last=False)
+        return mm
+
+    def depth(self, key) -> int:
+        mm = self._map(key)
+        return 0 if mm is None else len(mm)
+
+    def read(self, key, limit: int = None):
+        mm = self._map(key)
+        if mm is None or not len(mm):
+            return None
+        rows = mm if limit is None else mm[-limit:]
+        return Candles(rows["time"].astype(np.int64).view(TIME_DTYPE),
+                       np.vstack([rows[f] for f in FIELDS]))
+
+    def _records(self, candles: Candles) -> np.ndarray:
+        rec = np.empty(len(candles), dtype=RECORD)
+        rec["time"] = candles.time.view(np.int64)
+        for i, f in enumerate(FIELDS):
+            rec[f] = candles.ohlcv[i]
+        return rec
+
+    @staticmethod
+    def _merge(old: np.ndarray, new: np.ndarray) -> np.ndarray:
+        # union by open time; rows of `new` win
+        if not len(old):
+            return new
+        if not len(new):
+            return np.array(old)
+        pos = int(np.searchsorted(old["time"], new["time"][0]))
+        if int(new["time"][-1]) >= int(old["time"][-1]):
+            return np.concatenate([old[:pos], new])   # the usual case: new rows extend the tail
+        rec = np.concatenate([old[~np.isin(old["time"], new["time"])], new])
+        return rec[np.argsort(rec["time"], kind="stable")]
+
+    @contextmanager
+    def _locked(self, key):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path(key) + ".lock", "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _save(self, key, rec: np.ndarray):
+        path = self.path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        rec.tofile(tmp)
+        os.replace(tmp, path)
+
+    def write(self, key, candles: Candles, bar: int) -> bool:
+        # Merges the rows into the stored history. Returns True when they start
+        # after a hole (stored history ends more than one bar before them).
+        if not len(candles):
+            return False
+        new = self._records(candles)
+        with self._locked(key):
+            mm = self._map(key)
+            if mm is None or not len(mm):
+                self._save(key, new)
+                return False
+            gap = int(new["time"][0]) > int(mm["time"][-1]) + bar
+            self._save(key, self._merge(mm, new))
+        return gap
+
+    async def backfill(self, key, fetch, bars: int, bar: int, page: int = 1000):
+        # fetch(symbol, interval, limit, since=, until=) -> Candles; pages forward in time
+        _, symbol, interval = key
+        now = int(time.time() * 1000)
+        since = (now // bar - bars + 1) * bar
+        fetched = np.empty(0, dtype=RECORD)
+        for _ in range(bars // page + 2):
+            if since > now:
+                break
+            until = since + (page - 1) * bar
+            c = await fetch(symbol, interval, page, since=since, until=until)
+            if len(c):
+                fetched = self._merge(fetched, self._records(c))
+                since = max(int(fetched["time"][-1]) + bar, until + bar)
+            else:
+                since = until + bar
+        if not len(fetched):
+            return self.depth(key)
+        with self._locked(key):
+            # rows written meanwhile by the live tail (_persist) are at least as fresh: they win
+            mm = self._map(key)
+            self._save(key, fetched if mm is None else self._merge(fetched, mm))
+        return self.depth(key)
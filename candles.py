@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is optional
+    import json
+    loads = json.loads
+
+FIELDS = ("open", "high", "low", "close", "volume")
+TIME_DTYPE = np.dtype("datetime64[ms]")
+
+class Candles:
+    # Columnar OHLCV: time as datetime64[ms] plus one contiguous (5 x n) float64
+    # block, one row per field. candles["close"] returns a plain numpy view.
+    __slots__ = ("time", "ohlcv", "__weakref__")
+
+    def __init__(self, time: np.ndarray, ohlcv: np.ndarray):
+        self.time = time
+        self.ohlcv = ohlcv
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name == "time":
+            return self.time
+        return self.ohlcv[FIELDS.index(name)]
+
+    @classmethod
+    def from_columns(cls, time_ms, ohlcv, presorted: bool = False):
+        time = np.asarray(time_ms, dtype=np.int64).view(TIME_DTYPE)
+        ohlcv = np.ascontiguousarray(ohlcv, dtype=np.float64)
+        if not presorted and len(time) > 1 and not (time[1:] >= time[:-1]).all():
+            order = np.argsort(time, kind="stable")
+            time, ohlcv = time[order], np.ascontiguousarray(ohlcv[:, order])
+        return cls(time, ohlcv)
+
+    @classmethod
+    def from_rows(cls, rows, time_col: int, cols, time_scale: int = 1, reverse: bool = False):
+        # rows: list of exchange kline rows (numbers or numeric strings)
+        if not len(rows):
+            return cls(np.empty(0, dtype=TIME_DTYPE), np.empty((len(FIELDS), 0)))
+        arr = np.array(rows, dtype=np.float64)
+        if reverse:
+            arr = arr[::-1]
+        time = arr[:, time_col].astype(np.int64) * time_scale
+        return cls.from_columns(time, arr[:, list(cols)].T)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        time = df["time"].values.astype(TIME_DTYPE)
+        return cls(time, np.vstack([df[f].to_numpy(dtype=np.float64) for f in FIELDS]))
+
+    def tail(self, n: int):
+        return Candles(self.time[-n:], self.ohlcv[:, -n:]) if n < len(self) else self
+
+    def to_frame(self) -> pd.DataFrame:
+        data = {"time": pd.to_datetime(self.time.view(np.int64), unit="ms", utc=True)}
+        for i, f in enumerate(FIELDS):
+            data[f] = self.ohlcv[i]
+        return pd.DataFrame(data, copy=False)
@@ -3,3 +3,55 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
 PORT = int(os.getenv("PORT", "10000"))
+CANDLE_CACHE_TTL = float(os.getenv("CANDLE_CACHE_TTL", "5"))
+CANDLE_CACHE_MAX_BYTES = int(os.getenv("CANDLE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+HTTP2 = os.getenv("HTTP2", "0") == "1"
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "40"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "1.5"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.2"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+LIQ_BUFFER_SIZE = int(os.getenv("LIQ_BUFFER_SIZE", "50"))
+LIQ_IDLE_SECONDS = float(os.getenv("LIQ_IDLE_SECONDS", "900"))
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "512"))
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "thread")  # thread | process | inline
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+SCAN_CONCURRENCY = int(os.getenv("SCAN_CONCURRENCY", "16"))
+SCAN_LIMIT = int(os.getenv("SCAN_LIMIT", "300"))
+SCAN_MAX_SYMBOLS = int(os.getenv("SCAN_MAX_SYMBOLS", "200"))
+SCAN_WATCHLIST = os.getenv("SCAN_WATCHLIST", "BTCUSDT,ETHUSDT,SOLUSDT,BNBUSDT,XRPUSDT,DOGEUSDT,ADAUSDT,AVAXUSDT,LINKUSDT,DOTUSDT,LTCUSDT,TRXUSDT")
+MTF_MAX_BASE_BARS = int(os.getenv("MTF_MAX_BASE_BARS", "1000"))
+MTF_MIN_BARS = int(os.getenv("MTF_MIN_BARS", "200"))  # fewer resampled bars -> fetch that timeframe directly
+CANDLE_STORE_DIR = os.getenv("CANDLE_STORE_DIR", "data/candles")  # empty disables the on-disk store
+STORE_BACKFILL_BARS = int(os.getenv("STORE_BACKFILL_BARS", "5000"))
+ADMIN_USER_IDS = {int(x) for x in os.getenv("ADMIN_USER_IDS", "").split(",") if x.strip()}
+BACKTEST_DEFAULT_BARS = int(os.getenv("BACKTEST_DEFAULT_BARS", "5000"))
+BACKTEST_MAX_BARS = int(os.getenv("BACKTEST_MAX_BARS", "100000"))
+ALERTS_FILE = os.getenv("ALERTS_FILE", "data/alerts.json")  # empty keeps alerts in memory only
+ALERTS_MAX_PER_CHAT = int(os.getenv("ALERTS_MAX_PER_CHAT", "200"))
+ALERT_SEND_RATE = float(os.getenv("ALERT_SEND_RATE", "25"))  # messages per second
+VP_BIN_PCT = float(os.getenv("VP_BIN_PCT", "0.1"))  # volume profile bin width, % of price
+VP_VALUE_AREA = float(os.getenv("VP_VALUE_AREA", "0.70"))
+INTAKE_WORKERS = int(os.getenv("INTAKE_WORKERS", "8"))
+INTAKE_MAX_QUEUE = int(os.getenv("INTAKE_MAX_QUEUE", "1000"))
+INTAKE_CHAT_RATE = float(os.getenv("INTAKE_CHAT_RATE", "0.5"))  # updates per second per chat
+INTAKE_CHAT_BURST = float(os.getenv("INTAKE_CHAT_BURST", "5"))
+INTAKE_DEDUP_SIZE = int(os.getenv("INTAKE_DEDUP_SIZE", "10000"))
+# per-exchange token buckets, "name=requests_per_second/burst"
+EXCHANGE_RATE_LIMITS = {k: tuple(map(float, v.split("/"))) for k, v in (x.strip().split("=") for x in
+    os.getenv("EXCHANGE_RATE_LIMITS", "bybit=10/20,kraken=1/5,mexc=10/20,bitmex=0.5/10").split(",") if x.strip())}
+SCHED_INTERACTIVE_MAX_WAIT = float(os.getenv("SCHED_INTERACTIVE_MAX_WAIT", "2"))  # seconds before falling back
+# number of uvicorn workers: set it instead of --workers (uvicorn reads it as the
+# --workers default; the flag alone does not reach the app)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# cache shared by the workers: "sqlite:path.db" (WAL; /dev/shm keeps it in RAM) or "redis://host:port/db"
+SHARED_CACHE_URL = os.getenv("SHARED_CACHE_URL", "sqlite:data/shared_cache.db" if WEB_CONCURRENCY > 1 else "")
+SHARED_CACHE_TTL = float(os.getenv("SHARED_CACHE_TTL", "3600"))
+SHARED_LOCK_TTL = float(os.getenv("SHARED_LOCK_TTL", "15"))
+SHARED_LOCK_WAIT = float(os.getenv("SHARED_LOCK_WAIT", "5"))  # seconds to wait for another worker's refresh
+API_MAX_SYMBOLS = int(os.getenv("API_MAX_SYMBOLS", "50"))
+SWEEP_MAX_SETTINGS = int(os.getenv("SWEEP_MAX_SETTINGS", "256"))  # parameter sets per indicator in on=
+SWEEP_CACHE_SIZE = int(os.getenv("SWEEP_CACHE_SIZE", "20000"))
@@ -0,0 +1,361 @@
+import copy
+import math
+from collections import OrderedDict, deque
+import numpy as np
+import pandas as pd
+
+NAN = float("nan")
+EMA_PERIODS = (9, 21, 80, 200)
+MAX_STATES = 256
+
+def _div(a, b):
+    # float division with numpy semantics (x/0 -> inf, 0/0 -> nan)
+    if b != 0:
+        return a / b
+    if a != a or a == 0:
+        return NAN
+    return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+def _com_span(span):
+    return (span - 1) / 2.0
+
+def _com_alpha(alpha):
+    return 1.0 / alpha - 1.0
+
+def _fill(x, value=50.0):
+    return value if x != x else x
+
+# --------- Online building blocks (same arithmetic as pandas ewm/rolling) ---------
+class _Ewm:
+    __slots__ = ("alpha", "factor", "weighted", "old_wt", "nobs")
+
+    def __init__(self, com: float):
+        self.alpha = 1.0 / (1.0 + com)
+        self.factor = 1.0 - self.alpha
+        self.weighted = None
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def push(self, x: float) -> float:
+        obs = x == x
+        if self.weighted is None:
+            self.weighted = x
+        elif self.weighted == self.weighted:
+            self.old_wt *= self.factor
+            if obs:
+                if self.weighted != x:
+                    w = self.old_wt * self.weighted + self.alpha * x
+                    self.weighted = w / (self.old_wt + self.alpha)
+                self.old_wt = 1.0
+        elif obs:
+            self.weighted = x
+        self.nobs += obs
+        return self.weighted if self.nobs else NAN
+
+    def clone(self):
+        return copy.copy(self)
+
+class _Window:
+    __slots__ = ("size", "buf")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.buf = deque(maxlen=size)
+
+    def push(self, x: float):
+        self.buf.append(x)
+
+    def _valid(self):
+        return len(self.buf) == self.size and all(x == x for x in self.buf)
+
+    def mean(self):
+        return sum(self.buf) / self.size if self._valid() else NAN
+
+    def min(self):
+        return min(self.buf) if self._valid() else NAN
+
+    def max(self):
+        return max(self.buf) if self._valid() else NAN
+
+    def clone(self):
+        w = _Window.__new__(_Window)
+        w.size = self.size
+        w.buf = self.buf.copy()
+        return w
+
+class _Rsi:
+    __slots__ = ("gain", "loss")
+
+    def __init__(self, period: int):
+        self.gain = _Ewm(_com_alpha(1 / period))
+        self.loss = _Ewm(_com_alpha(1 / period))
+
+    def push(self, delta: float) -> float:
+        g = self.gain.push(delta if delta > 0 else 0.0)
+        l = self.loss.push(-delta if delta < 0 else 0.0)
+        rs = g / l if l != 0 else NAN
+        return _fill(100 - (100 / (1 + rs)))
+
+    def clone(self):
+        r = _Rsi.__new__(_Rsi)
+        r.gain = self.gain.clone()
+        r.loss = self.loss.clone()
+        return r
+
+# --------- One step of the pack_summary indicators ---------
+# toggle names (indicators.EXTRAS) the oscillator section can compute
+EXTRAS_NAMES = frozenset({"rsi", "macd", "stochrsi", "kdj", "psar", "atr", "supertrend", "vwap"})
+EXTRAS_ORDER = ("rsi9", "macd_6_13_4", "stoch_rsi_8_5_5_3", "kdj_5_3_3", "psar", "atr14", "supertrend_10_3", "vwap")
+
+class _Core:
+    _components = ("ema", "vol21", "rsi9", "rsi8", "macd_fast", "macd_slow", "macd_signal",
+                   "stoch_min", "stoch_max", "stoch_k", "stoch_d", "kdj_low", "kdj_high",
+                   "kdj_k", "kdj_d", "atr14", "atr10")
+
+    def __init__(self, include=EXTRAS_NAMES):
+        # include: the toggles to keep up to date; EMAs and volume always are
+        self.include = include
+        self.count = 0
+        self.prev = None
+        self.ema = {p: _Ewm(_com_span(p)) for p in EMA_PERIODS}
+        self.vol21 = _Window(21)
+        self.rsi9 = _Rsi(9)
+        self.rsi8 = _Rsi(8)
+        self.macd_fast = _Ewm(_com_span(6))
+        self.macd_slow = _Ewm(_com_span(13))
+        self.macd_signal = _Ewm(_com_span(4))
+        self.stoch_min = _Window(5)
+        self.stoch_max = _Window(5)
+        self.stoch_k = _Window(5)
+        self.stoch_d = _Window(3)
+        self.kdj_low = _Window(5)
+        self.kdj_high = _Window(5)
+        self.kdj_k = _Ewm(_com_alpha(1 / 3))
+        self.kdj_d = _Ewm(_com_alpha(1 / 3))
+        self.atr14 = _Ewm(_com_span(14))
+        self.atr10 = _Ewm(_com_span(10))
+        self.st = None
+        self.psar = None
+        self.cum_vol = 0.0
+        self.cum_pv = 0.0
+        self.vwap = NAN
+        self.out = None
+
+    def clone(self):
+        c = copy.copy(self)
+        for name in self._components:
+            comp = getattr(self, name)
+            if isinstance(comp, dict):
+                setattr(c, name, {k: v.clone() for k, v in comp.items()})
+            else:
+                setattr(c, name, comp.clone())
+        return c
+
+    def step(self, high: float, low: float, close: float, volume: float):
+        prev = self.prev
+        inc = self.include
+        self.count += 1
+        ema = {str(p): e.push(close) for p, e in self.ema.items()}
+        self.vol21.push(volume)
+        ma21 = self.vol21.mean()
+        extras = {}
+
+        delta = close - prev[2] if prev else NAN
+        if "rsi" in inc:
+            extras["rsi9"] = float(self.rsi9.push(delta))
+        if "macd" in inc:
+            macd_line = self.macd_fast.push(close) - self.macd_slow.push(close)
+            signal_line = self.macd_signal.push(macd_line)
+            extras["macd_6_13_4"] = {"macd": float(macd_line), "signal": float(signal_line),
+                                     "hist": float(macd_line - signal_line)}
+
+        if "stochrsi" in inc:
+            r8 = self.rsi8.push(delta)
+            self.stoch_min.push(r8); self.stoch_max.push(r8)
+            mn, mx = self.stoch_min.min(), self.stoch_max.max()
+            stoch = _div(r8 - mn, mx - mn)
+            self.stoch_k.push(stoch)
+            k_line = self.stoch_k.mean()
+            self.stoch_d.push(k_line)
+            d_line = self.stoch_d.mean()
+            extras["stoch_rsi_8_5_5_3"] = {"raw": _fill(stoch*100), "k": _fill(k_line*100), "d": _fill(d_line*100)}
+
+        if "kdj" in inc:
+            self.kdj_low.push(low); self.kdj_high.push(high)
+            ll, hh = self.kdj_low.min(), self.kdj_high.max()
+            rsv = _div(close - ll, hh - ll) * 100
+            kdj_k = self.kdj_k.push(rsv)
+            kdj_d = self.kdj_d.push(kdj_k)
+            extras["kdj_5_3_3"] = {"k": _fill(kdj_k), "d": _fill(kdj_d), "j": _fill(3*kdj_k - 2*kdj_d)}
+
+        if "psar" in inc:
+            extras["psar"] = float(self._step_psar(high, low, close))
+
+        if "atr" in inc or "supertrend" in inc:
+            tr = abs(high - low)
+            if prev:
+                tr = max(tr, abs(high - prev[2]), abs(low - prev[2]))
+            if "atr" in inc:
+                extras["atr14"] = float(self.atr14.push(tr))
+            if "supertrend" in inc:
+                st = self._step_supertrend(high, low, close, self.atr10.push(tr))
+                extras["supertrend_10_3"] = {"line": float(st), "dir": "UP" if close >= st else "DOWN"}
+
+        if "vwap" in inc:
+            self.cum_vol += volume
+            self.cum_pv += (high + low + close) / 3 * volume
+            vw = _div(self.cum_pv, self.cum_vol)
+            if vw == vw:
+                self.vwap = vw
+            extras["vwap"] = float(self.vwap)
+
+        self.prev = (high, low, close)
+        self.out = {
+            "ema": ema,
+            "volume_vs_ma21": {"last": float(volume), "ma21": None if ma21 != ma21 else float(ma21)},
+            "extras": {k: extras[k] for k in EXTRAS_ORDER if k in extras},
+        }
+
+    def _step_supertrend(self, high, low, close, atr10, multiplier=3.0):
+        prev = self.prev
+        hl2 = (high + low) / 2.0
+        upper = hl2 + multiplier * atr10
+        lower = hl2 - multiplier * atr10
+        if self.st is None:
+            st = lower
+        else:
+            prev_upper, prev_lower, prev_st = self.st
+            cur_upper = min(upper, prev_upper) if prev[2] > prev_upper else upper
+            cur_lower = max(lower, prev_lower) if prev[2] < prev_lower else lower
+            if prev_st == prev_upper:
+                st = cur_upper if close <= cur_upper else cur_lower
+            else:
+                st = cur_lower if close >= cur_lower else cur_upper
+            upper, lower = cur_upper, cur_lower
+        self.st = (upper, lower, st)
+        return st
+
+    def _step_psar(self, high, low, close, step=0.02, max_step=0.2):
+        if self.psar is None:
+            self.psar = (True, step, high, low)
+            return close
+        bull, af, ep, sar = self.psar
+        prev_high, prev_low = self.prev[0], self.prev[1]
+        sar = sar + af*(ep - sar)
+        if bull:
+            sar = min(sar, prev_low, low)
+            if high > ep:
+                ep = high
+                af = min(af + step, max_step)
+            if low < sar:
+                bull, sar, ep, af = False, ep, low, step
+        else:
+            sar = max(sar, prev_high, high)
+            if low < ep:
+                ep = low
+                af = min(af + step, max_step)
+            if high > sar:
+                bull, sar, ep, af = True, ep, high, step
+        self.psar = (bull, af, ep, sar)
+        return sar
+
+def _frame_times(df) -> np.ndarray:
+    col = df["time"]
+    return np.asarray(getattr(col, "values", col)).astype("datetime64[ns]").view("i8")
+
+class IndicatorState:
+    # Recursive indicators of pack_summary kept up to date one candle at a time.
+    # Every bar before the last one is folded into the committed state; the last
+    # (possibly still forming) bar is applied on a copy, so revising it is O(1).
+    # When the window slides (the candle cache keeps a fixed depth, so once per
+    # new bar) the state is reseeded: EWMs, SuperTrend and PSAR depend on where
+    # the history starts, and the values must match pack_summary on that frame.
+
+    def __init__(self, include=None):
+        # include: toggle names to keep (see EXTRAS_NAMES); None means all of them
+        self.include = EXTRAS_NAMES if include is None else frozenset(include) & EXTRAS_NAMES
+        self._core = _Core(self.include)
+        self._tip = None
+        self._tip_time = None
+        self._first_time = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, include=None):
+        state = cls(include)
+        state.seed(df)
+        return state
+
+    def seed(self, df):
+        # df: a candle DataFrame or a candles.Candles
+        self._core = _Core(self.include)
+        self._tip = self._tip_time = self._first_time = None
+        n = len(df)
+        if not n:
+            return self
+        times = _frame_times(df)
+        high, low = np.asarray(df["high"], dtype=float).tolist(), np.asarray(df["low"], dtype=float).tolist()
+        close, vol = np.asarray(df["close"], dtype=float).tolist(), np.asarray(df["volume"], dtype=float).tolist()
+        for i in range(n - 1):
+            self._core.step(high[i], low[i], close[i], vol[i])
+        self._first_time = int(times[0])
+        self._set_tip(int(times[-1]), high[-1], low[-1], close[-1], vol[-1])
+        return self
+
+    def update(self, time, high: float, low: float, close: float, volume: float) -> dict:
+        t = pd.Timestamp(time).value
+        if self._tip_time is None:
+            self._first_time = t
+        elif t < self._tip_time:
+            raise ValueError("candle is older than the current bar")
+        elif t > self._tip_time:
+            self._commit()
+        self._set_tip(t, float(high), float(low), float(close), float(volume))
+        return self.summary()
+
+    def sync(self, df, include=None):
+        # include: toggles this caller needs; new ones widen the state (one reseed)
+        n = len(df)
+        if include is not None and not frozenset(include) & EXTRAS_NAMES <= self.include:
+            self.include = self.include | (frozenset(include) & EXTRAS_NAMES)
+            return self.seed(df)
+        if self._tip_time is None or not n:
+            return self.seed(df)
+        times = _frame_times(df)
+        pos = int(np.searchsorted(times, self._tip_time))
+        if times[0] != self._first_time or pos >= n or times[pos] != self._tip_time:
+            return self.seed(df)
+        high, low = np.asarray(df["high"], dtype=float), np.asarray(df["low"], dtype=float)
+        close, vol = np.asarray(df["close"], dtype=float), np.asarray(df["volume"], dtype=float)
+        # the last committed bar must match the frame, or the history was revised
+        if pos and self._core.prev != (float(high[pos-1]), float(low[pos-1]), float(close[pos-1])):
+            return self.seed(df)
+        for i in range(pos, n):
+            if i > pos:
+                self._commit()
+            self._set_tip(int(times[i]), float(high[i]), float(low[i]), float(close[i]), float(vol[i]))
+        return self
+
+    def _commit(self):
+        self._core = self._tip
+
+    def _set_tip(self, t, high, low, close, volume):
+        tip = self._core.clone()
+        tip.step(high, low, close, volume)
+        self._tip, self._tip_time = tip, t
+
+    @property
+    def last_time(self):
+        return None if self._tip_time is None else pd.Timestamp(self._tip_time, tz="UTC")
+
+    def summary(self):
+        return None if self._tip is None else self._tip.out
+
+_states = OrderedDict()
+
+def indicator_state(key, df: pd.DataFrame, include=None) -> IndicatorState:
+    state = _states.pop(key, None) or IndicatorState(include)
+    state.sync(df, include)
+    _states[key] = state
+    while len(_states) > MAX_STATES:
+        _states.popitem(last=False)
+    return state
@@ -1,5 +1,9 @@
+import weakref
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from volume_profile import volume_profile, session_profile, split_levels
+from structure import structure_frame
 
 def ema_series(s: pd.Series, period: int):
     return s.ewm(span=period, adjust=False).mean()
@@ -10,15 +14,53 @@ def ema(df: pd.DataFrame, period: int, col: str="close"):
 def volume_ma(df: pd.DataFrame, period: int=21):
     return df["volume"].rolling(period).mean()
 
-def pivots(df: pd.DataFrame, left: int=3, right: int=3):
-    highs, lows = [], []
-    for i in range(left, len(df)-right):
-        window = df.iloc[i-left:i+right+1]
-        if df["high"].iloc[i] == window["high"].max():
-            highs.append((i, df["high"].iloc[i]))
-        if df["low"].iloc[i] == window["low"].min():
-            lows.append((i, df["low"].iloc[i]))
-    return highs, lows
+# --------- Pivots (vectorized, memoized per candle frame) ---------
+PIVOT_WINDOWS = ((3, 3), (5, 5))
+_pivot_cache = {}
+
+def _frame_stamp(df: pd.DataFrame):
+    if len(df) == 0:
+        return (0,)
+    return (len(df), float(np.asarray(df["high"])[-1]), float(np.asarray(df["low"])[-1]), float(np.asarray(df["close"])[-1]))
+
+def _swing_mask(values: np.ndarray, left: int, right: int, reduce):
+    n = len(values)
+    mask = np.zeros(n, dtype=bool)
+    if n < left + right + 1:
+        return mask
+    extreme = reduce.reduce(sliding_window_view(values, left + right + 1), axis=1)
+    mask[left:n-right] = values[left:n-right] == extreme
+    return mask
+
+def _frame_memo(df) -> dict:
+    # per-frame memo dict, dropped when the frame changes or is collected
+    key = id(df)
+    stamp = _frame_stamp(df)
+    entry = _pivot_cache.get(key)
+    if entry is None:
+        weakref.finalize(df, _pivot_cache.pop, key, None)
+    if entry is None or entry[0] != stamp:
+        entry = (stamp, {})
+        _pivot_cache[key] = entry
+    return entry[1]
+
+def pivot_table(df, windows=PIVOT_WINDOWS):
+    # df: a candle DataFrame or a candles.Candles
+    table = _frame_memo(df)
+    missing = [w for w in windows if w not in table]
+    if missing:
+        high = np.asarray(df["high"], dtype=float)
+        low = np.asarray(df["low"], dtype=float)
+        for left, right in missing:
+            hm = _swing_mask(high, left, right, np.fmax)
+            lm = _swing_mask(low, left, right, np.fmin)
+            hi = np.flatnonzero(hm); li = np.flatnonzero(lm)
+            table[(left, right)] = (list(zip(hi.tolist(), high[hi])), list(zip(li.tolist(), low[li])))
+    return table
+
+def pivots(df, left: int=3, right: int=3):
+    highs, lows = pivot_table(df, ((left, right),))[(left, right)]
+    return list(highs), list(lows)
 
 def support_resistance(df: pd.DataFrame, left: int=3, right: int=3, min_dist: float=0.002):
     highs, lows = pivots(df, left, right)
@@ -68,33 +110,28 @@ def cvd(df: pd.DataFrame):
     delta = np.where(df["close"].diff().fillna(0) >= 0, df["volume"], -df["volume"])
     return pd.Series(delta).cumsum().iloc[-1]
 
+def smc_structure(df) -> dict:
+    # every FVG/OB of the frame with its mitigation status (structure.py)
+    memo = _frame_memo(df)
+    if "structure" not in memo:
+        memo["structure"] = structure_frame(df)
+    return memo["structure"]
+
 def fvg(df: pd.DataFrame, max_bars_back: int=200):
-    for i in range(len(df)-3, len(df)-max_bars_back-1, -1):
-        if i < 2: break
-        h1 = df["high"].iloc[i-2]
-        l3 = df["low"].iloc[i]
-        if l3 > h1:
-            return {"type":"bullish", "gap_top": l3, "gap_bottom": h1}
-        l1 = df["low"].iloc[i-2]
-        h3 = df["high"].iloc[i]
-        if h3 < l1:
-            return {"type":"bearish", "gap_top": l1, "gap_bottom": h3}
-    return None
+    # most recent gap whose third candle is at least two bars old
+    z = smc_structure(df)["fvg"]
+    n = len(df)
+    k = np.flatnonzero((z["index"] <= n - 3) & (z["index"] >= n - max_bars_back))
+    if not len(k):
+        return None
+    k = k[-1]
+    return {"type": "bullish" if z["side"][k] > 0 else "bearish", "gap_top": float(z["top"][k]), "gap_bottom": float(z["bottom"][k])}
 
 def ob_zones(df: pd.DataFrame, lookback: int=200):
-    rng = df["high"] - df["low"]
-    avg = rng.rolling(20).mean()
-    zones = []
-    for i in range(max(1, len(df)-lookback), len(df)-1):
-        if avg.iloc[i-1] == 0 or pd.isna(avg.iloc[i-1]): 
-            continue
-        if rng.iloc[i] > 1.5*avg.iloc[i-1]:
-            j = i-1
-            if df["close"].iloc[j] < df["open"].iloc[j]:
-                zones.append({"type":"demand","level_low": float(df['low'].iloc[j]), "level_high": float(df['high'].iloc[j])})
-            else:
-                zones.append({"type":"supply","level_low": float(df['low'].iloc[j]), "level_high": float(df['high'].iloc[j])})
-    return zones[-2:] if zones else []
+    z = smc_structure(df)["ob"]
+    k = np.flatnonzero(z["index"] >= len(df) - lookback)[-2:]
+    return [{"type": "demand" if z["side"][i] > 0 else "supply", "level_low": float(z["bottom"][i]), "level_high": float(z["top"][i])}
+            for i in k]
 
 def bos_choch(df: pd.DataFrame, left: int=3, right: int=3):
     highs, lows = pivots(df, left, right)
@@ -109,6 +146,15 @@ def bos_choch(df: pd.DataFrame, left: int=3, right: int=3):
         choch = "Bearish ChoCH (lower low)"
     return bos, choch
 
+def profile_summary(df, profile=None) -> dict:
+    vp = profile if profile is not None else volume_profile(df)
+    below, above = split_levels(vp, float(np.asarray(df["close"])[-1]))
+    return {
+        "volume_profile": vp,
+        "session_profile": session_profile(df),
+        "profile_levels": {"supports": [list(x) for x in below], "resistances": [list(x) for x in above]},
+    }
+
 # --------- RSI, MACD, StochRSI, KDJ, PSAR ---------
 def rsi(series: pd.Series, period: int = 9) -> pd.Series:
     delta = series.diff()
@@ -128,8 +174,9 @@ def macd(series: pd.Series, fast: int = 6, slow: int = 13, signal: int = 4):
     hist = macd_line - signal_line
     return macd_line, signal_line, hist
 
-def stoch_rsi(series: pd.Series, rsi_len: int = 8, stoch_len: int = 5, k: int = 5, d: int = 3):
-    r = rsi(series, rsi_len)
+def stoch_rsi(series: pd.Series, rsi_len: int = 8, stoch_len: int = 5, k: int = 5, d: int = 3, r: pd.Series = None):
+    if r is None:
+        r = rsi(series, rsi_len)
     min_r = r.rolling(stoch_len).min()
     max_r = r.rolling(stoch_len).max()
     stoch = (r - min_r) / (max_r - min_r)
@@ -146,78 +193,88 @@ def kdj(df: pd.DataFrame, length: int = 5, k: int = 3, d: int = 3):
     j_line = 3*k_line - 2*d_line
     return k_line.fillna(50), d_line.fillna(50), j_line.fillna(50)
 
-def parabolic_sar(df: pd.DataFrame, step: float = 0.02, max_step: float = 0.2):
-    high = df["high"].values
-    low = df["low"].values
-    close = df["close"].values
-    length = len(df)
-    if length < 2:
-        return pd.Series(close, index=df.index)
+def _psar_kernel(high: np.ndarray, low: np.ndarray, step: float, max_step: float) -> np.ndarray:
+    h = high.tolist(); l = low.tolist()
+    length = len(h)
+    out = np.empty(length, dtype=float)
     bull = True
     af = step
-    ep = high[0]
-    sar = low[0]
-    out = [sar]
+    ep = h[0]
+    sar = l[0]
+    out[0] = sar
     for i in range(1, length):
-        prev_sar = sar
+        sar = sar + af*(ep - sar)
         if bull:
-            sar = prev_sar + af*(ep - prev_sar)
-            sar = min(sar, low[i-1], low[i])
-            if high[i] > ep:
-                ep = high[i]
+            sar = min(sar, l[i-1], l[i])
+            if h[i] > ep:
+                ep = h[i]
                 af = min(af + step, max_step)
-            if low[i] < sar:
+            if l[i] < sar:
                 bull = False
                 sar = ep
-                ep = low[i]
+                ep = l[i]
                 af = step
         else:
-            sar = prev_sar + af*(ep - prev_sar)
-            sar = max(sar, high[i-1], high[i])
-            if low[i] < ep:
-                ep = low[i]
+            sar = max(sar, h[i-1], h[i])
+            if l[i] < ep:
+                ep = l[i]
                 af = min(af + step, max_step)
-            if high[i] > sar:
+            if h[i] > sar:
                 bull = True
                 sar = ep
-                ep = high[i]
+                ep = h[i]
                 af = step
-        out.append(sar)
+        out[i] = sar
+    return out
+
+def parabolic_sar(df: pd.DataFrame, step: float = 0.02, max_step: float = 0.2):
+    if len(df) < 2:
+        return pd.Series(df["close"].values, index=df.index)
+    out = _psar_kernel(df["high"].to_numpy(dtype=float), df["low"].to_numpy(dtype=float), step, max_step)
     return pd.Series(out, index=df.index)
 
 # --------- ATR, SuperTrend, VWAP ---------
-def atr(df: pd.DataFrame, period: int = 14) -> pd.Series:
+def true_range(df: pd.DataFrame) -> pd.Series:
     h, l, c = df["high"], df["low"], df["close"]
     hl = (h - l).abs()
     hc = (h - c.shift()).abs()
     lc = (l - c.shift()).abs()
-    tr = pd.concat([hl, hc, lc], axis=1).max(axis=1)
-    return tr.ewm(span=period, adjust=False).mean()
+    return pd.concat([hl, hc, lc], axis=1).max(axis=1)
 
-def supertrend(df: pd.DataFrame, period: int = 10, multiplier: float = 3.0):
-    # Based on ATR bands
-    atr_val = atr(df, period)
-    hl2 = (df["high"] + df["low"]) / 2.0
-    upper = hl2 + multiplier * atr_val
-    lower = hl2 - multiplier * atr_val
-
-    st = pd.Series(index=df.index, dtype=float)
-    dir_up = True
-    prev_upper = upper.iloc[0]
-    prev_lower = lower.iloc[0]
-    st.iloc[0] = lower.iloc[0]
-
-    for i in range(1, len(df)):
-        cur_upper = min(upper.iloc[i], prev_upper) if df["close"].iloc[i-1] > prev_upper else upper.iloc[i]
-        cur_lower = max(lower.iloc[i], prev_lower) if df["close"].iloc[i-1] < prev_lower else lower.iloc[i]
+def atr(df: pd.DataFrame, period: int = 14, tr: pd.Series = None) -> pd.Series:
+    if tr is None:
+        tr = true_range(df)
+    return tr.ewm(span=period, adjust=False).mean()
 
-        if st.iloc[i-1] == prev_upper:
-            st.iloc[i] = cur_upper if df["close"].iloc[i] <= cur_upper else cur_lower
+def _supertrend_kernel(close: np.ndarray, upper: np.ndarray, lower: np.ndarray) -> np.ndarray:
+    c = close.tolist(); up = upper.tolist(); lo = lower.tolist()
+    n = len(c)
+    st = np.empty(n, dtype=float)
+    if n == 0:
+        return st
+    prev_upper = up[0]
+    prev_lower = lo[0]
+    prev_st = lo[0]
+    st[0] = prev_st
+    for i in range(1, n):
+        cur_upper = min(up[i], prev_upper) if c[i-1] > prev_upper else up[i]
+        cur_lower = max(lo[i], prev_lower) if c[i-1] < prev_lower else lo[i]
+        if prev_st == prev_upper:
+            prev_st = cur_upper if c[i] <= cur_upper else cur_lower
         else:
-            st.iloc[i] = cur_lower if df["close"].iloc[i] >= cur_lower else cur_upper
-
+            prev_st = cur_lower if c[i] >= cur_lower else cur_upper
+        st[i] = prev_st
         prev_upper, prev_lower = cur_upper, cur_lower
+    return st
 
+def supertrend(df: pd.DataFrame, period: int = 10, multiplier: float = 3.0, atr_val: pd.Series = None):
+    # Based on ATR bands; pass atr_val to reuse an ATR(period) computed elsewhere
+    if atr_val is None:
+        atr_val = atr(df, period)
+    hl2 = (df["high"] + df["low"]) / 2.0
+    upper = (hl2 + multiplier * atr_val).to_numpy(dtype=float)
+    lower = (hl2 - multiplier * atr_val).to_numpy(dtype=float)
+    st = pd.Series(_supertrend_kernel(df["close"].to_numpy(dtype=float), upper, lower), index=df.index)
     trend_dir = np.where(df["close"] >= st, "UP", "DOWN")
     return st, trend_dir, atr_val
 
@@ -225,48 +282,123 @@ def vwap(df: pd.DataFrame):
     tp = (df["high"] + df["low"] + df["close"]) / 3
     cum_vol = df["volume"].cumsum()
     cum_pv = (tp * df["volume"]).cumsum()
-    return (cum_pv / cum_vol).fillna(method="ffill")
+    return (cum_pv / cum_vol).ffill()
 
-def pack_summary(df: pd.DataFrame) -> dict:
-    ema9 = ema(df, 9)
-    ema21 = ema(df, 21)
-    ema80 = ema(df, 80)
-    ema200 = ema(df, 200)
-    vol21 = volume_ma(df, 21)
+# --------- Lazy indicator registry ---------
+# Each node declares the nodes it needs; an IndicatorGraph computes a node (and
+# its dependencies) at most once per candle frame.
+REGISTRY = {}
+
+# toggle name (as in /analisa on=/off=) -> key under summary["extras"]
+EXTRAS = {
+    "rsi": "rsi9", "macd": "macd_6_13_4", "stochrsi": "stoch_rsi_8_5_5_3", "kdj": "kdj_5_3_3",
+    "psar": "psar", "atr": "atr14", "supertrend": "supertrend_10_3", "vwap": "vwap",
+}
+
+def register(name: str, *deps: str):
+    def deco(fn):
+        REGISTRY[name] = (deps, fn)
+        return fn
+    return deco
+
+class IndicatorGraph:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.values = {}
+
+    def get(self, name: str):
+        if name not in self.values:
+            deps, fn = REGISTRY[name]
+            self.values[name] = fn(self.df, *[self.get(d) for d in deps])
+        return self.values[name]
+
+    def extras(self, include=None) -> dict:
+        names = EXTRAS if include is None else [k for k in EXTRAS if k in include]
+        return {EXTRAS[k]: self.get(k) for k in names}
+
+register("true_range")(lambda df: true_range(df))
+register("atr_14", "true_range")(lambda df, tr: atr(df, 14, tr=tr))
+register("atr_10", "true_range")(lambda df, tr: atr(df, 10, tr=tr))
+register("rsi_9")(lambda df: rsi(df["close"], 9))
+register("rsi_8")(lambda df: rsi(df["close"], 8))
+register("supertrend_10_3", "atr_10")(lambda df, a: supertrend(df, 10, 3.0, atr_val=a))
+
+@register("rsi", "rsi_9")
+def _rsi_last(df, r):
+    return float(r.iloc[-1])
+
+@register("macd")
+def _macd_last(df):
+    m, s, h = macd(df["close"], 6, 13, 4)
+    return {"macd": float(m.iloc[-1]), "signal": float(s.iloc[-1]), "hist": float(h.iloc[-1])}
+
+@register("stochrsi", "rsi_8")
+def _stoch_rsi_last(df, r):
+    raw, k, d = stoch_rsi(df["close"], 8, 5, 5, 3, r=r)
+    return {"raw": float(raw.iloc[-1]), "k": float(k.iloc[-1]), "d": float(d.iloc[-1])}
+
+@register("kdj")
+def _kdj_last(df):
+    k, d, j = kdj(df, 5, 3, 3)
+    return {"k": float(k.iloc[-1]), "d": float(d.iloc[-1]), "j": float(j.iloc[-1])}
+
+@register("psar")
+def _psar_last(df):
+    return float(parabolic_sar(df).iloc[-1])
+
+@register("atr", "atr_14")
+def _atr_last(df, a):
+    return float(a.iloc[-1])
+
+@register("supertrend", "supertrend_10_3")
+def _supertrend_last(df, st):
+    line, direction, _ = st
+    return {"line": float(line.iloc[-1]), "dir": str(direction[-1])}
+
+@register("vwap")
+def _vwap_last(df):
+    return float(vwap(df).iloc[-1])
+
+def pack_summary(df: pd.DataFrame, state=None, include=None, profile=None) -> dict:
+    # state: an indicator_state.IndicatorState synced to df; supplies the
+    # EMA/volume/oscillator section without recomputing it from scratch.
+    # include: toggle names (see EXTRAS) to compute; None means all of them.
+    # profile: volume profile levels of df (volume_profile.ProfileState.levels()).
+    pivot_table(df, PIVOT_WINDOWS)
     supports, resistances = support_resistance(df)
     tl = trendlines(df)
     poc = volume_profile_poc(df)
     cvd_val = cvd(df)
     fvg_last = fvg(df)
     bos, choch = bos_choch(df)
-
-    rsi9 = rsi(df["close"], 9).iloc[-1]
-    macd_line, signal_line, macd_hist = macd(df["close"], 6, 13, 4)
-    macd_vals = (macd_line.iloc[-1], signal_line.iloc[-1], macd_hist.iloc[-1])
-    stoch_raw, stoch_k, stoch_d = stoch_rsi(df["close"], 8, 5, 5, 3)
-    kdj_k, kdj_d, kdj_j = kdj(df, 5, 3, 3)
-    psar = parabolic_sar(df).iloc[-1]
-
-    atr14 = atr(df, 14).iloc[-1]
-    st_line, st_dir, atr_val = supertrend(df, 10, 3.0)
-    st_last = float(st_line.iloc[-1]); st_dir_last = str(st_dir[-1])
-    vwap_last = float(vwap(df).iloc[-1])
-
-    return {
-        "ema": {"9": float(ema9.iloc[-1]), "21": float(ema21.iloc[-1]), "80": float(ema80.iloc[-1]), "200": float(ema200.iloc[-1])},
-        "volume_vs_ma21": {"last": float(df["volume"].iloc[-1]), "ma21": float(vol21.iloc[-1]) if not pd.isna(vol21.iloc[-1]) else None},
+    out = {
         "supports": supports, "resistances": resistances,
         "trendlines": tl, "poc": float(poc), "cvd": float(cvd_val),
         "fvg": fvg_last,
         "bos": bos, "choch": choch,
-        "extras": {
-            "rsi9": float(rsi9),
-            "macd_6_13_4": {"macd": float(macd_vals[0]), "signal": float(macd_vals[1]), "hist": float(macd_vals[2])},
-            "stoch_rsi_8_5_5_3": {"raw": float(stoch_raw.iloc[-1]), "k": float(stoch_k.iloc[-1]), "d": float(stoch_d.iloc[-1])},
-            "kdj_5_3_3": {"k": float(kdj_k.iloc[-1]), "d": float(kdj_d.iloc[-1]), "j": float(kdj_j.iloc[-1])},
-            "psar": float(psar),
-            "atr14": float(atr14),
-            "supertrend_10_3": {"line": st_last, "dir": st_dir_last},
-            "vwap": float(vwap_last)
-        }
     }
+    out.update(profile_summary(df, profile))
+    if state is not None:
+        # the state keeps only the toggles it was asked for (IndicatorState
+        # include); anything requested beyond that comes from the graph
+        out.update(state.summary())
+        names = [k for k in EXTRAS if include is None or k in include]
+        have = out["extras"]
+        out["extras"] = {EXTRAS[k]: have[EXTRAS[k]] for k in names if EXTRAS[k] in have}
+        missing = [k for k in names if EXTRAS[k] not in have]
+        if missing:
+            out["extras"].update(IndicatorGraph(df).extras(missing))
+        return out
+
+    ema9 = ema(df, 9)
+    ema21 = ema(df, 21)
+    ema80 = ema(df, 80)
+    ema200 = ema(df, 200)
+    vol21 = volume_ma(df, 21)
+
+    out.update({
+        "ema": {"9": float(ema9.iloc[-1]), "21": float(ema21.iloc[-1]), "80": float(ema80.iloc[-1]), "200": float(ema200.iloc[-1])},
+        "volume_vs_ma21": {"last": float(df["volume"].iloc[-1]), "ma21": float(vol21.iloc[-1]) if not pd.isna(vol21.iloc[-1]) else None},
+        "extras": IndicatorGraph(df).extras(include),
+    })
+    return out
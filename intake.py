@@ -0,0 +1,123 @@
+import asyncio, logging, time
+from collections import OrderedDict, deque
+from config import INTAKE_WORKERS, INTAKE_MAX_QUEUE, INTAKE_CHAT_RATE, INTAKE_CHAT_BURST, INTAKE_DEDUP_SIZE
+from metrics import Counter, error, observe
+
+logger = logging.getLogger(__name__)
+
+INTAKE_UPDATES = Counter("smc_intake_updates_total", "Webhook updates by intake result.")
+
+def chat_key(data: dict):
+    # chat id of a raw Telegram update (sender id when there is no chat)
+    for v in data.values():
+        if isinstance(v, dict):
+            chat = v.get("chat") or (v.get("message") or {}).get("chat")
+            if chat:
+                return chat.get("id")
+            if "from" in v:
+                return ("user", v["from"].get("id"))
+    return None
+
+class UpdateIntake:
+    # The webhook only enqueues. Updates wait in one FIFO per chat; a chat id
+    # sits in `ready` while it has work and nobody is serving it, so workers go
+    # round-robin over chats, one update at a time, and a chat's updates stay
+    # in order. New updates are dropped when already seen, when the chat is
+    # over its token bucket, or when the total backlog is full.
+
+    def __init__(self, process, workers: int = INTAKE_WORKERS, max_queue: int = INTAKE_MAX_QUEUE,
+                 chat_rate: float = INTAKE_CHAT_RATE, chat_burst: float = INTAKE_CHAT_BURST,
+                 dedup_size: int = INTAKE_DEDUP_SIZE):
+        self.process = process
+        self.workers = workers
+        self.max_queue = max_queue
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.dedup_size = dedup_size
+        self.seen = OrderedDict()
+        self.chats = {}       # chat -> deque of (enqueued_at, update)
+        self.buckets = {}     # chat -> [tokens, last refill]
+        self.ready = None
+        self.pending = 0
+        self.active = 0
+        self._tasks = []
+
+    def submit(self, data: dict) -> str:
+        uid = data.get("update_id")
+        if uid is not None:
+            if uid in self.seen:
+                return self._count("duplicate")
+            self.seen[uid] = None
+            if len(self.seen) > self.dedup_size:
+                self.seen.popitem(last=False)
+        if self.pending >= self.max_queue:
+            return self._count("shed")
+        chat = chat_key(data)
+        if not self._take_token(chat):
+            return self._count("limited")
+        queue = self.chats.get(chat)
+        if queue is None:
+            queue = self.chats[chat] = deque()
+            self.ready.put_nowait(chat)
+        queue.append((time.monotonic(), data))
+        self.pending += 1
+        return self._count("queued")
+
+    def _take_token(self, chat) -> bool:
+        now = time.monotonic()
+        bucket = self.buckets.get(chat)
+        if bucket is None:
+            bucket = self.buckets[chat] = [self.chat_burst, now]
+            if len(self.buckets) > self.dedup_size:
+                self._prune_buckets(now)
+        bucket[0] = min(self.chat_burst, bucket[0] + (now - bucket[1]) * self.chat_rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def _prune_buckets(self, now: float):
+        full = self.chat_burst / self.chat_rate if self.chat_rate else 0
+        for chat in [c for c, (_, last) in self.buckets.items() if now - last > full and c not in self.chats]:
+            del self.buckets[chat]
+
+    def _count(self, result: str) -> str:
+        INTAKE_UPDATES.inc(result=result)
+        return result
+
+    async def start(self):
+        if self._tasks:
+            return
+        self.ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            chat = await self.ready.get()
+            queue = self.chats[chat]
+            enqueued, data = queue.popleft()
+            self.pending -= 1
+            self.active += 1
+            observe("intake_wait", time.monotonic() - enqueued)
+            try:
+                await self.process(data)
+            except Exception as e:
+                error("intake", e)
+                logger.warning("update %s failed: %r", data.get("update_id"), e)
+            finally:
+                self.active -= 1
+                if queue:
+                    self.ready.put_nowait(chat)   # back of the line
+                else:
+                    del self.chats[chat]
+
+    def stats(self) -> dict:
+        return {"pending": self.pending, "active": self.active, "chats": len(self.chats),
+                "workers": self.workers, "max_queue": self.max_queue}
@@ -1,10 +1,124 @@
-import asyncio, json, websockets
+import asyncio, json, logging, time, websockets
+from collections import deque
 from typing import List, Dict
+from config import LIQ_BUFFER_SIZE, LIQ_IDLE_SECONDS
 
 WS_URL = "wss://stream.bybit.com/v5/public/linear"
 
+logger = logging.getLogger(__name__)
+
+def parse_liquidations(data: dict) -> List[Dict]:
+    rows = data.get("data", [])
+    if isinstance(rows, dict):
+        rows = [rows]
+    return [{
+        "side": r.get("side"), "price": float(r.get("price", 0)),
+        "qty": float(r.get("qty", r.get("size", 0))), "time": int(r.get("updatedTime", 0))
+    } for r in rows]
+
+class LiquidationStream:
+    # One multiplexed Bybit connection; liquidation.<SYM> topics are subscribed on
+    # demand and events kept in a fixed-size ring buffer per symbol.
+
+    def __init__(self, url: str = WS_URL, buffer_size: int = LIQ_BUFFER_SIZE, idle_after: float = LIQ_IDLE_SECONDS):
+        self.url = url
+        self.buffer_size = buffer_size
+        self.idle_after = idle_after
+        self.buffers: Dict[str, deque] = {}
+        self.last_used: Dict[str, float] = {}
+        self.subscribed = set()
+        self._ws = None
+        self._task = None
+        self._last_sweep = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def watch(self, sym: str):
+        self.last_used[sym] = time.monotonic()
+        if sym not in self.buffers:
+            self.buffers[sym] = deque(maxlen=self.buffer_size)
+        if sym not in self.subscribed and self._ws is not None:
+            self.subscribed.add(sym)
+            asyncio.create_task(self._send("subscribe", [sym]))
+
+    def recent(self, sym: str, max_events: int = 10) -> List[Dict]:
+        self.watch(sym)
+        return list(self.buffers[sym])[-max_events:]
+
+    async def _send(self, op: str, syms):
+        ws = self._ws
+        if ws is None or not syms:
+            return
+        try:
+            await ws.send(json.dumps({"op": op, "args": [f"liquidation.{s}" for s in syms]}))
+        except Exception as e:
+            logger.warning("liquidation %s %s failed: %r", op, syms, e)
+
+    async def _drop_idle(self):
+        now = time.monotonic()
+        if now - self._last_sweep < 30:
+            return
+        self._last_sweep = now
+        idle = [s for s in self.subscribed if now - self.last_used.get(s, 0) > self.idle_after]
+        if idle:
+            self.subscribed.difference_update(idle)
+            for s in idle:
+                self.buffers.pop(s, None)
+                self.last_used.pop(s, None)
+            await self._send("unsubscribe", idle)
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=20) as ws:
+                    self._ws = ws
+                    self.subscribed = set(self.buffers)
+                    await self._send("subscribe", sorted(self.subscribed))
+                    backoff = 1.0
+                    while True:
+                        try:
+                            msg = await asyncio.wait_for(ws.recv(), timeout=30)
+                        except asyncio.TimeoutError:
+                            await self._drop_idle()
+                            continue
+                        data = json.loads(msg)
+                        topic = data.get("topic", "")
+                        if topic.startswith("liquidation."):
+                            buf = self.buffers.get(topic.split(".", 1)[1])
+                            if buf is not None:
+                                buf.extend(parse_liquidations(data))
+                        await self._drop_idle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("liquidation stream disconnected: %r (retry in %.0fs)", e, backoff)
+            finally:
+                self._ws = None
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+liquidation_stream = LiquidationStream()
+
 async def recent_liquidations(symbol: str, max_events: int = 10, timeout: float = 3.0) -> List[Dict]:
     sym = symbol.replace("/", "")
+    if liquidation_stream.running:
+        return liquidation_stream.recent(sym, max_events)
     out = []
     async with websockets.connect(WS_URL, ping_interval=20, ping_timeout=20) as ws:
         sub = {"op":"subscribe","args":[f"liquidation.{sym}"]}
@@ -14,12 +128,8 @@ async def recent_liquidations(symbol: str, max_events: int = 10, timeout: float
                 msg = await asyncio.wait_for(ws.recv(), timeout=timeout)
                 data = json.loads(msg)
                 if data.get("topic", "").startswith("liquidation."):
-                    rows = data.get("data", [])
-                    for r in rows:
-                        out.append({
-                            "side": r.get("side"), "price": float(r.get("price", 0)),
-                            "qty": float(r.get("qty", 0)), "time": int(r.get("updatedTime", 0))
-                        })
+                    for r in parse_liquidations(data):
+                        out.append(r)
                         if len(out) >= max_events:
                             break
         except asyncio.TimeoutError:
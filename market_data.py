@@ -1,24 +1,41 @@
 import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
 import httpx
 import pandas as pd
 import numpy as np
+from candles import Candles, loads
+from config import CANDLE_CACHE_TTL, CANDLE_CACHE_MAX_BYTES, HTTP2, HTTP_MAX_CONNECTIONS, HTTP_MAX_PER_HOST, HTTP_KEEPALIVE_EXPIRY
+from config import MTF_MAX_BASE_BARS, MTF_MIN_BARS, CANDLE_STORE_DIR, STORE_BACKFILL_BARS, SHARED_CACHE_URL, WEB_CONCURRENCY
+from candle_store import CandleStore
+from shared_cache import shared_cache, pack_candles, unpack_candles
+from metrics import CACHE_EVENTS, FALLBACK_HOPS, ERRORS, observe, error, gauge
+from scheduler import limiters, background, RateLimited
+from config import HEDGE_ENABLED, HEDGE_DELAY, HEDGE_MIN_DELAY, BREAKER_FAILURES, BREAKER_COOLDOWN
+
+logger = logging.getLogger(__name__)
 
 BASES = {
     "bybit": {
         "kline": "https://api.bybit.com/v5/market/kline",
-        "symbol_transform": lambda s: s.replace("/", "")
+        "symbol_transform": lambda s: s.replace("/", ""),
+        "timeout": httpx.Timeout(8, connect=3, pool=3)
     },
     "kraken": {
         "kline": "https://api.kraken.com/0/public/OHLC",
-        "symbol_transform": lambda s: s.replace("/", "").replace("USDT","USD").lower()
+        "symbol_transform": lambda s: s.replace("/", "").replace("USDT","USD").lower(),
+        "timeout": httpx.Timeout(10, connect=3, pool=3)
     },
     "mexc": {
         "kline": "https://api.mexc.com/api/v3/klines",
-        "symbol_transform": lambda s: s.replace("/", "")
+        "symbol_transform": lambda s: s.replace("/", ""),
+        "timeout": httpx.Timeout(8, connect=3, pool=3)
     },
     "bitmex": {
         "kline": "https://www.bitmex.com/api/v1/trade/bucketed",
-        "symbol_transform": lambda s: s.replace("/", "")
+        "symbol_transform": lambda s: s.replace("/", ""),
+        "timeout": httpx.Timeout(10, connect=4, pool=4)
     },
 }
 
@@ -27,89 +44,529 @@ INTERVAL_MAP = {
     "1h":"60", "2h":"120", "4h":"240", "6h":"360", "12h":"720",
     "1d":"D", "1w":"W"
 }
+KRAKEN_INTERVALS = {"1m":1, "5m":5, "15m":15, "1h":60, "4h":240, "1d":1440}
+MEXC_INTERVALS = {"1m":"1m","5m":"5m","15m":"15m","1h":"1h","4h":"4h","1d":"1d"}
+BITMEX_INTERVALS = {"1m":"1m", "5m":"5m", "1h":"1h", "4h":"4h", "1d":"1d"}
+SOURCE_INTERVALS = {"bybit": INTERVAL_MAP, "kraken": KRAKEN_INTERVALS, "mexc": MEXC_INTERVALS, "bitmex": BITMEX_INTERVALS}
 
-def norm_df(ts, opens, highs, lows, closes, vols):
-    df = pd.DataFrame({
-        "time": pd.to_datetime(ts, unit="ms", utc=True),
-        "open": pd.to_numeric(opens),
-        "high": pd.to_numeric(highs),
-        "low": pd.to_numeric(lows),
-        "close": pd.to_numeric(closes),
-        "volume": pd.to_numeric(vols),
-    })
-    df.sort_values("time", inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    return df
+INTERVAL_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000, "12h": 43_200_000,
+    "1d": 86_400_000, "1w": 604_800_000
+}
+
+def supports_interval(source: str, interval: str) -> bool:
+    return interval in SOURCE_INTERVALS[source]
+
+def bar_ms(source: str, interval: str) -> int:
+    # unsupported intervals fall back to 4h on every exchange
+    return INTERVAL_MS[interval if interval in SOURCE_INTERVALS[source] else "4h"]
+
+# --------- Shared HTTP client (opened/closed by the app lifecycle) ---------
+_client = None
+_host_slots = {}
+
+def open_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        http2 = HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                http2 = False
+        limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                              max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                              keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+        _client = httpx.AsyncClient(http2=http2, limits=limits, timeout=httpx.Timeout(10, connect=3))
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.aclose()
 
-async def fetch_bybit(symbol: str, interval: str, limit: int = 500):
+async def http_get(source: str, url: str, params: dict) -> httpx.Response:
+    slot = _host_slots.get(source)
+    if slot is None:
+        slot = _host_slots[source] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    limiter = limiters.get(source)
+    if limiter is not None:
+        await limiter.acquire()
+    async with slot:
+        r = await open_http_client().get(url, params=params, timeout=BASES[source]["timeout"])
+    if limiter is not None:
+        limiter.feedback(r.status_code, r.headers)
+    r.raise_for_status()
+    return r
+
+# --------- Columnar parsers: exchange payload -> Candles ---------
+def parse_bybit(payload) -> Candles:
+    data = payload.get("result", {}).get("list", [])
+    if not data:
+        raise RuntimeError("Bybit empty")
+    # newest first: [start, open, high, low, close, volume, turnover]
+    return Candles.from_rows(data, 0, (1, 2, 3, 4, 5), reverse=True)
+
+def parse_kraken(payload, limit: int) -> Candles:
+    res = payload["result"]
+    key = [k for k in res.keys() if k != "last"][0]
+    # [time(s), open, high, low, close, vwap, volume, count]
+    return Candles.from_rows(res[key][-limit:], 0, (1, 2, 3, 4, 6), time_scale=1000)
+
+def parse_mexc(payload) -> Candles:
+    # [openTime, open, high, low, close, volume, closeTime, quoteVolume]
+    return Candles.from_rows([row[:6] for row in payload], 0, (1, 2, 3, 4, 5))
+
+def parse_bitmex(payload, span: int) -> Candles:
+    # BitMEX stamps each bucket with its close time; shift to the open like the other sources
+    ts = np.array([x["timestamp"].rstrip("Z") for x in payload], dtype="datetime64[ms]").view(np.int64) - span
+    ohlcv = np.array([[x["open"], x["high"], x["low"], x["close"], x["volume"]] for x in payload], dtype=np.float64)
+    return Candles.from_columns(ts, ohlcv.T.reshape(5, len(payload)))
+
+async def fetch_bybit(symbol: str, interval: str, limit: int = 500, since: int = None, until: int = None):
     sym = BASES["bybit"]["symbol_transform"](symbol)
     iv = INTERVAL_MAP.get(interval, "240")
     params = {"category": "linear", "symbol": sym, "interval": iv, "limit": limit}
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(BASES["bybit"]["kline"], params=params)
-        r.raise_for_status()
-        data = r.json().get("result", {}).get("list", [])
-        if not data:
-            raise RuntimeError("Bybit empty")
-        data = list(reversed(data))
-        ts, opens, highs, lows, closes, vols = [], [], [], [], [], []
-        for row in data:
-            ts.append(int(row[0]))
-            opens.append(float(row[1]))
-            highs.append(float(row[2]))
-            lows.append(float(row[3]))
-            closes.append(float(row[4]))
-            vols.append(float(row[5]))
-        return norm_df(ts, opens, highs, lows, closes, vols)
-
-async def fetch_kraken(symbol: str, interval: str, limit: int = 500):
+    if since is not None:
+        params["start"] = since
+    if until is not None:
+        params["end"] = until
+    r = await http_get("bybit", BASES["bybit"]["kline"], params)
+    return parse_bybit(loads(r.content))
+
+async def fetch_kraken(symbol: str, interval: str, limit: int = 500, since: int = None, until: int = None):
+    # Kraken has no end parameter and only serves its latest 720 bars
     pair = BASES["kraken"]["symbol_transform"](symbol)
-    iv = {"1m":1, "5m":5, "15m":15, "1h":60, "4h":240, "1d":1440}.get(interval, 240)
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(BASES["kraken"]["kline"], params={"pair": pair, "interval": iv})
-        r.raise_for_status()
-        res = r.json()["result"]
-        key = [k for k in res.keys() if k != "last"][0]
-        rows = res[key][-limit:]
-        ts, opens, highs, lows, closes, vols = zip(*[(int(x[0])*1000,float(x[1]),float(x[2]),float(x[3]),float(x[4]),float(x[6])) for x in rows])
-        return norm_df(ts, opens, highs, lows, closes, vols)
-
-async def fetch_mexc(symbol: str, interval: str, limit: int = 500):
+    iv = KRAKEN_INTERVALS.get(interval, 240)
+    params = {"pair": pair, "interval": iv}
+    if since is not None:
+        params["since"] = since // 1000 - 1
+    r = await http_get("kraken", BASES["kraken"]["kline"], params)
+    return parse_kraken(loads(r.content), limit)
+
+async def fetch_mexc(symbol: str, interval: str, limit: int = 500, since: int = None, until: int = None):
     pair = BASES["mexc"]["symbol_transform"](symbol)
-    iv = {"1m":"1m","5m":"5m","15m":"15m","1h":"1h","4h":"4h","1d":"1d"}.get(interval, "4h")
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(BASES["mexc"]["kline"], params={"symbol": pair, "interval": iv, "limit": limit})
-        r.raise_for_status()
-        rows = r.json()
-        ts, opens, highs, lows, closes, vols = zip(*[(int(x[0]),float(x[1]),float(x[2]),float(x[3]),float(x[4]),float(x[5])) for x in rows])
-        return norm_df(ts, opens, highs, lows, closes, vols)
-
-async def fetch_bitmex(symbol: str, interval: str, limit: int = 500):
+    iv = MEXC_INTERVALS.get(interval, "4h")
+    params = {"symbol": pair, "interval": iv, "limit": limit}
+    if since is not None:
+        params["startTime"] = since
+    if until is not None:
+        params["endTime"] = until
+    r = await http_get("mexc", BASES["mexc"]["kline"], params)
+    return parse_mexc(loads(r.content))
+
+async def fetch_bitmex(symbol: str, interval: str, limit: int = 500, since: int = None, until: int = None):
     pair = symbol.replace("/", "")
     if pair.startswith("BTC"): pair = pair.replace("BTC", "XBT", 1)
-    bin_iv = {"1m":"1m", "5m":"5m", "1h":"1h", "4h":"4h", "1d":"1d"}.get(interval, "4h")
+    bin_iv = BITMEX_INTERVALS.get(interval, "4h")
     params = {"symbol": pair, "binSize": bin_iv, "count": limit, "reverse": "false"}
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(BASES["bitmex"]["kline"], params=params)
-        r.raise_for_status()
-        rows = r.json()
-        ts, opens, highs, lows, closes, vols = [],[],[],[],[],[]
-        import pandas as pd
-        for x in rows:
-            ts.append(int(pd.Timestamp(x["timestamp"]).value//10**6))
-            opens.append(float(x["open"]))
-            highs.append(float(x["high"]))
-            lows.append(float(x["low"]))
-            closes.append(float(x["close"]))
-            vols.append(float(x["volume"]))
-        return norm_df(ts, opens, highs, lows, closes, vols)
-
-async def get_ohlcv(symbol: str, interval: str, limit: int = 500):
-    funcs = [fetch_bybit, fetch_kraken, fetch_mexc, fetch_bitmex]
-    for fn in funcs:
-        try:
-            df = await fn(symbol, interval, limit)
-            return df, fn.__name__.replace("fetch_", "")
-        except Exception:
-            continue
-    raise RuntimeError("Nenhuma fonte de dados retornou candles.")
+    if since is not None:
+        params["startTime"] = pd.Timestamp(since + INTERVAL_MS[bin_iv], unit="ms", tz="UTC").strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    if until is not None:
+        params["endTime"] = pd.Timestamp(until + INTERVAL_MS[bin_iv], unit="ms", tz="UTC").strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    r = await http_get("bitmex", BASES["bitmex"]["kline"], params)
+    return parse_bitmex(loads(r.content), INTERVAL_MS[bin_iv])
+
+# --------- Candle cache (per source/symbol/interval, LRU by memory) ---------
+# Everything below works on Candles; get_ohlcv builds the DataFrame for the
+# pandas consumers at the very end.
+class CandleCache:
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl_ms = int(ttl * 1000)
+        self.entries = OrderedDict()
+        self.locks = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.tail_fetches = 0
+        self.full_fetches = 0
+
+    def lock(self, key):
+        lk = self.locks.get(key)
+        if lk is None:
+            lk = self.locks[key] = asyncio.Lock()
+        return lk
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, candles: Candles, bar: int, depth: int, now: int):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.nbytes -= old["nbytes"]
+        nbytes = candles.time.nbytes + candles.ohlcv.nbytes
+        self.entries[key] = {
+            "candles": candles, "bar_ms": bar, "depth": depth, "fetched_at": now, "nbytes": nbytes,
+            "last_open": int(candles.time[-1].view(np.int64)),
+        }
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            k, e = self.entries.popitem(last=False)
+            self.locks.pop(k, None)
+            self.nbytes -= e["nbytes"]
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+# with a shared cache behind it, each worker keeps only its share of the memory budget
+candle_cache = CandleCache(CANDLE_CACHE_MAX_BYTES // max(1, WEB_CONCURRENCY) if SHARED_CACHE_URL else CANDLE_CACHE_MAX_BYTES,
+                           CANDLE_CACHE_TTL)
+gauge("smc_candle_cache_bytes", "Bytes held by the in-memory candle cache.", lambda: candle_cache.nbytes)
+candle_store = None   # on-disk history, opened by the app lifecycle (open_candle_store)
+_backfills = {}
+
+def open_candle_store():
+    global candle_store
+    if candle_store is None and CANDLE_STORE_DIR:
+        candle_store = CandleStore(CANDLE_STORE_DIR)
+    return candle_store
+
+def close_candle_store():
+    global candle_store
+    if candle_store is not None:
+        candle_store.close()
+        candle_store = None
+
+def _persist(key, candles: Candles, bar: int) -> bool:
+    # True when the rows left a hole in the stored history (see CandleStore.write)
+    try:
+        return candle_store.write(key, candles, bar)
+    except OSError as e:
+        logger.warning("candle store write failed for %s: %r", key, e)
+        return False
+
+def _schedule_backfill(fn, key, bar: int, gap: bool = False):
+    if key in _backfills or (not gap and candle_store.depth(key) >= STORE_BACKFILL_BARS):
+        return
+    task = asyncio.ensure_future(background(candle_store.backfill(key, fn, STORE_BACKFILL_BARS, bar)))
+    _backfills[key] = task
+
+    def done(t):
+        _backfills.pop(key, None)   # a failed backfill is retried by the next full fetch
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("backfill failed for %s: %r", key, t.exception())
+    task.add_done_callback(done)
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+def _merge_tail(old: Candles, new: Candles, depth: int) -> Candles:
+    keep = int(np.searchsorted(old.time, new.time[0]))
+    merged = Candles(np.concatenate([old.time[:keep], new.time]),
+                     np.concatenate([old.ohlcv[:, :keep], new.ohlcv], axis=1))
+    return merged.tail(depth)
+
+def _fresh(entry, limit: int, now: int) -> bool:
+    return (entry is not None and entry["depth"] >= limit and now < entry["last_open"] + entry["bar_ms"]
+            and now - entry["fetched_at"] < candle_cache.ttl_ms)
+
+async def _pull_shared(skey: str, key, limit: int) -> bool:
+    # adopt the shared copy when it is newer than ours; True if it is fresh
+    got = await shared_cache.get(skey)
+    if got is not None:
+        entry = candle_cache.get(key)
+        candles, (fetched_at, depth, bar) = unpack_candles(got[1])
+        if len(candles) and (entry is None or fetched_at > entry["fetched_at"]):
+            candle_cache.put(key, candles, bar, depth, fetched_at)
+    fresh = _fresh(candle_cache.get(key), limit, _now_ms())
+    CACHE_EVENTS.inc(cache="shared_candles", result="hit" if fresh else "miss")
+    return fresh
+
+async def _push_shared(skey: str, key):
+    entry = candle_cache.get(key)
+    if entry is not None:
+        meta = (entry["fetched_at"], entry["depth"], entry["bar_ms"])
+        await shared_cache.put(skey, entry["last_open"], pack_candles(entry["candles"], meta))
+
+async def cached_fetch(fn, source: str, symbol: str, interval: str, limit: int = 500) -> Candles:
+    # fn: one of the fetch_* functions (returns Candles)
+    key = (source, symbol, interval)
+    async with candle_cache.lock(key):
+        if shared_cache is None or _fresh(candle_cache.get(key), limit, _now_ms()):
+            return await _fetch_locked(fn, key, limit)
+        # another worker may have fetched it already; otherwise one worker
+        # fetches while the others wait for its copy
+        skey = "candles:" + ":".join(key)
+        if not await _pull_shared(skey, key, limit):
+            async with shared_cache.refreshing(skey, "shared_candles") as owned:
+                if owned or not await _pull_shared(skey, key, limit):
+                    candles = await _fetch_locked(fn, key, limit)
+                    await _push_shared(skey, key)
+                    return candles
+        return await _fetch_locked(fn, key, limit)
+
+async def _fetch_locked(fn, key, limit: int):
+    # caller holds candle_cache.lock(key)
+    source, symbol, interval = key
+    now = _now_ms()
+    entry = candle_cache.get(key)
+    if entry is None and candle_store is not None:
+        # warm start: seed the memory cache from disk so only the tail is fetched
+        stored = candle_store.read(key, limit)
+        if stored is not None and len(stored) >= limit:
+            candle_cache.put(key, stored, bar_ms(source, interval), limit, 0)
+            CACHE_EVENTS.inc(cache="candles", result="disk")
+            entry = candle_cache.get(key)
+    if entry is not None and entry["depth"] >= limit:
+        bar = entry["bar_ms"]
+        last_open = entry["last_open"]
+        if now < last_open + bar and now - entry["fetched_at"] < candle_cache.ttl_ms:
+            candle_cache.hits += 1
+            CACHE_EVENTS.inc(cache="candles", result="hit")
+            return entry["candles"].tail(limit)
+        missing = (now - last_open) // bar + 1
+        if missing < entry["depth"]:
+            new = await fn(symbol, interval, int(missing) + 1, since=last_open)
+            if len(new) and int(new.time[0].view(np.int64)) <= last_open:
+                candle_cache.tail_fetches += 1
+                CACHE_EVENTS.inc(cache="candles", result="tail")
+                candles = _merge_tail(entry["candles"], new, entry["depth"])
+                candle_cache.put(key, candles, bar, entry["depth"], now)
+                if candle_store is not None:
+                    _persist(key, new, bar)
+                return candles.tail(limit)
+    candles = await fn(symbol, interval, limit)
+    candle_cache.full_fetches += 1
+    CACHE_EVENTS.inc(cache="candles", result="full")
+    if not len(candles):
+        return candles
+    bar = bar_ms(source, interval)
+    candle_cache.put(key, candles, bar, limit, now)
+    if candle_store is not None:
+        _schedule_backfill(fn, key, bar, gap=_persist(key, candles, bar))
+    return candles
+
+# --------- Source racing: hedged requests + circuit breakers ---------
+class SourceHealth:
+    # Closed until BREAKER_FAILURES outages in a row; then open for
+    # BREAKER_COOLDOWN, after which one request probes the source (half-open)
+    # and its outcome closes or re-opens the breaker.
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = deque(maxlen=100)
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    @property
+    def tripped(self) -> bool:
+        return self.failures >= BREAKER_FAILURES
+
+    def available(self, now: float) -> bool:
+        return not self.tripped or (now >= self.open_until and not self.probing)
+
+    def start(self) -> bool:
+        # True when this request is the half-open probe
+        if self.tripped and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < 5:
+            return HEDGE_DELAY
+        xs = sorted(self.latencies)
+        return max(HEDGE_MIN_DELAY, xs[int(0.95 * (len(xs) - 1))])
+
+    def success(self, latency: float):
+        self.latencies.append(latency)
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+
+    def failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.tripped:
+            self.open_until = time.monotonic() + BREAKER_COOLDOWN
+
+def is_outage(exc: BaseException) -> bool:
+    # what says the exchange is down or throttling us; an unknown pair, an empty
+    # or malformed answer and a 4xx are the request's fault, not the source's
+    if isinstance(exc, httpx.TransportError):
+        return True
+    return isinstance(exc, httpx.HTTPStatusError) and (exc.response.status_code >= 500
+                                                       or exc.response.status_code in (418, 429))
+
+FETCHERS = [fetch_bybit, fetch_kraken, fetch_mexc, fetch_bitmex]
+source_health = {fn.__name__.replace("fetch_", ""): SourceHealth(fn.__name__.replace("fetch_", "")) for fn in FETCHERS}
+fetch_log = deque(maxlen=500)
+
+async def _timed_fetch(fn, source: str, symbol: str, interval: str, limit: int):
+    # the breaker and the hedge delay only learn from requests that reached the
+    # exchange: cache hits say nothing about its latency or health
+    health = source_health[source]
+    probe = health.start()
+    spent = []
+
+    async def network(*args, **kwargs):
+        t0 = time.monotonic()
+        candles = await fn(*args, **kwargs)
+        spent.append(time.monotonic() - t0)
+        return candles
+
+    try:
+        candles = await cached_fetch(network, source, symbol, interval, limit)
+    except RateLimited:
+        raise   # our own limiter said no before sending anything: not the exchange's fault
+    except Exception as e:
+        if is_outage(e):
+            health.failure()
+        raise
+    finally:
+        if probe:
+            health.probing = False
+    if spent:
+        health.success(spent[-1])
+    if candles is None or not len(candles):
+        raise RuntimeError(f"{source} empty")
+    return candles, spent[-1] if spent else 0.0
+
+async def get_ohlcv(symbol: str, interval: str, limit: int = 500, strict: bool = False):
+    # DataFrame for the pandas consumers (analysis, resampling, backtests)
+    candles, source = await get_candles(symbol, interval, limit=limit, strict=strict)
+    return candles.to_frame(), source
+
+async def get_candles(symbol: str, interval: str, limit: int = 500, strict: bool = False):
+    # strict: only use sources that serve this interval natively (no silent 4h fallback)
+    now = time.monotonic()
+    fetchers = [fn for fn in FETCHERS if not strict or supports_interval(fn.__name__.replace("fetch_", ""), interval)]
+    if not fetchers:
+        raise RuntimeError(f"Nenhuma fonte suporta o timeframe {interval}.")
+    queue = [fn for fn in fetchers if source_health[fn.__name__.replace("fetch_", "")].available(now)] or list(fetchers)
+    pending, errors, launched = {}, [], []
+
+    def launch():
+        fn = queue.pop(0)
+        source = fn.__name__.replace("fetch_", "")
+        pending[asyncio.ensure_future(_timed_fetch(fn, source, symbol, interval, limit))] = source
+        launched.append(source)
+
+    launch()
+    try:
+        while pending:
+            delay = source_health[launched[-1]].hedge_delay() if HEDGE_ENABLED and queue else None
+            done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()
+                continue
+            for task in done:
+                source = pending.pop(task)
+                exc = task.exception()
+                if isinstance(exc, RateLimited):
+                    # no token in time for an interactive request: just try the next source
+                    errors.append(f"{source}: rate limited")
+                    continue
+                if exc is not None:
+                    error("fetch", exc, source=source)
+                    errors.append(f"{source}: {exc!r}")
+                    logger.warning("get_candles %s %s: %s failed: %r", symbol, interval, source, exc)
+                    continue
+                candles, latency = task.result()
+                observe("fetch", time.monotonic() - now, source=source, symbol=symbol, tf=interval)
+                if len(launched) > 1:
+                    FALLBACK_HOPS.inc(len(launched) - 1, source=source)
+                fetch_log.append({
+                    "symbol": symbol, "interval": interval, "source": source, "latency": latency,
+                    "total": time.monotonic() - now, "hops": len(launched) - 1, "errors": errors,
+                })
+                return candles, source
+            if queue and not pending:
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+    fetch_log.append({"symbol": symbol, "interval": interval, "source": None, "latency": None,
+                      "total": time.monotonic() - now, "hops": len(launched) - 1, "errors": errors})
+    ERRORS.inc(stage="fetch", error="exhausted", symbol=symbol, tf=interval)
+    raise RuntimeError("Nenhuma fonte de dados retornou candles." + (" (" + "; ".join(errors) + ")" if errors else ""))
+
+def cached_version(symbol: str, interval: str):
+    # (source, last_open, fetched_at) of each fresh cached copy: what
+    # get_candles would serve without fetching. None when a fetch is due.
+    now = _now_ms()
+    versions = []
+    for fn in FETCHERS:
+        source = fn.__name__.replace("fetch_", "")
+        entry = candle_cache.entries.get((source, symbol, interval))   # a peek: LRU order untouched
+        if _fresh(entry, 1, now):
+            versions.append((source, entry["last_open"], entry["fetched_at"]))
+    return tuple(versions) or None
+
+# --------- Multi-timeframe: one base fetch, local resampling ---------
+WEEK_OFFSET_MS = 4 * 86_400_000  # 1970-01-05 was a Monday; weekly bars open on Mondays
+
+def resample_ohlcv(df: pd.DataFrame, interval: str) -> pd.DataFrame:
+    step = INTERVAL_MS[interval]
+    offset = WEEK_OFFSET_MS if interval == "1w" else 0
+    t = df["time"].values.astype("datetime64[ms]").view("i8")
+    key = (t - offset) // step
+    starts = np.r_[0, np.flatnonzero(np.diff(key)) + 1]
+    ends = np.r_[starts[1:], len(t)]
+    # drop a leading bucket the base history only partially covers
+    if len(starts) > 1 and t[0] > key[0] * step + offset:
+        starts, ends = starts[1:], ends[1:]
+    o = df["open"].to_numpy(dtype=float); h = df["high"].to_numpy(dtype=float)
+    l = df["low"].to_numpy(dtype=float); c = df["close"].to_numpy(dtype=float)
+    v = df["volume"].to_numpy(dtype=float)
+    return pd.DataFrame({
+        "time": pd.to_datetime(key[starts] * step + offset, unit="ms", utc=True),
+        "open": o[starts],
+        "high": np.maximum.reduceat(h, starts),
+        "low": np.minimum.reduceat(l, starts),
+        "close": c[ends - 1],
+        "volume": np.add.reduceat(v, starts),
+    })
+
+def base_interval(intervals) -> str:
+    spans = [INTERVAL_MS[iv] for iv in intervals]
+    for iv, ms in sorted(INTERVAL_MS.items(), key=lambda kv: -kv[1]):
+        if ms <= min(spans) and all(x % ms == 0 for x in spans):
+            return iv
+    return "1m"
+
+async def get_multi_ohlcv(symbol: str, intervals, bars: int = 500):
+    unknown = [iv for iv in intervals if iv not in INTERVAL_MS]
+    if unknown:
+        raise RuntimeError(f"Timeframe inválido: {', '.join(unknown)}")
+    base = base_interval(intervals)
+    ratio = max(INTERVAL_MS[iv] for iv in intervals) // INTERVAL_MS[base]
+    df, source = await get_ohlcv(symbol, base, limit=min(MTF_MAX_BASE_BARS, bars * ratio), strict=True)
+    frames, direct = {}, []
+    for iv in intervals:
+        frame = df if iv == base else resample_ohlcv(df, iv)
+        # too few resampled bars for EMA80/200 and structure: fetch that timeframe itself
+        if iv != base and len(frame) < min(bars, MTF_MIN_BARS):
+            direct.append(iv)
+        else:
+            frames[iv] = frame.tail(bars).reset_index(drop=True)
+    if direct:
+        got = await asyncio.gather(*[get_ohlcv(symbol, iv, limit=bars, strict=True) for iv in direct],
+                                   return_exceptions=True)
+        for iv, r in zip(direct, got):
+            if isinstance(r, Exception) or len(r[0]) < min(bars, MTF_MIN_BARS):
+                raise RuntimeError(f"Histórico insuficiente para {iv} a partir de {base}.")
+            frames[iv] = r[0]
+    return {iv: frames[iv] for iv in intervals}, source, base
+
+# --------- Deep history (backtests): memory cache + on-disk store ---------
+async def get_history(symbol: str, interval: str, bars: int):
+    df, source = await get_ohlcv(symbol, interval, limit=min(bars, 1000), strict=True)
+    if len(df) >= bars or candle_store is None:
+        return df, source
+    key = (source, symbol, interval)
+    pending = _backfills.get(key)
+    if pending is not None and not pending.done():
+        await asyncio.shield(pending)
+    if candle_store.depth(key) < bars:
+        fn = next(f for f in FETCHERS if f.__name__ == f"fetch_{source}")
+        await background(candle_store.backfill(key, fn, bars, bar_ms(source, interval)))
+    stored = candle_store.read(key, bars)
+    return (stored.to_frame() if stored is not None and len(stored) > len(df) else df), source
@@ -17,7 +17,7 @@ def market_states(now_tz: str = "America/Campo_Grande"):
     user_tz = pytz.timezone(now_tz)
     now_local = datetime.now(user_tz)
     results = []
-    for name, (open_h, close_h), tz_name in EXCHANGES.items():
+    for name, (open_h, close_h, tz_name) in EXCHANGES.items():
         tz = pytz.timezone(tz_name)
         now_mkt = now_local.astimezone(tz)
         op = parse_hhmm(open_h)
@@ -0,0 +1,124 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import SCAN_WATCHLIST
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# symbol/tf come from users: values outside these sets share the label "other",
+# so a stream of made-up pairs cannot grow the series without bound
+LABEL_VALUES = {
+    "symbol": frozenset(s.strip().upper() for s in SCAN_WATCHLIST.split(",") if s.strip()),
+    "tf": frozenset(("1m", "3m", "5m", "15m", "30m", "1h", "2h", "4h", "6h", "12h", "1d", "1w")),  # market_data.INTERVAL_MS
+}
+
+def _label(k: str, v) -> str:
+    v = str(v)
+    known = LABEL_VALUES.get(k)
+    return v if known is None or v in known else "other"
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted((k, _label(k, v)) for k, v in labels.items() if v is not None))
+
+def _fmt_labels(key: tuple, extra: str = "") -> str:
+    parts = [f'{k}="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+_registry = []
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.values = defaultdict(float)
+        _registry.append(self)
+
+    def inc(self, n: float = 1, **labels):
+        self.values[_key(labels)] += n
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, v in list(self.values.items()):
+            yield f"{self.name}{_fmt_labels(key)} {v:g}"
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=BUCKETS):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self.series = {}
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = _key(labels)
+        s = self.series.get(key)
+        if s is None:
+            s = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        s[0][bisect_left(self.buckets, value)] += 1
+        s[1] += value
+        s[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, (counts, total, n) in list(self.series.items()):
+            acc = 0
+            for le, c in zip(self.buckets + ("+Inf",), counts):
+                acc += c
+                bound = f'le="{le}"'
+                yield f"{self.name}_bucket{_fmt_labels(key, bound)} {acc}"
+            yield f"{self.name}_sum{_fmt_labels(key)} {total:.6f}"
+            yield f"{self.name}_count{_fmt_labels(key)} {n}"
+
+STAGE_SECONDS = Histogram("smc_stage_seconds", "Latency of each request stage.")
+FALLBACK_HOPS = Counter("smc_fetch_fallback_hops_total", "Extra sources launched before one answered.")
+CACHE_EVENTS = Counter("smc_cache_events_total", "Cache lookups by cache and result.")
+ERRORS = Counter("smc_errors_total", "Errors by stage, including ones recovered from.")
+_gauges = {}
+
+def gauge(name: str, help: str, fn):
+    # fn() is read at scrape time
+    _gauges[name] = (help, fn)
+
+# per-request trace for the admin timing footer
+_trace = ContextVar("smc_trace", default=None)
+
+def start_trace() -> list:
+    trace = []
+    _trace.set(trace)
+    return trace
+
+def observe(stage: str, seconds: float, **labels):
+    STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+def error(stage: str, exc: BaseException, **labels):
+    ERRORS.inc(stage=stage, error=type(exc).__name__, **labels)
+
+@contextmanager
+def timed(stage: str, **labels):
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        error(stage, e, **labels)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - t0, **labels)
+
+def format_footer(trace: list) -> str:
+    if not trace:
+        return "_⏱ sem medições (resultado compartilhado)_"
+    return "_⏱ " + " · ".join(f"{stage} {sec * 1000:.0f}ms" for stage, sec in trace) + "_"
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for name, (help, fn) in _gauges.items():
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {float(fn()):g}"]
+    return "\n".join(lines) + "\n"
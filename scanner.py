@@ -0,0 +1,147 @@
+import asyncio
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from market_data import get_candles
+from scheduler import priority
+from structure import structure_arrays, nearest_zones
+from config import SCAN_CONCURRENCY, SCAN_LIMIT, SCAN_WATCHLIST, SCAN_MAX_SYMBOLS
+
+MIN_BARS = 100
+
+# --------- Batched kernels: every array is (symbols x bars) ---------
+def ema_2d(x: np.ndarray, alpha: float) -> np.ndarray:
+    out = np.empty_like(x)
+    w = x[:, 0].copy()
+    out[:, 0] = w
+    f = 1.0 - alpha
+    for t in range(1, x.shape[1]):
+        w = (f * w + alpha * x[:, t]) / (f + alpha)
+        out[:, t] = w
+    return out
+
+def rsi_2d(close: np.ndarray, period: int = 9) -> np.ndarray:
+    delta = np.diff(close, axis=1, prepend=close[:, :1])
+    gain = ema_2d(np.where(delta > 0, delta, 0.0), 1 / period)
+    loss = ema_2d(np.where(delta < 0, -delta, 0.0), 1 / period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = 100 - 100 / (1 + gain / loss)
+    return np.where(loss == 0, 50.0, out)
+
+def supertrend_dir_2d(high, low, close, period: int = 10, multiplier: float = 3.0) -> np.ndarray:
+    prev_close = np.concatenate([close[:, :1], close[:, :-1]], axis=1)
+    tr = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+    tr[:, 0] = high[:, 0] - low[:, 0]
+    atr = ema_2d(tr, 2 / (period + 1))
+    hl2 = (high + low) / 2.0
+    upper = hl2 + multiplier * atr
+    lower = hl2 - multiplier * atr
+    prev_upper, prev_lower = upper[:, 0].copy(), lower[:, 0].copy()
+    st = lower[:, 0].copy()
+    for t in range(1, close.shape[1]):
+        cur_upper = np.where(close[:, t-1] > prev_upper, np.minimum(upper[:, t], prev_upper), upper[:, t])
+        cur_lower = np.where(close[:, t-1] < prev_lower, np.maximum(lower[:, t], prev_lower), lower[:, t])
+        on_upper = st == prev_upper
+        st = np.where(on_upper,
+                      np.where(close[:, t] <= cur_upper, cur_upper, cur_lower),
+                      np.where(close[:, t] >= cur_lower, cur_lower, cur_upper))
+        prev_upper, prev_lower = cur_upper, cur_lower
+    return np.where(close[:, -1] >= st, 1, -1)
+
+def _last_pivot(values: np.ndarray, left: int, right: int, reduce) -> np.ndarray:
+    n = values.shape[1]
+    extreme = reduce.reduce(sliding_window_view(values, left + right + 1, axis=1), axis=2)
+    mask = values[:, left:n-right] == extreme
+    has = mask.any(axis=1)
+    idx = mask.shape[1] - 1 - np.argmax(mask[:, ::-1], axis=1) + left
+    return np.where(has, values[np.arange(len(values)), idx], np.nan)
+
+def structure_2d(high, low, close, left: int = 3, right: int = 3):
+    last_high = _last_pivot(high, left, right, np.fmax)
+    last_low = _last_pivot(low, left, right, np.fmin)
+    with np.errstate(invalid="ignore"):
+        bos = (last_high > 0) & (close[:, -1] > last_high)
+        choch = (last_low > 0) & (close[:, -1] < last_low)
+    return bos, choch
+
+def scan_arrays(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> dict:
+    ema9, ema21, ema80 = (ema_2d(close, 2 / (p + 1))[:, -1] for p in (9, 21, 80))
+    bias = np.where((ema9 > ema21) & (ema21 > ema80), 1, np.where((ema9 < ema21) & (ema21 < ema80), -1, 0))
+    rsi9 = rsi_2d(close, 9)[:, -1]
+    st_dir = supertrend_dir_2d(high, low, close)
+    bos, choch = structure_2d(high, low, close)
+    score = bias + st_dir + bos.astype(int) - choch.astype(int) + (rsi9 - 50) / 50
+    return {"rsi9": rsi9, "st_dir": st_dir, "bias": bias, "bos": bos, "choch": choch, "score": score}
+
+# --------- Watchlist scan ---------
+async def fetch_many(symbols, tf: str, limit: int = SCAN_LIMIT, concurrency: int = SCAN_CONCURRENCY):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(sym):
+        async with sem:
+            try:
+                with priority("scan"):
+                    # native interval only: a 4h fallback must not be ranked with 1h bars
+                    candles, source = await get_candles(sym, tf, limit=limit, strict=True)
+                return sym, candles, source
+            except Exception as e:
+                return sym, None, repr(e)
+
+    return await asyncio.gather(*[one(s) for s in symbols])
+
+async def scan(symbols, tf: str):
+    symbols = list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))
+    if len(symbols) > SCAN_MAX_SYMBOLS:
+        raise ValueError(f"Máximo de {SCAN_MAX_SYMBOLS} pares por scan.")
+    fetched = await fetch_many(symbols, tf)
+    ok = [(s, candles, src) for s, candles, src in fetched if candles is not None and len(candles) >= MIN_BARS]
+    failed = [s for s, candles, _ in fetched if candles is None or len(candles) < MIN_BARS]
+    # one batch per history length, so a newly listed pair does not cut
+    # everyone else's history down to its own
+    groups = {}
+    for item in ok:
+        groups.setdefault(len(item[1]), []).append(item)
+    rows = []
+    for batch in groups.values():
+        rows += scan_rows(batch)
+    rows.sort(key=lambda r: r["score"], reverse=True)
+    return rows, failed
+
+def scan_rows(batch) -> list:
+    # batch: (symbol, candles, source) with the same number of bars
+    high = np.vstack([candles["high"] for _, candles, _ in batch])
+    low = np.vstack([candles["low"] for _, candles, _ in batch])
+    close = np.vstack([candles["close"] for _, candles, _ in batch])
+    res = scan_arrays(high, low, close)
+    return [{
+        "symbol": sym, "source": src, "close": float(close[i, -1]), "rsi9": float(res["rsi9"][i]),
+        "supertrend": "UP" if res["st_dir"][i] > 0 else "DOWN",
+        "bias": {1: "Alta", -1: "Baixa", 0: "Neutro"}[int(res["bias"][i])],
+        "bos": bool(res["bos"][i]), "choch": bool(res["choch"][i]), "score": float(res["score"][i]),
+        "zone": nearest_zone(candles),
+    } for i, (sym, candles, src) in enumerate(batch)]
+
+def nearest_zone(candles):
+    # closest unmitigated FVG/OB over the symbol's whole fetched history
+    close = candles["close"]
+    struct = structure_arrays(candles["open"], candles["high"], candles["low"], close)
+    near = nearest_zones(struct, float(close[-1]), len(close) - 1, n=1)
+    best = min(((kind, z[0]) for kind, z in near.items() if z), key=lambda kz: abs(kz[1]["distance"]), default=None)
+    return None if best is None else dict(best[1], kind=best[0])
+
+def format_scan(rows, failed, tf: str, top: int = 40) -> str:
+    lines = [f"🔎 *Scan* [{tf}] · {len(rows)} pares", "```"]
+    lines.append(f"{'PAR':<12}{'RSI':>6} {'ST':<5}{'VIÉS':<7}{'EST':<6}{'SCORE':>6} ZONA")
+    for r in rows[:top]:
+        est = "BoS" if r["bos"] else "ChoCH" if r["choch"] else "-"
+        z = r.get("zone")
+        zone = f"{z['kind'].upper()}{z['distance_pct']:+.1f}%" if z else "-"
+        lines.append(f"{r['symbol']:<12}{r['rsi9']:>6.1f} {r['supertrend']:<5}{r['bias']:<7}{est:<6}{r['score']:>6.2f} {zone}")
+    lines.append("```")
+    if len(rows) > top:
+        lines.append(f"_(+{len(rows) - top} pares omitidos)_")
+    if failed:
+        lines.append("Sem dados: " + ", ".join(failed))
+    return "\n".join(lines)
+
+def default_watchlist():
+    return [s for s in SCAN_WATCHLIST.split(",") if s.strip()]
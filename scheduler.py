@@ -0,0 +1,150 @@
+import asyncio, heapq, itertools, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from config import EXCHANGE_RATE_LIMITS, SCHED_INTERACTIVE_MAX_WAIT
+from metrics import Counter, Histogram, gauge
+
+# lower runs first; anything not marked otherwise is a user waiting in a chat
+PRIORITIES = {"interactive": 0, "alerts": 1, "scan": 2, "backfill": 3}
+
+SCHED_WAIT = Histogram("smc_sched_wait_seconds", "Time requests waited for an exchange rate-limit token.",
+                       buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+SCHED_EVENTS = Counter("smc_sched_events_total", "Rate-limit events by exchange and kind.")
+
+_priority = ContextVar("smc_priority", default="interactive")
+
+@contextmanager
+def priority(name: str):
+    # requests made inside (and in tasks spawned from here) queue at this priority
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+async def background(coro, name: str = "backfill"):
+    with priority(name):
+        return await coro
+
+class RateLimited(RuntimeError):
+    pass
+
+# remaining / reset headers some exchanges send back (reset as epoch s or ms)
+LIMIT_HEADERS = {
+    "bybit": ("x-bapi-limit-status", "x-bapi-limit-reset-timestamp"),
+    "bitmex": ("x-ratelimit-remaining", "x-ratelimit-reset"),
+}
+
+class ExchangeLimiter:
+    # Token bucket with a priority queue in front. A request takes a token at
+    # once when nobody is waiting; otherwise it queues and one pump task hands
+    # tokens out as they refill, lowest priority number first, FIFO within a
+    # priority. 429s and the exchange's own counters pause or drain the bucket.
+
+    def __init__(self, name: str, rate: float, burst: float, max_wait: float = SCHED_INTERACTIVE_MAX_WAIT):
+        self.name, self.rate, self.burst, self.max_wait = name, rate, burst, max_wait
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters = []    # heap of (priority, seq, cost, future)
+        self._seq = itertools.count()
+        self._pump_task = None
+
+    def _refill(self, now: float):
+        if now > self.paused_until:
+            start = max(self.updated, self.paused_until)
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    def _delay(self, cost: float, now: float) -> float:
+        # seconds until `cost` tokens are available, ignoring the queue
+        return max(self.paused_until - now, 0.0) + max(cost - self.tokens, 0.0) / self.rate
+
+    def _ahead(self, prio: int) -> float:
+        return sum(c for p, _, c, f in self.waiters if p <= prio and not f.done())
+
+    async def acquire(self, cost: float = 1.0):
+        name = _priority.get()
+        prio = PRIORITIES.get(name, 0)
+        now = time.monotonic()
+        self._refill(now)
+        if not self.waiters and now >= self.paused_until and self.tokens >= cost:
+            self.tokens -= cost
+            SCHED_WAIT.observe(0.0, source=self.name, priority=name)
+            return
+        if prio == 0 and self._delay(self._ahead(prio) + cost, now) > self.max_wait:
+            # fail fast so the caller falls through to the next exchange
+            SCHED_EVENTS.inc(source=self.name, kind="rejected")
+            raise RateLimited(f"{self.name} rate limit")
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (prio, next(self._seq), cost, fut))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.ensure_future(self._pump())
+        try:
+            await fut
+        finally:
+            SCHED_WAIT.observe(time.monotonic() - now, source=self.name, priority=name)
+
+    async def _pump(self):
+        while self.waiters:
+            _, _, cost, fut = self.waiters[0]
+            if fut.done():   # caller cancelled
+                heapq.heappop(self.waiters)
+                continue
+            now = time.monotonic()
+            self._refill(now)
+            delay = self._delay(cost, now)
+            if delay > 0:
+                # re-check after sleeping: a higher priority request may have arrived
+                await asyncio.sleep(delay)
+                continue
+            heapq.heappop(self.waiters)
+            self.tokens -= cost
+            fut.set_result(None)
+
+    def pause(self, seconds: float):
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def feedback(self, status: int, headers):
+        if status in (418, 429):
+            SCHED_EVENTS.inc(source=self.name, kind="throttled")
+            try:
+                retry = float(headers.get("retry-after", ""))
+            except ValueError:
+                retry = self.burst / self.rate
+            self.pause(retry)
+            return
+        names = LIMIT_HEADERS.get(self.name)
+        if not names or names[0] not in headers:
+            return
+        try:
+            remaining = float(headers[names[0]])
+        except ValueError:
+            return
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, remaining)
+        if remaining < 1 and names[1] in headers:
+            try:
+                reset = float(headers[names[1]])
+            except ValueError:
+                return
+            reset = reset / 1000 if reset > 1e11 else reset
+            self.pause(min(max(reset - time.time(), 0.0), 60.0))
+            SCHED_EVENTS.inc(source=self.name, kind="exhausted")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._refill(now)
+        return {"tokens": round(self.tokens, 2), "rate": self.rate, "burst": self.burst,
+                "queued": sum(1 for *_, f in self.waiters if not f.done()),
+                "paused": round(max(self.paused_until - now, 0.0), 2)}
+
+limiters = {name: ExchangeLimiter(name, rate, burst) for name, (rate, burst) in EXCHANGE_RATE_LIMITS.items()}
+gauge("smc_sched_queued", "Exchange requests waiting for a rate-limit token.",
+      lambda: sum(s["queued"] for s in scheduler_stats().values()))
+
+def scheduler_stats() -> dict:
+    return {name: lim.stats() for name, lim in limiters.items()}
@@ -0,0 +1,269 @@
+import asyncio, logging, os, sqlite3, threading, time, uuid
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import numpy as np
+from candles import Candles
+from candle_store import RECORD
+from config import SHARED_CACHE_URL, SHARED_CACHE_TTL, SHARED_LOCK_TTL, SHARED_LOCK_WAIT
+from metrics import CACHE_EVENTS
+
+try:
+    import orjson
+    _dumps = lambda obj: orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is optional
+    import json
+    _dumps = lambda obj: json.dumps(obj, default=float).encode()
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# --------- Backends: versioned blobs with a TTL plus owner-tagged locks ---------
+# put() is one atomic compare-and-set: it stores the blob unless the key holds
+# an unexpired entry with a newer version.
+class SqliteBackend:
+    # One WAL-mode file shared by every worker on the host; put it on /dev/shm
+    # to keep it in RAM. Expired rows are ignored on read and pruned on write.
+    # sqlite3 blocks (up to the busy timeout while another worker writes), so
+    # every call runs in a thread, one at a time per connection.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+        self._mutex = threading.Lock()
+
+    def _db(self):
+        if self._conn is None or self._pid != os.getpid():   # never share a connection across fork
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=0.2, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, version INTEGER, value BLOB, expires REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, owner TEXT, expires REAL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _run(self, sql: str, args) -> int:
+        # rows changed; read while holding the mutex, like every cursor here
+        with self._mutex:
+            return self._db().execute(sql, args).rowcount
+
+    def _get(self, key: str):
+        with self._mutex:
+            row = self._db().execute("SELECT value FROM entries WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        return None if row is None else row[0]
+
+    async def get(self, key: str):
+        return await asyncio.to_thread(self._get, key)
+
+    def _put(self, key: str, version: int, value: bytes, ttl: float) -> bool:
+        now = time.time()
+        with self._mutex:
+            db = self._db()
+            cur = db.execute(
+                "INSERT INTO entries VALUES (?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET version = excluded.version, "
+                "value = excluded.value, expires = excluded.expires "
+                "WHERE entries.version <= excluded.version OR entries.expires <= ?", (key, version, value, now + ttl, now))
+            self._writes += 1
+            if self._writes % 500 == 0:
+                db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+                db.execute("DELETE FROM locks WHERE expires <= ?", (now,))
+            return cur.rowcount == 1
+
+    async def put(self, key: str, version: int, value: bytes, ttl: float) -> bool:
+        return await asyncio.to_thread(self._put, key, version, value, ttl)
+
+    async def lock(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        changed = await asyncio.to_thread(self._run,
+            "INSERT INTO locks VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, "
+            "expires = excluded.expires WHERE locks.expires <= ?", (key, owner, now + ttl, now))
+        return changed == 1
+
+    async def unlock(self, key: str, owner: str):
+        await asyncio.to_thread(self._run, "DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+# KEYS[1] = key, ARGV = version, blob (its first 8 bytes: the version, little-endian), ttl ms
+PUT_SCRIPT = """
+local cur = redis.call('GET', KEYS[1])
+if cur and #cur >= 8 then
+  local v = 0
+  for i = 8, 1, -1 do v = v * 256 + string.byte(cur, i) end
+  if v >= 2^63 then v = v - 2^64 end
+  if v > tonumber(ARGV[1]) then return 0 end
+end
+redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+return 1
+"""
+
+class RespBackend:
+    # Minimal Redis-protocol client (GET/SET/DEL/EVAL over one connection),
+    # enough for Redis itself or any local server that speaks RESP and Lua.
+
+    def __init__(self, host: str, port: int = 6379, db: int = 0, password: str = None):
+        self.host, self.port, self.db, self.password = host, port, db, password
+        self._streams = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), 2)
+        self._streams = (reader, writer)
+        if self.password:
+            await self._call("AUTH", self.password)
+        if self.db:
+            await self._call("SELECT", self.db)
+
+    async def _call(self, *args):
+        reader, writer = self._streams
+        parts = [b"*%d\r\n" % len(args)]
+        for a in args:
+            a = a if isinstance(a, bytes) else str(a).encode()
+            parts += [b"$%d\r\n" % len(a), a, b"\r\n"]
+        writer.write(b"".join(parts))
+        await writer.drain()
+        return await self._reply(reader)
+
+    async def _reply(self, reader):
+        line = (await reader.readline()).rstrip(b"\r\n")
+        if not line:
+            raise ConnectionError("resp connection closed")
+        kind, rest = line[:1], line[1:]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            return None if n < 0 else (await reader.readexactly(n + 2))[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [await self._reply(reader) for _ in range(n)]
+        raise RuntimeError(f"bad resp reply {line[:20]!r}")
+
+    async def command(self, *args):
+        async with self._lock:
+            try:
+                if self._streams is None:
+                    await self._connect()
+                return await asyncio.wait_for(self._call(*args), 2)
+            except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                self.close()
+                raise
+
+    async def get(self, key: str):
+        return await self.command("GET", key)
+
+    async def put(self, key: str, version: int, value: bytes, ttl: float) -> bool:
+        return await self.command("EVAL", PUT_SCRIPT, 1, key, version, value, int(ttl * 1000)) == 1
+
+    async def lock(self, key: str, owner: str, ttl: float) -> bool:
+        return await self.command("SET", "lock:" + key, owner, "NX", "PX", int(ttl * 1000)) == "OK"
+
+    async def unlock(self, key: str, owner: str):
+        # check-then-delete; the lock TTL covers the small race
+        if await self.command("GET", "lock:" + key) == owner.encode():
+            await self.command("DEL", "lock:" + key)
+
+    def close(self):
+        if self._streams is not None:
+            self._streams[1].close()
+            self._streams = None
+
+def open_backend(url: str):
+    # "sqlite:path/to/file.db" or "redis://[:password@]host[:port][/db]"
+    if url.startswith("sqlite:"):
+        return SqliteBackend(url[len("sqlite:"):].removeprefix("//"))
+    if url.startswith("redis://"):
+        u = urlparse(url)
+        return RespBackend(u.hostname or "localhost", u.port or 6379, int(u.path.strip("/") or 0), u.password)
+    raise ValueError(f"unsupported SHARED_CACHE_URL: {url}")
+
+# --------- Versioned entries + one refresher per key across workers ---------
+class SharedCache:
+    # Entries are an 8-byte version (last candle open, ms) plus a payload; a
+    # put never replaces a newer version. Backend errors count as misses so
+    # a broken cache only costs the recompute.
+
+    def __init__(self, backend, ttl: float = SHARED_CACHE_TTL, lock_ttl: float = SHARED_LOCK_TTL,
+                 lock_wait: float = SHARED_LOCK_WAIT):
+        self.backend = backend
+        self.ttl, self.lock_ttl, self.lock_wait = ttl, lock_ttl, lock_wait
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    async def get(self, key: str):
+        try:
+            blob = await self.backend.get(key)
+        except Exception as e:
+            logger.warning("shared cache get %s failed: %r", key, e)
+            blob = None
+        if blob is None:
+            return None
+        return int.from_bytes(blob[:8], "little", signed=True), blob[8:]
+
+    async def put(self, key: str, version: int, payload: bytes, ttl: float = None):
+        try:
+            await self.backend.put(key, version, version.to_bytes(8, "little", signed=True) + payload, ttl or self.ttl)
+        except Exception as e:
+            logger.warning("shared cache put %s failed: %r", key, e)
+
+    @asynccontextmanager
+    async def refreshing(self, key: str, cache: str):
+        # Yields True when this worker holds the refresh lock. Otherwise waits
+        # (up to lock_wait) for the holder to let go and yields False: re-read
+        # the entry, and compute it locally only if it is still missing.
+        owned = False
+        try:
+            owned = await self.backend.lock(key, self.owner, self.lock_ttl)
+            if not owned:
+                CACHE_EVENTS.inc(cache=cache, result="wait")
+                deadline = time.monotonic() + self.lock_wait
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    if await self.backend.lock(key, self.owner, self.lock_ttl):
+                        await self.backend.unlock(key, self.owner)
+                        break
+        except Exception as e:
+            logger.warning("shared cache lock %s failed: %r", key, e)
+        try:
+            yield owned
+        finally:
+            if owned:
+                try:
+                    await self.backend.unlock(key, self.owner)
+                except Exception as e:
+                    logger.warning("shared cache unlock %s failed: %r", key, e)
+
+shared_cache = SharedCache(open_backend(SHARED_CACHE_URL)) if SHARED_CACHE_URL else None
+
+# --------- Payload codecs ---------
+HEADER = np.dtype("<i8")
+
+def pack_candles(c: Candles, meta) -> bytes:
+    # meta: a few ints (fetched_at, depth, ...) stored ahead of the records
+    rec = np.empty(len(c), dtype=RECORD)
+    rec["time"] = c.time.view(np.int64)
+    for i, f in enumerate(RECORD.names[1:]):
+        rec[f] = c.ohlcv[i]
+    return np.array([len(meta), *meta], dtype=HEADER).tobytes() + rec.tobytes()
+
+def unpack_candles(payload: bytes):
+    k = int(np.frombuffer(payload, dtype=HEADER, count=1)[0])
+    meta = np.frombuffer(payload, dtype=HEADER, count=k + 1)[1:].tolist()
+    rec = np.frombuffer(payload, dtype=RECORD, offset=(k + 1) * HEADER.itemsize)
+    ohlcv = np.vstack([rec[f] for f in RECORD.names[1:]])
+    return Candles.from_columns(rec["time"], ohlcv, presorted=True), meta
+
+def pack_json(obj) -> bytes:
+    return _dumps(obj)
+
+def unpack_json(payload: bytes):
+    return _loads(payload)
@@ -0,0 +1,21 @@
+def ema_bias(ema: dict) -> str:
+    return "Alta" if ema["9"] > ema["21"] > ema["80"] else "Baixa" if ema["9"] < ema["21"] < ema["80"] else "Neutro"
+
+def suggest_signal(s: dict) -> dict:
+    # s: a pack_summary dict (only ema, supports, resistances and poc are read)
+    bias = ema_bias(s["ema"])
+    supports, resistances, poc = s["supports"], s["resistances"], s["poc"]
+    if bias == "Alta" and resistances:
+        entry = supports[0] if supports else poc
+        tps = resistances[:3]
+        sl = supports[1] if len(supports)>1 else supports[0]*0.99 if supports else poc*0.98
+    elif bias == "Baixa" and supports:
+        entry = resistances[0] if resistances else poc
+        tps = supports[:3]
+        sl = resistances[1] if len(resistances)>1 else resistances[0]*1.01 if resistances else poc*1.02
+    else:
+        entry = poc
+        tps = (resistances[:2] + supports[:1]) if resistances or supports else []
+        sl = poc*0.98
+    direction = "LONG" if bias in ("Alta","Neutro") else "SHORT"
+    return {"bias": bias, "direction": direction, "entry": entry, "tps": tps, "sl": sl}
@@ -1,13 +1,15 @@
 import pandas as pd
-from indicators import pack_summary, ob_zones
+from indicators import pack_summary, ob_zones, smc_structure
+from structure import nearest_zones
 from fibo import fib_levels, fib_extension
 
-def smc_analysis(df: pd.DataFrame):
-    summary = pack_summary(df)
+def smc_analysis(df: pd.DataFrame, state=None, include=None, profile=None):
+    summary = pack_summary(df, state=state, include=include, profile=profile)
     last = df.tail(150)
     high = float(last["high"].max())
     low = float(last["low"].min())
     retr = fib_levels(high, low)
     ext = fib_extension(high, low)
     zones = ob_zones(df)
-    return {"summary": summary, "fibonacci": {"retracement": retr, "extension": ext}, "ob_zones": zones}
+    nearest = nearest_zones(smc_structure(df), float(df["close"].iloc[-1]), len(df) - 1)
+    return {"summary": summary, "fibonacci": {"retracement": retr, "extension": ext}, "ob_zones": zones, "zones": nearest}
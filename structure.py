@@ -0,0 +1,93 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# zone status codes: FVG open/partial/filled, OB fresh/mitigated/broken
+OPEN, TOUCHED, DONE = 0, 1, 2
+STATUS = {"fvg": ("open", "partial", "filled"), "ob": ("fresh", "mitigated", "broken")}
+
+def _after(x: np.ndarray, ufunc, empty: float) -> np.ndarray:
+    # out[k] = extreme of x[k+1:] (empty past the last bar)
+    out = np.empty(len(x))
+    out[:-1] = ufunc.accumulate(x[::-1])[::-1][1:]
+    out[-1:] = empty
+    return out
+
+def structure_arrays(open_, high, low, close, ob_mult: float = 1.5, ob_window: int = 20) -> dict:
+    # One pass over the whole history; every zone is an element of the column
+    # arrays. FVG at bar i: low[i] > high[i-2] (bullish) or high[i] < low[i-2]
+    # (bearish). OB: the candle before a bar whose range beats ob_mult times
+    # the mean of the previous ob_window ranges; demand when it closed down.
+    # The forming bar never creates a zone but does mitigate them.
+    # Mitigation compares each zone with the extremes traded after it,
+    # read off suffix min/max arrays.
+    o, h = np.asarray(open_, dtype=float), np.asarray(high, dtype=float)
+    l, c = np.asarray(low, dtype=float), np.asarray(close, dtype=float)
+    n = len(c)
+    if n < 3:
+        empty = np.zeros(0)
+        cols = {"index": np.zeros(0, dtype=np.int64), "side": np.zeros(0, dtype=np.int8), "top": empty,
+                "bottom": empty, "status": np.zeros(0, dtype=np.int8)}
+        return {"fvg": dict(cols, reach=empty), "ob": dict(cols)}
+    low_after, high_after = _after(l, np.minimum, np.inf), _after(h, np.maximum, -np.inf)
+
+    # fair value gaps: bars 2..n-2
+    bull = l[2:-1] > h[:-3]
+    bear = h[2:-1] < l[:-3]
+    idx = np.flatnonzero(bull | bear) + 2
+    up = bull[idx - 2]
+    top = np.where(up, l[idx], l[idx - 2])
+    bottom = np.where(up, h[idx - 2], h[idx])
+    # deepest price traded back into the gap; the unfilled part is what remains
+    reach = np.where(up, low_after[idx], high_after[idx])
+    status = np.where(up, (reach < top).astype(np.int8) + (reach <= bottom),
+                      (reach > bottom).astype(np.int8) + (reach >= top))
+    fvg = {"index": idx, "side": np.where(up, 1, -1).astype(np.int8), "top": top, "bottom": bottom,
+           "status": status.astype(np.int8), "reach": reach}
+
+    # order blocks: displacement bar i in ob_window..n-2, zone candle i-1
+    rng = h - l
+    avg = sliding_window_view(rng[:-2], ob_window).mean(axis=1) if n - 2 >= ob_window else np.zeros(0)
+    i = np.arange(ob_window, ob_window + len(avg))
+    disp = i[(avg > 0) & (rng[i] > ob_mult * avg)]
+    j = disp - 1
+    demand = c[j] < o[j]
+    top, bottom = h[j], l[j]
+    close_min, close_max = _after(c, np.minimum, np.inf), _after(c, np.maximum, -np.inf)
+    touched = np.where(demand, low_after[disp] <= top, high_after[disp] >= bottom)
+    broken = np.where(demand, close_min[disp] < bottom, close_max[disp] > top)
+    ob = {"index": disp, "side": np.where(demand, 1, -1).astype(np.int8), "top": top, "bottom": bottom,
+          "status": np.where(broken, DONE, touched.astype(np.int8)).astype(np.int8)}
+    return {"fvg": fvg, "ob": ob}
+
+def structure_frame(df, **kw) -> dict:
+    return structure_arrays(df["open"], df["high"], df["low"], df["close"], **kw)
+
+def live_range(kind: str, z: dict):
+    # bottom/top still in play: the unfilled part of a FVG, the whole OB candle
+    if kind != "fvg":
+        return z["bottom"], z["top"]
+    up = z["side"] > 0
+    return (np.where(up, z["bottom"], np.maximum(z["bottom"], z["reach"])),
+            np.where(up, np.minimum(z["top"], z["reach"]), z["top"]))
+
+def zone_distance(bottom, top, price: float) -> np.ndarray:
+    # signed distance from price to the zone: >0 above, <0 below, 0 inside
+    return np.where(bottom > price, bottom - price, np.where(top < price, top - price, 0.0))
+
+NAMES = {"fvg": ("bearish", "bullish"), "ob": ("supply", "demand")}
+
+def nearest_zones(struct: dict, price: float, last: int, n: int = 2) -> dict:
+    # the n zones of each kind closest to price that are still unmitigated
+    # (FVG not filled, OB never revisited); last is the index of the last bar
+    out = {}
+    for kind, z in struct.items():
+        live = np.flatnonzero(z["status"] < (DONE if kind == "fvg" else TOUCHED))
+        bottom, top = live_range(kind, z)
+        dist = zone_distance(bottom[live], top[live], price)
+        order = np.argsort(np.abs(dist), kind="stable")[:n]
+        out[kind] = [{
+            "type": NAMES[kind][z["side"][k] > 0], "index": int(z["index"][k]), "bars_ago": int(last - z["index"][k]),
+            "bottom": float(bottom[k]), "top": float(top[k]), "status": STATUS[kind][z["status"][k]],
+            "distance": float(d), "distance_pct": float(d / price * 100) if price else 0.0,
+        } for k, d in zip(live[order], dist[order])]
+    return out
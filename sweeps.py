@@ -0,0 +1,317 @@
+import asyncio, itertools, math
+from collections import OrderedDict
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from config import SWEEP_MAX_SETTINGS, SWEEP_CACHE_SIZE
+from indicators import EXTRAS
+from workers import run_cpu
+
+# --------- Parameters: on=rsi:14,macd:12,26,9,supertrend:7-14,2|3 ---------
+DEFAULTS = {"rsi": (9,), "macd": (6, 13, 4), "stochrsi": (8, 5, 5, 3), "kdj": (5, 3, 3),
+            "atr": (14,), "supertrend": (10, 3.0), "psar": (0.02, 0.2)}
+TYPES = {"rsi": (int,), "macd": (int, int, int), "stochrsi": (int, int, int, int), "kdj": (int, int, int),
+         "atr": (int,), "supertrend": (int, float), "psar": (float, float)}
+PREFIX = {"rsi": "rsi", "atr": "atr", "macd": "macd_", "stochrsi": "stoch_rsi_", "kdj": "kdj_",
+          "supertrend": "supertrend_", "psar": "psar_"}
+MAX_PERIOD = 1000
+
+def _fmt(x) -> str:
+    return str(int(x)) if float(x).is_integer() else repr(float(x))
+
+def extras_key(name: str, params) -> str:
+    # same keys as summary["extras"]: rsi9, macd_6_13_4, ... (defaults keep theirs)
+    if tuple(params) == DEFAULTS[name]:
+        return EXTRAS[name]
+    return PREFIX[name] + "_".join(_fmt(x) for x in params)
+
+def label(params) -> str:
+    return ",".join(_fmt(x) for x in params)
+
+def _values(spec: str, kind):
+    # "14", "9|14|21", "5-50" or "2-4/0.5"
+    out = []
+    for part in spec.split("|"):
+        rng, _, step = part.partition("/")
+        lo, sep, hi = rng.partition("-") if not rng.startswith("-") else (rng, "", "")
+        try:
+            lo, hi, step = float(lo), (float(hi) if sep else None), (float(step) if step else 1.0)
+        except ValueError:
+            raise ValueError(f"Parâmetro inválido: {spec}")
+        if not all(map(math.isfinite, (lo, hi or 0.0, step))):
+            raise ValueError(f"Parâmetro inválido: {spec}")
+        if not sep:
+            out.append(lo)
+            continue
+        if step <= 0 or hi < lo:   # a reversed range would sweep nothing
+            raise ValueError(f"Parâmetro inválido: {spec}")
+        # count before np.arange, which would happily allocate billions of values
+        if not len(out) + (hi - lo) / step < SWEEP_MAX_SETTINGS:
+            raise ValueError(f"Máximo de {SWEEP_MAX_SETTINGS} combinações por indicador.")
+        out += np.round(np.arange(lo, hi + step / 2, step), 10).tolist()
+    if not out:
+        raise ValueError(f"Parâmetro inválido: {spec}")
+    if len(out) > SWEEP_MAX_SETTINGS:
+        raise ValueError(f"Máximo de {SWEEP_MAX_SETTINGS} combinações por indicador.")
+    for v in out:
+        if not (v > 0 and (kind is float or (v.is_integer() and v <= MAX_PERIOD))):
+            raise ValueError(f"Parâmetro inválido: {spec}")
+    return [kind(v) for v in out]
+
+def parse_on(value: str):
+    # "rsi:14,macd:12,26,9,atr" -> ({"rsi", "macd", "atr"}, {"rsi": [(14,)], "macd": [(12, 26, 9)]});
+    # numeric tokens continue the previous indicator's parameters
+    names, raw = [], []
+    for tok in (t.strip().lower() for t in value.split(",")):
+        if not tok:
+            continue
+        if tok[0].isalpha():
+            name, _, first = tok.partition(":")
+            names.append(name)
+            raw.append([first] if first else [])
+        elif raw:
+            raw[-1].append(tok)
+    shown, params = set(), {}
+    for name, specs in zip(names, raw):
+        if name not in EXTRAS:
+            continue
+        shown.add(name)
+        if not specs:
+            continue
+        if name not in TYPES or len(specs) != len(TYPES[name]):
+            raise ValueError(f"{name} espera {len(TYPES.get(name, ()))} parâmetro(s)")
+        values = [_values(s, kind) for s, kind in zip(specs, TYPES[name])]
+        if math.prod(len(v) for v in values) > SWEEP_MAX_SETTINGS:
+            raise ValueError(f"Máximo de {SWEEP_MAX_SETTINGS} combinações por indicador.")
+        grid = itertools.product(*values)
+        sets = params.setdefault(name, [])
+        sets += [p for p in grid if p not in sets]
+        if len(sets) > SWEEP_MAX_SETTINGS:
+            raise ValueError(f"Máximo de {SWEEP_MAX_SETTINGS} combinações por indicador.")
+    return shown, params
+
+def params_key(params) -> tuple:
+    return tuple(sorted((name, tuple(sets)) for name, sets in (params or {}).items()))
+
+# --------- Row-batched kernels: one row per parameter set ---------
+def ewm_rows(x: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    # pandas ewm(alpha=..., adjust=False).mean() on every row at once, NaNs
+    # included (a row starts at its first value and carries through gaps)
+    x = np.asarray(x, dtype=float)
+    alpha = np.asarray(alpha, dtype=float)
+    factor = 1.0 - alpha
+    out = np.empty_like(x)
+    w = x[:, 0].copy()
+    old_wt = np.ones(len(x))
+    out[:, 0] = w
+    if not np.isnan(x).any():
+        # no gaps: the weight is reset to 1 every bar
+        denom = factor + alpha
+        for t in range(1, x.shape[1]):
+            xt = x[:, t]
+            w = np.where(w != xt, (factor * w + alpha * xt) / denom, w)
+            out[:, t] = w
+        return out
+    for t in range(1, x.shape[1]):
+        xt = x[:, t]
+        valid, obs = w == w, xt == xt
+        old_wt = np.where(valid, old_wt * factor, old_wt)
+        with np.errstate(invalid="ignore"):
+            mixed = (old_wt * w + alpha * xt) / (old_wt + alpha)
+        w = np.where(valid & obs & (w != xt), mixed, np.where(~valid & obs, xt, w))
+        old_wt = np.where(valid & obs, 1.0, old_wt)
+        out[:, t] = w
+    return out
+
+def rsi_rows(close: np.ndarray, periods) -> np.ndarray:
+    periods, inverse = np.unique(np.asarray(periods, dtype=float), return_inverse=True)
+    delta = np.diff(close, prepend=np.nan)
+    gain = np.where(delta > 0, delta, 0.0)
+    loss = np.where(delta < 0, -delta, 0.0)
+    k = len(periods)
+    avg = ewm_rows(np.vstack([np.broadcast_to(gain, (k, len(close))), np.broadcast_to(loss, (k, len(close)))]),
+                   np.r_[1 / periods, 1 / periods])
+    g, l = avg[:k], avg[k:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = g / np.where(l == 0, np.nan, l)
+        out = 100 - 100 / (1 + rs)
+    return np.where(np.isnan(out), 50.0, out)[inverse]
+
+def true_range_1d(high, low, close) -> np.ndarray:
+    tr = high - low
+    tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(high[1:] - close[:-1]), np.abs(low[1:] - close[:-1])))
+    return tr
+
+def atr_rows(high, low, close, periods) -> np.ndarray:
+    periods, inverse = np.unique(np.asarray(periods, dtype=float), return_inverse=True)
+    tr = true_range_1d(high, low, close)
+    return ewm_rows(np.broadcast_to(tr, (len(periods), len(tr))), 2 / (periods + 1))[inverse]
+
+def _rolling_last(x: np.ndarray, windows, reduce, count: int) -> np.ndarray:
+    # reduce over a trailing window, evaluated at the last `count` bars of each
+    # row (NaN where the window is incomplete); rows grouped by window size
+    rows, n = x.shape
+    out = np.full((rows, count), np.nan)
+    windows = np.asarray(windows)
+    for w in np.unique(windows):
+        sel = np.flatnonzero(windows == w)
+        if n < w:
+            continue
+        tail = x[sel, max(0, n - count - w + 1):]
+        vals = reduce(sliding_window_view(tail, int(w), axis=1), axis=2)
+        out[sel, count - vals.shape[1]:] = vals
+    return out
+
+def sweep_rsi(df, sets):
+    r = rsi_rows(df["close"], [p[0] for p in sets])
+    return [float(v) for v in r[:, -1]]
+
+def sweep_macd(df, sets):
+    close = df["close"]
+    p = np.asarray(sets, dtype=float)
+    spans, inverse = np.unique(p[:, :2], return_inverse=True)
+    ema = ewm_rows(np.broadcast_to(close, (len(spans), len(close))), 2 / (spans + 1))
+    inverse = inverse.reshape(-1, 2)
+    line = ema[inverse[:, 0]] - ema[inverse[:, 1]]
+    signal = ewm_rows(line, 2 / (p[:, 2] + 1))[:, -1]
+    return [{"macd": float(m), "signal": float(s), "hist": float(m - s)} for m, s in zip(line[:, -1], signal)]
+
+def sweep_stochrsi(df, sets):
+    p = np.asarray(sets, dtype=int)
+    r = rsi_rows(df["close"], p[:, 0])
+    span = min(int((p[:, 2] + p[:, 3]).max()), r.shape[1])
+    lo = _rolling_last(r, p[:, 1], np.min, span)
+    hi = _rolling_last(r, p[:, 1], np.max, span)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stoch = (r[:, -span:] - lo) / (hi - lo)
+    k_line = _rolling_last(stoch, p[:, 2], np.mean, span)
+    d_last = _rolling_last(k_line, p[:, 3], np.mean, 1)[:, 0]
+    fill = lambda v: 50.0 if v != v else float(v)
+    return [{"raw": fill(s * 100), "k": fill(k * 100), "d": fill(d * 100)}
+            for s, k, d in zip(stoch[:, -1], k_line[:, -1], d_last)]
+
+def sweep_kdj(df, sets):
+    p = np.asarray(sets, dtype=int)
+    high, low, close = df["high"], df["low"], df["close"]
+    n = len(close)
+    ll = _rolling_last(np.broadcast_to(low, (len(p), n)), p[:, 0], np.min, n)
+    hh = _rolling_last(np.broadcast_to(high, (len(p), n)), p[:, 0], np.max, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsv = (close - ll) / (hh - ll) * 100
+    k_line = ewm_rows(rsv, 1 / p[:, 1])
+    d_line = ewm_rows(k_line, 1 / p[:, 2])
+    fill = lambda v: 50.0 if v != v else float(v)
+    return [{"k": fill(k), "d": fill(d), "j": fill(3 * k - 2 * d)} for k, d in zip(k_line[:, -1], d_line[:, -1])]
+
+def sweep_atr(df, sets):
+    a = atr_rows(df["high"], df["low"], df["close"], [p[0] for p in sets])
+    return [float(v) for v in a[:, -1]]
+
+def sweep_supertrend(df, sets):
+    high, low, close = df["high"], df["low"], df["close"]
+    mult = np.array([p[1] for p in sets], dtype=float)[:, None]
+    atr = atr_rows(high, low, close, [p[0] for p in sets])
+    hl2 = (high + low) / 2.0
+    upper, lower = hl2 + mult * atr, hl2 - mult * atr
+    prev_upper, prev_lower = upper[:, 0].copy(), lower[:, 0].copy()
+    st = lower[:, 0].copy()
+    for t in range(1, len(close)):
+        cur_upper = np.where(close[t-1] > prev_upper, np.minimum(upper[:, t], prev_upper), upper[:, t])
+        cur_lower = np.where(close[t-1] < prev_lower, np.maximum(lower[:, t], prev_lower), lower[:, t])
+        st = np.where(st == prev_upper,
+                      np.where(close[t] <= cur_upper, cur_upper, cur_lower),
+                      np.where(close[t] >= cur_lower, cur_lower, cur_upper))
+        prev_upper, prev_lower = cur_upper, cur_lower
+    return [{"line": float(v), "dir": "UP" if close[-1] >= v else "DOWN"} for v in st]
+
+def sweep_psar(df, sets):
+    high, low = df["high"], df["low"]
+    if len(high) < 2:
+        return [float(df["close"][-1])] * len(sets)
+    p = np.asarray(sets, dtype=float)
+    step, max_step = p[:, 0], p[:, 1]
+    bull = np.ones(len(p), dtype=bool)
+    af = step.copy()
+    ep = np.full(len(p), high[0])
+    sar = np.full(len(p), low[0])
+    for i in range(1, len(high)):
+        sar = sar + af * (ep - sar)
+        h, l = high[i], low[i]
+        sar = np.where(bull, np.minimum(sar, min(low[i-1], l)), np.maximum(sar, max(high[i-1], h)))
+        extend = np.where(bull, h > ep, l < ep)
+        ep = np.where(extend, np.where(bull, h, l), ep)
+        af = np.where(extend, np.minimum(af + step, max_step), af)
+        flip = np.where(bull, l < sar, h > sar)
+        sar = np.where(flip, ep, sar)
+        ep = np.where(flip, np.where(bull, l, h), ep)
+        af = np.where(flip, step, af)
+        bull = bull ^ flip
+    return [float(v) for v in sar]
+
+SWEEPS = {"rsi": sweep_rsi, "macd": sweep_macd, "stochrsi": sweep_stochrsi, "kdj": sweep_kdj,
+          "atr": sweep_atr, "supertrend": sweep_supertrend, "psar": sweep_psar}
+
+def compute_sweeps(df, specs: dict) -> dict:
+    # specs: {name: [params, ...]} -> {(name, params): value}; one pass per indicator
+    cols = {k: df[k].to_numpy(dtype=float) for k in ("high", "low", "close")}
+    out = {}
+    for name, sets in specs.items():
+        sets = list(sets)
+        if sets:
+            out.update(zip(((name, p) for p in sets), SWEEPS[name](cols, sets)))
+    return out
+
+# --------- Cache per (candle version, indicator, params) + cross-request batching ---------
+class SweepCache:
+    # Requests for the same candles that arrive together (one user's grid or
+    # several users at once) are merged into one sweep per indicator.
+
+    def __init__(self, max_entries: int = SWEEP_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.pending = {}     # version -> (specs, future)
+
+    def _get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value):
+        self.entries[key] = value
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def extras(self, version, df, params: dict) -> dict:
+        # {extras_key: value} for every requested setting
+        found, missing = {}, {}
+        for name, sets in params.items():
+            for p in sets:
+                value = self._get((version, name, p))
+                if value is None:
+                    missing.setdefault(name, set()).add(p)
+                else:
+                    found[(name, p)] = value
+        if missing:
+            batch = self.pending.get(version)
+            if batch is None:
+                batch = self.pending[version] = ({}, asyncio.get_running_loop().create_future())
+                asyncio.ensure_future(self._flush(version, df))
+            for name, sets in missing.items():
+                batch[0].setdefault(name, set()).update(sets)
+            computed = await asyncio.shield(batch[1])
+            found.update({(name, p): computed[(name, p)] for name, sets in missing.items() for p in sets})
+        return {extras_key(name, p): found[(name, p)] for name, sets in params.items() for p in sets}
+
+    async def _flush(self, version, df):
+        await asyncio.sleep(0)   # let requests of the same tick join
+        specs, fut = self.pending.pop(version)
+        try:
+            result = await run_cpu(compute_sweeps, df, {k: sorted(v) for k, v in specs.items()})
+        except Exception as e:
+            fut.set_exception(e)
+            return
+        for (name, p), value in result.items():
+            self._put((version, name, p), value)
+        fut.set_result(result)
+
+sweep_cache = SweepCache()
@@ -0,0 +1,41 @@
+import pytest
+from bench import synthetic_ohlcv
+from indicators import pack_summary
+from indicator_state import IndicatorState
+
+SECTIONS = ("ema", "volume_vs_ma21", "extras")
+
+def _flat(value, path=""):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield from _flat(v, f"{path}.{k}")
+    else:
+        yield path, value
+
+def _assert_same(state, df):
+    want = pack_summary(df)
+    got = pack_summary(df, state=state)
+    for section in SECTIONS:
+        a, b = dict(_flat(got[section])), dict(_flat(want[section]))
+        assert a.keys() == b.keys(), section
+        for key, v in b.items():
+            if isinstance(v, float):
+                assert a[key] == pytest.approx(v, rel=1e-9, nan_ok=True), section + key
+            else:
+                assert a[key] == v, section + key
+
+def test_sliding_window_matches_pack_summary():
+    full = synthetic_ohlcv(700)
+    state = IndicatorState.from_frame(full.iloc[:500])
+    for k in range(1, 40):
+        window = full.iloc[k:500 + k].reset_index(drop=True)
+        state.sync(window)
+    _assert_same(state, window)
+
+def test_forming_bar_revision_matches_pack_summary():
+    df = synthetic_ohlcv(500)
+    state = IndicatorState.from_frame(df)
+    revised = df.copy()
+    revised.loc[revised.index[-1], ["high", "close"]] += 5.0
+    state.sync(revised)
+    _assert_same(state, revised)
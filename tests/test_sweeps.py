@@ -0,0 +1,12 @@
+import pytest
+from sweeps import parse_on
+
+def test_ranges_expand():
+    shown, params = parse_on("rsi:10-14/2,atr")
+    assert shown == {"rsi", "atr"}
+    assert params == {"rsi": [(10,), (12,), (14,)]}
+
+@pytest.mark.parametrize("on", ["rsi:20-10", "rsi:14|20-10", "supertrend:10,3-2", "rsi:10-14/0"])
+def test_reversed_or_empty_ranges_are_rejected(on):
+    with pytest.raises(ValueError, match="Parâmetro inválido"):
+        parse_on(on)
@@ -0,0 +1,213 @@
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from config import VP_BIN_PCT, VP_VALUE_AREA
+
+DAY_NS = 86_400 * 10**9
+MAX_PROFILES = 256
+MAX_BINS = 50_000
+
+def nice_step(price: float, pct: float = VP_BIN_PCT) -> float:
+    # bin width ~pct% of price, rounded to 1/2/5 x 10^k so the grid stays put
+    raw = abs(float(price)) * pct / 100
+    if not np.isfinite(raw) or raw <= 0:
+        return 1.0
+    exp = 10.0 ** np.floor(np.log10(raw))
+    return float(next(m * exp for m in (1, 2, 5, 10) if raw <= m * exp))
+
+def spread_volume(low, high, volume, step: float):
+    # Spread each candle's volume uniformly over its low-high range on a grid
+    # of `step`-wide bins (bin k covers [k*step, (k+1)*step)). Partial end bins
+    # get their overlap, the bins in between come from one difference array.
+    # Returns (origin, bins) with bins[0] being grid bin `origin`.
+    low, high = np.asarray(low, dtype=float), np.asarray(high, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+    lo = np.floor(low / step).astype(np.int64)
+    hi = np.maximum(np.floor(high / step).astype(np.int64), lo)
+    origin = int(lo.min())
+    size = int(hi.max()) - origin + 1
+    a, b = lo - origin, hi - origin
+    span = high - low
+    single = (a == b) | (span <= 0)
+    bins = np.zeros(size)
+    bins += np.bincount(a[single], weights=volume[single], minlength=size)
+    m = ~single
+    if m.any():
+        density = volume[m] / span[m]
+        am, bm = a[m], b[m]
+        first = np.clip((lo[m] + 1) * step - low[m], 0, None) * density
+        last = np.clip(high[m] - hi[m] * step, 0, None) * density
+        full = density * step
+        bins += np.bincount(am, weights=first, minlength=size) + np.bincount(bm, weights=last, minlength=size)
+        diff = np.bincount(am + 1, weights=full, minlength=size + 1) - np.bincount(bm, weights=full, minlength=size + 1)
+        bins += np.cumsum(diff)[:size]
+    return origin, bins
+
+class VolumeProfile:
+    def __init__(self, step: float):
+        self.step = step
+        self.origin = 0
+        self.bins = np.zeros(0)
+
+    def copy(self):
+        other = VolumeProfile(self.step)
+        other.origin, other.bins = self.origin, self.bins.copy()
+        return other
+
+    def add(self, low, high, volume, sign: float = 1.0):
+        if not np.size(low):
+            return self
+        origin, bins = spread_volume(low, high, sign * np.asarray(volume, dtype=float), self.step)
+        if not len(self.bins):
+            self.origin, self.bins = origin, bins
+            return self
+        start = min(self.origin, origin)
+        end = max(self.origin + len(self.bins), origin + len(bins))
+        if start != self.origin or end != self.origin + len(self.bins):
+            grown = np.zeros(end - start)
+            grown[self.origin - start:self.origin - start + len(self.bins)] = self.bins
+            self.origin, self.bins = start, grown
+        self.bins[origin - self.origin:origin - self.origin + len(bins)] += bins
+        return self
+
+    def levels(self, value_area: float = VP_VALUE_AREA, nodes: int = 3):
+        b = self.bins
+        if not len(b):
+            return None
+        b = np.where(b > b.max() * 1e-9, b, 0.0)   # drop residue left by subtractions
+        nz = np.flatnonzero(b)
+        if not len(nz):
+            return None
+        b = b[nz[0]:nz[-1] + 1]
+        base = self.origin + int(nz[0])
+        poc = int(b.argmax())
+        lo = hi = poc
+        acc, target, last = b[poc], value_area * b.sum(), len(b) - 1
+        while acc < target and (lo > 0 or hi < last):
+            down = b[lo - 1] if lo > 0 else -1.0
+            up = b[hi + 1] if hi < last else -1.0
+            if up >= down:
+                hi += 1; acc += up
+            else:
+                lo -= 1; acc += down
+        hvn, lvn = _nodes(b, nodes)
+        center = lambda k: round((base + k + 0.5) * self.step, 10)
+        return {
+            "poc": center(poc), "vah": round((base + hi + 1) * self.step, 10), "val": round((base + lo) * self.step, 10),
+            "hvn": [center(k) for k in hvn], "lvn": [center(k) for k in lvn],
+            "step": self.step, "volume": float(b.sum()),
+        }
+
+def _nodes(b: np.ndarray, n: int):
+    # peaks/troughs of the profile smoothed over ~2% of its bins
+    w = max(1, len(b) // 50)
+    s = np.convolve(b, np.ones(2 * w + 1) / (2 * w + 1), mode="same")
+    if len(s) < 3:
+        return [], []
+    mid = s[1:-1]
+    peaks = np.flatnonzero((mid > s[:-2]) & (mid >= s[2:])) + 1
+    troughs = np.flatnonzero((mid < s[:-2]) & (mid <= s[2:])) + 1
+    hvn = sorted(peaks[np.argsort(-s[peaks], kind="stable")[:n]].tolist())
+    lvn = sorted(troughs[np.argsort(s[troughs], kind="stable")[:n]].tolist())
+    return hvn, lvn
+
+def _times(df) -> np.ndarray:
+    col = df["time"]
+    return np.asarray(getattr(col, "values", col)).astype("datetime64[ns]").view("i8")
+
+def volume_profile(df, step: float = None, start=None, end=None, session: bool = False,
+                   value_area: float = VP_VALUE_AREA, nodes: int = 3):
+    # Fixed range: bars with start <= time <= end (anything pandas.Timestamp
+    # accepts). session=True: bars of the last bar's UTC day.
+    n = len(df)
+    if not n:
+        return None
+    low, high = np.asarray(df["low"], dtype=float), np.asarray(df["high"], dtype=float)
+    vol = np.asarray(df["volume"], dtype=float)
+    mask = slice(None)
+    if session or start is not None or end is not None:
+        t = _times(df)
+        lo_t = t[-1] // DAY_NS * DAY_NS if session else (_ns(start) if start is not None else t[0])
+        hi_t = _ns(end) if end is not None else t[-1]
+        mask = (t >= lo_t) & (t <= hi_t)
+        if not mask.any():
+            return None
+    step = step or nice_step(np.asarray(df["close"], dtype=float)[-1])
+    return VolumeProfile(step).add(low[mask], high[mask], vol[mask]).levels(value_area, nodes)
+
+def session_profile(df, **kw):
+    # profile of the last bar's UTC day; None on daily or longer bars
+    t = _times(df)
+    if len(t) < 2 or t[-1] - t[-2] >= DAY_NS:
+        return None
+    return volume_profile(df, session=True, **kw)
+
+def _ns(ts) -> int:
+    ts = pd.Timestamp(ts)
+    return (ts.tz_localize("UTC") if ts.tzinfo is None else ts).value
+
+def split_levels(levels: dict, price: float, n: int = 3):
+    # profile levels as (price, tag) on each side of `price`, nearest first
+    if not levels:
+        return [], []
+    tagged = [(levels["val"], "VAL"), (levels["vah"], "VAH"), (levels["poc"], "POC")]
+    tagged += [(x, "HVN") for x in levels["hvn"]]
+    below = sorted((x for x in tagged if x[0] <= price), key=lambda x: -x[0])[:n]
+    above = sorted((x for x in tagged if x[0] > price), key=lambda x: x[0])[:n]
+    return below, above
+
+# --------- Incremental profile per (source, symbol, timeframe) ---------
+class ProfileState:
+    # Mirrors a rolling candle window: bars that leave the window are
+    # subtracted, new bars added and the forming bar replaced, so a new
+    # candle costs O(its bins) instead of a rebuild.
+
+    def __init__(self):
+        self.profile = None
+        self.times = self.low = self.high = self.vol = None
+
+    def seed(self, df):
+        close = np.asarray(df["close"], dtype=float)
+        self.profile = VolumeProfile(nice_step(close[-1]))
+        self.times = _times(df)
+        self.low, self.high = np.asarray(df["low"], dtype=float), np.asarray(df["high"], dtype=float)
+        self.vol = np.asarray(df["volume"], dtype=float)
+        self.profile.add(self.low, self.high, self.vol)
+        return self
+
+    def sync(self, df):
+        if not len(df):
+            return self
+        t = _times(df)
+        if self.profile is None or t[0] < self.times[0] or t[-1] < self.times[-1]:
+            return self.seed(df)
+        pos = int(np.searchsorted(t, self.times[-1]))
+        if pos >= len(t) or t[pos] != self.times[-1]:
+            return self.seed(df)
+        drop = np.searchsorted(self.times, t[0])
+        if len(self.times) - 1 - drop != pos:
+            return self.seed(df)   # the windows do not line up bar for bar
+        close = np.asarray(df["close"], dtype=float)[-1]
+        if len(self.profile.bins) > MAX_BINS or not 0.25 <= nice_step(close) / self.profile.step <= 4:
+            return self.seed(df)
+        low, high = np.asarray(df["low"], dtype=float), np.asarray(df["high"], dtype=float)
+        vol = np.asarray(df["volume"], dtype=float)
+        # leaving bars and the old forming bar out, forming and new bars in
+        out = np.r_[np.arange(drop), len(self.times) - 1]
+        self.profile.add(self.low[out], self.high[out], self.vol[out], sign=-1.0)
+        self.profile.add(low[pos:], high[pos:], vol[pos:])
+        self.times, self.low, self.high, self.vol = t, low, high, vol
+        return self
+
+    def levels(self, value_area: float = VP_VALUE_AREA, nodes: int = 3):
+        return None if self.profile is None else self.profile.levels(value_area, nodes)
+
+_profiles = OrderedDict()
+
+def profile_state(key, df) -> ProfileState:
+    state = _profiles.pop(key, None) or ProfileState()
+    state.sync(df)
+    _profiles[key] = state
+    while len(_profiles) > MAX_PROFILES:
+        _profiles.popitem(last=False)
+    return state
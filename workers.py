@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context, shared_memory
+import numpy as np
+import pandas as pd
+from config import ANALYSIS_EXECUTOR, ANALYSIS_WORKERS
+from smc import smc_analysis
+
+COLUMNS = ("open", "high", "low", "close", "volume")
+
+_pool = None
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        if ANALYSIS_EXECUTOR == "process":
+            _pool = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, mp_context=get_context("spawn"))
+        else:
+            _pool = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+# --------- Candles through shared memory (row 0: time ns as int64, then OHLCV) ---------
+def share_frame(df: pd.DataFrame) -> shared_memory.SharedMemory:
+    n = len(df)
+    shm = shared_memory.SharedMemory(create=True, size=max(8, 8 * n * (1 + len(COLUMNS))))
+    buf = np.ndarray((1 + len(COLUMNS), n), dtype=np.float64, buffer=shm.buf)
+    buf[0].view(np.int64)[:] = df["time"].values.astype("datetime64[ns]").view("i8")
+    for i, col in enumerate(COLUMNS, 1):
+        buf[i] = df[col].to_numpy(dtype=float)
+    del buf
+    return shm
+
+def frame_from_shared(name: str, n: int) -> pd.DataFrame:
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        buf = np.ndarray((1 + len(COLUMNS), n), dtype=np.float64, buffer=shm.buf)
+        data = {"time": pd.to_datetime(buf[0].view(np.int64).copy(), unit="ns", utc=True)}
+        for i, col in enumerate(COLUMNS, 1):
+            data[col] = buf[i].copy()
+        del buf
+    finally:
+        shm.close()
+    return pd.DataFrame(data)
+
+class _Snapshot:
+    # stands in for an IndicatorState on the worker side
+    def __init__(self, summary: dict):
+        self._summary = summary
+
+    def summary(self):
+        return self._summary
+
+def _analysis_job(name: str, n: int, summary, include, profile):
+    df = frame_from_shared(name, n)
+    return smc_analysis(df, state=None if summary is None else _Snapshot(summary), include=include, profile=profile)
+
+async def run_analysis(df: pd.DataFrame, state=None, include=None, profile=None) -> dict:
+    if ANALYSIS_EXECUTOR == "inline":
+        return smc_analysis(df, state=state, include=include, profile=profile)
+    loop = asyncio.get_running_loop()
+    if ANALYSIS_EXECUTOR != "process":
+        return await loop.run_in_executor(get_pool(), smc_analysis, df, state, include, profile)
+    shm = share_frame(df)
+    try:
+        summary = None if state is None else state.summary()
+        return await loop.run_in_executor(get_pool(), _analysis_job, shm.name, len(df), summary, include, profile)
+    finally:
+        shm.close()
+        shm.unlink()
+
+async def run_cpu(fn, *args):
+    # any picklable module-level function, on the same pool as the analyses
+    if ANALYSIS_EXECUTOR == "inline":
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(get_pool(), fn, *args)